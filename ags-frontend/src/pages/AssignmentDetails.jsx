@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Link, useParams } from 'react-router-dom';
-import { FileText, ArrowLeft, Eye, Upload, Calendar, Book, Clock, CheckCircle, AlertTriangle, Users, Cpu, Star, MessageCircle, Filter } from 'lucide-react';
+import { FileText, ArrowLeft, Eye, Upload, Calendar, Book, Clock, CheckCircle, AlertTriangle, Users, Cpu, Star, MessageCircle, Filter, RefreshCw } from 'lucide-react';
 import axios from 'axios';
 import { useAuth } from '../contexts/AuthContext';
 import Alert from '../components/Alert';
@@ -21,11 +21,76 @@ function AssignmentDetails() {
   const [selectedSubmission, setSelectedSubmission] = useState(null);
   const [selectedFeedback, setSelectedFeedback] = useState(null);
   const [submissionFilter, setSubmissionFilter] = useState('all');
+  const [regradeProgress, setRegradeProgress] = useState(null);
+  const [streamedFeedback, setStreamedFeedback] = useState('');
 
   useEffect(() => {
     fetchAssignmentDetails();
   }, [assignmentId]);
 
+  // Grading runs in the background; poll until the student's submission is graded
+  const isGrading = ['pending', 'running'].includes(submission?.grading_status) &&
+    Boolean(assignment?.answer_text || assignment?.instructions_text);
+
+  useEffect(() => {
+    if (!isGrading) return;
+    const interval = setInterval(fetchAssignmentDetails, 5000);
+    return () => clearInterval(interval);
+  }, [isGrading, assignmentId]);
+
+  // Stream the feedback as it is generated; polling above remains the fallback
+  useEffect(() => {
+    if (!isGrading || !submission?.id || !window.EventSource) return;
+    setStreamedFeedback('');
+    const source = new EventSource(
+      `${axios.defaults.baseURL}/api/submissions/${submission.id}/grading-stream`,
+      { withCredentials: true }
+    );
+    source.addEventListener('feedback', (event) => {
+      const { text } = JSON.parse(event.data);
+      setStreamedFeedback(previous => previous + text);
+    });
+    source.addEventListener('done', () => {
+      source.close();
+      fetchAssignmentDetails();
+    });
+    source.onerror = () => source.close();
+    return () => source.close();
+  }, [isGrading, submission?.id]);
+
+  // Bulk regrade runs in the background; poll its progress and refresh the table when done
+  const isRegrading = regradeProgress?.status === 'running';
+
+  useEffect(() => {
+    if (!isRegrading) return;
+    const interval = setInterval(async () => {
+      try {
+        const response = await axios.get(`/api/assignments/${assignmentId}/regrade`);
+        setRegradeProgress(response.data.progress);
+        if (response.data.progress.status !== 'running') {
+          await fetchAssignmentDetails();
+        }
+      } catch (error) {
+        console.error('Error fetching regrade progress:', error);
+      }
+    }, 2000);
+    return () => clearInterval(interval);
+  }, [isRegrading, assignmentId]);
+
+  const handleRegrade = async () => {
+    if (!window.confirm('Regrade every submission with the current answer key?')) return;
+    setError('');
+    try {
+      const response = await axios.post(`/api/assignments/${assignmentId}/regrade`);
+      setRegradeProgress(response.data.progress);
+    } catch (error) {
+      setError(error.response?.data?.error || 'Failed to start regrading');
+      if (error.response?.data?.progress) {
+        setRegradeProgress(error.response.data.progress);
+      }
+    }
+  };
+
   const fetchAssignmentDetails = async () => {
     try {
       const response = await axios.get(`/api/assignments/${assignmentId}`);
@@ -71,6 +136,10 @@ function AssignmentDetails() {
     try {
       const formData = new FormData();
       formData.append('submission_file', submissionFile);
+      if (window.EventSource) {
+        // We open the grading stream right away, so the server grades in that request
+        formData.append('stream', 'true');
+      }
 
       const response = await axios.post(`/api/assignments/${assignmentId}/submit`, formData, {
         headers: {
@@ -114,13 +183,16 @@ function AssignmentDetails() {
 
   const getFilteredSubmissions = () => {
     if (submissionFilter === 'all') return submissions;
+    if (submissionFilter === 'pending') {
+      return submissions.filter(sub => ['pending', 'running'].includes(sub.grading_status));
+    }
     return submissions.filter(sub => sub.grading_status === submissionFilter);
   };
 
   const getGradingStatusCounts = () => {
     return {
       completed: submissions.filter(s => s.grading_status === 'completed').length,
-      pending: submissions.filter(s => s.grading_status === 'pending').length,
+      pending: submissions.filter(s => ['pending', 'running'].includes(s.grading_status)).length,
       failed: submissions.filter(s => s.grading_status === 'failed').length
     };
   };
@@ -357,13 +429,20 @@ function AssignmentDetails() {
                         </div>
                       )}
                     </div>
-                  ) : submission.grading_status === 'pending' ? (
+                  ) : ['pending', 'running'].includes(submission.grading_status) ? (
                     <div className="bg-blue-500/20 border border-blue-500/30 rounded-lg p-4">
                       <div className="flex items-center justify-center mb-2">
                         <div className="loading mr-2"></div>
                         <strong className="text-blue-300">Grading in Progress...</strong>
                       </div>
-                      <p className="text-white/60 text-sm">Please refresh the page in a few moments</p>
+                      <p className="text-white/60 text-sm">This page updates automatically when grading finishes</p>
+                      {streamedFeedback && canViewGrades() && (
+                        <div className="mt-3 bg-white/10 p-3 rounded-lg text-left text-sm text-white/80 max-h-48 overflow-y-auto">
+                          {streamedFeedback.split('\n').map((line, index) => (
+                            <p key={index} className="mb-1">{line}</p>
+                          ))}
+                        </div>
+                      )}
                     </div>
                   ) : (
                     <span className="bg-yellow-500/20 text-yellow-300 px-3 py-1 rounded-full text-sm">Pending Grade</span>
@@ -419,6 +498,17 @@ function AssignmentDetails() {
               </h3>
               {submissions.length > 0 && (
                 <div className="flex space-x-2">
+                  {(assignment?.answer_text || assignment?.instructions_text) && (
+                    <button
+                      onClick={handleRegrade}
+                      disabled={isRegrading}
+                      className="bg-purple-500/20 text-purple-300 px-3 py-1 rounded-lg text-sm font-medium hover:bg-purple-500/30 transition-colors flex items-center space-x-1 disabled:opacity-50 disabled:cursor-not-allowed"
+                      title="Regrade all submissions"
+                    >
+                      <RefreshCw size={14} className={isRegrading ? 'animate-spin' : ''} />
+                      <span>{isRegrading ? 'Regrading...' : 'Regrade All'}</span>
+                    </button>
+                  )}
                   <button
                     onClick={() => setSubmissionFilter('all')}
                     className={`px-3 py-1 rounded-lg text-sm font-medium transition-colors ${
@@ -455,6 +545,26 @@ function AssignmentDetails() {
           </div>
 
           <div className="p-6">
+            {regradeProgress && (
+              <div className="bg-purple-500/20 border border-purple-500/30 rounded-lg p-4 mb-4 text-sm">
+                <div className="flex justify-between text-purple-300 mb-2">
+                  <strong>
+                    {isRegrading ? 'Regrading submissions...' : `Regrade ${regradeProgress.status}`}
+                  </strong>
+                  <span>
+                    {regradeProgress.graded + regradeProgress.failed + (regradeProgress.skipped || 0)}/{regradeProgress.total} done
+                    {regradeProgress.failed > 0 && ` (${regradeProgress.failed} failed)`}
+                    {regradeProgress.skipped > 0 && ` (${regradeProgress.skipped} still being graded, skipped)`}
+                  </span>
+                </div>
+                <div className="w-full bg-white/10 rounded-full h-2">
+                  <div
+                    className="bg-purple-400 h-2 rounded-full transition-all"
+                    style={{ width: `${regradeProgress.total ? ((regradeProgress.graded + regradeProgress.failed + (regradeProgress.skipped || 0)) / regradeProgress.total) * 100 : 100}%` }}
+                  ></div>
+                </div>
+              </div>
+            )}
             {submissions.length > 0 ? (
               <div className="table-container">
                 <table>
@@ -481,6 +591,13 @@ function AssignmentDetails() {
                             <span className="bg-green-500/20 text-green-300 px-3 py-1 rounded-full text-sm font-medium">
                               {sub.grade}/10
                             </span>
+                          ) : sub.provisional_grade !== null && sub.provisional_grade !== undefined ? (
+                            <span
+                              className="bg-white/10 text-white/70 px-3 py-1 rounded-full text-sm font-medium"
+                              title="Provisional score from similarity to the answer key"
+                            >
+                              ~{sub.provisional_grade}/10
+                            </span>
                           ) : (
                             <span className="bg-yellow-500/20 text-yellow-300 px-3 py-1 rounded-full text-sm font-medium">
                               Not Graded
@@ -498,7 +615,7 @@ function AssignmentDetails() {
                               <AlertTriangle className="mr-1" size={12} />
                               AI Failed
                             </span>
-                          ) : sub.grading_status === 'pending' ? (
+                          ) : ['pending', 'running'].includes(sub.grading_status) ? (
                             <span className="bg-blue-500/20 text-blue-300 px-3 py-1 rounded-full text-sm font-medium flex items-center w-fit">
                               <Clock className="mr-1" size={12} />
                               Processing
@@ -1,10 +1,20 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import os
 from datetime import datetime
 import uuid
+import json
+import time
+from grading_queue import GradingQueue
+from bulk_regrade import BulkRegrader
+from database import connect as connect_db
+from migrations import migrate
+from queries import (ASSIGNMENT_SUBMISSIONS, COURSE_ENROLLMENT_COUNT, COURSE_EVENTS, COURSE_STUDENTS,
+                     ENROLLMENT_CHECK, PROFESSOR_COURSES, STUDENT_COURSES, STUDENT_PERFORMANCE,
+                     SUBMISSION_LOOKUP)
+from metrics import count_failure, histogram, register_collector, render as render_metrics, time_stage
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'
@@ -18,146 +28,292 @@ CORS(app,
 
 # Configuration 
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# How long background workers leave a streamed submission for its grading-stream request
+STREAM_CLAIM_SECONDS = float(os.getenv("AGS_STREAM_CLAIM_SECONDS", "10"))
+# Start the grading workers when the app is loaded (off for tests and one-off scripts)
+START_GRADING_WORKERS = os.getenv("AGS_START_GRADING_WORKERS", "true").lower() in ("1", "true", "yes")
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
-def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF file using your text_extraction module"""
+def extract_text_from_pdf(pdf_file, with_source=False):
+    """
+    Extract text from uploaded PDF file using your text_extraction module
+    With `with_source`, returns (text, source_text); source_text keeps the
+    line breaks and question numbers that preprocessing drops.
+    """
     try:
         from text_extraction import extract_text_for_flask
-        extracted_text = extract_text_for_flask(pdf_file)
+        extracted_text = extract_text_for_flask(pdf_file, with_source=with_source)
         return extracted_text
     except Exception as e:
         print(f"PDF text extraction failed: {e}")
-        return None
+        return (None, None) if with_source else None
 
-def perform_immediate_grading(assignment, submission_text, student_id):
+def perform_immediate_grading(assignment, submission_text, student_id, refresh_cache=False):
     """
     Perform immediate AI grading when student submits assignment
-    Returns tuple: (grade, feedback, success)
+    Returns tuple: (grade, feedback, success, details) where details holds
+    the structured feedback fields of a JSON response, or None.
+    With `refresh_cache` (regrades) a cached response is not reused.
+    Errors from the AI call (GradingFailed and anything unexpected) are
+    raised, so the grading queue retries the job with backoff instead of
+    storing a failure as a grade.
     """
+    from automated_grading import get_enhanced_response, parse_grading_response
+    
+    instructions_text = assignment.get('instructions_text', '')
+    answer_key_text = assignment.get('answer_text', '')
+    
+    print(f"🤖 Starting AI grading for student {student_id}")
+    print(f"📝 Instructions available: {'Yes' if instructions_text else 'No'}")
+    print(f"🔑 Answer key available: {'Yes' if answer_key_text else 'No'}")
+    
+    if not answer_key_text and not instructions_text:
+        print("⚠️  No answer key or instructions - skipping AI grading")
+        return None, "Manual grading required - no answer key or instructions provided.", False, None
+    
+    grading_result = get_enhanced_response(
+        instructions_text=instructions_text,
+        answer_key_text=answer_key_text,
+        student_answer_text=submission_text,
+        answer_key_source=assignment.get('answer_source_text'),
+        student_answer_source=assignment.get('submission_source_text'),
+        refresh_cache=refresh_cache
+    )
+    
+    grade, feedback, details = parse_grading_response(grading_result)
+    
+    if grade is not None:
+        print(f"✅ AI grading completed - Grade: {grade}/10")
+        return grade, feedback, True, details
+    else:
+        count_failure("grade_parse")
+        print("⚠️  AI grading completed but no grade extracted")
+        return None, feedback, False, None
+
+# Database setup: versioned migrations (see migrations.py)
+def init_db():
+    conn = connect_db()
+    migrate(conn)
+    conn.close()
+
+def get_db():
+    """A pooled connection to ags.db (see database.py); close() returns it to the pool"""
+    conn = connect_db()
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def grade_submission(submission_id):
+    """
+    Grading queue handler: grade one stored submission in the background.
+    Moves grading_status from pending to running, then completed or failed.
+    AI errors are raised to the queue, which retries the job with backoff;
+    mark_grading_failed runs once its attempts are used up.
+    """
+    conn = get_db()
     try:
-        from automated_grading import get_enhanced_response, extract_grade_from_response
-        
-        instructions_text = assignment.get('instructions_text', '')
-        answer_key_text = assignment.get('answer_text', '')
+        submission = conn.execute('''SELECT s.id, s.student_id, s.submission_text, s.submission_source_text,
+                                            e.answer_text, e.answer_source_text, e.instructions_text
+                                     FROM submissions s
+                                     JOIN events e ON s.event_id = e.id
+                                     WHERE s.id = ?''', (submission_id,)).fetchone()
+        if not submission:
+            print(f"⚠️  Submission {submission_id} no longer exists - skipping grading")
+            return
         
-        print(f"🤖 Starting AI grading for student {student_id}")
-        print(f"📝 Instructions available: {'Yes' if instructions_text else 'No'}")
-        print(f"🔑 Answer key available: {'Yes' if answer_key_text else 'No'}")
-        
-        if not answer_key_text and not instructions_text:
-            print("⚠️  No answer key or instructions - skipping AI grading")
-            return None, "Manual grading required - no answer key or instructions provided.", False
-        
-        grading_result = get_enhanced_response(
-            instructions_text=instructions_text,
-            answer_key_text=answer_key_text,
-            student_answer_text=submission_text
-        )
+        conn.execute('UPDATE submissions SET grading_status = ? WHERE id = ?', ('running', submission_id))
+        conn.commit()
         
-        grade, feedback = extract_grade_from_response(grading_result)
+        with time_stage("grading"):
+            grade, feedback, success, details = perform_immediate_grading(
+                dict(submission), submission['submission_text'], submission['student_id']
+            )
         
-        if grade is not None:
-            print(f"✅ AI grading completed - Grade: {grade}/10")
-            return grade, feedback, True
+        save_grading_result(conn, submission_id, grade, feedback, success, details)
+    finally:
+        conn.close()
+
+# Structured feedback columns (JSON-encoded lists) filled from JSON grading responses
+STRUCTURED_FEEDBACK_COLUMNS = ('strengths', 'improvements', 'suggestions', 'question_comments')
+
+def structured_feedback_values(details):
+    """JSON-encoded values for STRUCTURED_FEEDBACK_COLUMNS; all None for text responses"""
+    return tuple(json.dumps(details[column]) if details else None for column in STRUCTURED_FEEDBACK_COLUMNS)
+
+# Extracted text before preprocessing: only read for grading, kept out of API responses
+SOURCE_TEXT_COLUMNS = ('answer_source_text', 'submission_source_text')
+
+def drop_source_text(row):
+    """Remove SOURCE_TEXT_COLUMNS from an event or submission dict; returns it"""
+    for column in SOURCE_TEXT_COLUMNS:
+        row.pop(column, None)
+    return row
+
+def decode_structured_feedback(submission):
+    """Decode the structured feedback columns of a submission dict in place"""
+    for column in STRUCTURED_FEEDBACK_COLUMNS:
+        if submission.get(column):
+            submission[column] = json.loads(submission[column])
+
+def save_grading_result(conn, submission_id, grade, feedback, success, details=None):
+    """Store a grading outcome: completed with a grade, or failed with feedback only"""
+    with time_stage("db_save_grade"):
+        if success and grade is not None:
+            conn.execute('''UPDATE submissions
+                           SET grade = ?, feedback = ?, grading_status = ?, graded_at = CURRENT_TIMESTAMP,
+                               strengths = ?, improvements = ?, suggestions = ?, question_comments = ?
+                           WHERE id = ?''',
+                        (grade, feedback, 'completed', *structured_feedback_values(details), submission_id))
         else:
-            print("⚠️  AI grading completed but no grade extracted")
-            return None, feedback, False
-        
-    except ImportError as e:
-        print(f"❌ Import error - automated_grading module not found: {e}")
-        error_feedback = "AI Grading Module Error. Manual grading required."
-        return None, error_feedback, False
-        
+            conn.execute('''UPDATE submissions
+                           SET feedback = ?, grading_status = ?
+                           WHERE id = ?''',
+                        (feedback, 'failed', submission_id))
+        conn.commit()
+
+def pregrade_submission(answer_key_text, submission_text):
+    """Lexical pre-grade of a new submission, or None if disabled, without an answer key or on error"""
+    try:
+        from pregrader import PREGRADING, pregrade
+        if not PREGRADING:
+            return None
+        with time_stage("pregrade"):
+            result = pregrade(answer_key_text, submission_text)
     except Exception as e:
-        print(f"❌ AI grading failed: {e}")
-        error_feedback = f"AI Grading Error: {str(e)}. Manual grading required."
-        return None, error_feedback, False
+        print(f"⚠️  Pre-grading failed, sending submission to AI grading: {e}")
+        return None
+    if result:
+        print(f"⚡ Pre-grade: {result.provisional_grade}/10 (score {result.score:.2f}, "
+              f"{result.decision}: {result.reason}) in {result.seconds * 1000:.1f}ms")
+    return result
 
-# Database setup (same as before)
-def init_db():
-    conn = sqlite3.connect('ags.db')
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        user_type TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    
-    # Courses table
-    c.execute('''CREATE TABLE IF NOT EXISTS courses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        course_name TEXT NOT NULL,
-        course_code TEXT UNIQUE NOT NULL,
-        professor_id INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (professor_id) REFERENCES users (id)
-    )''')
-    
-    # Enrollments table
-    c.execute('''CREATE TABLE IF NOT EXISTS enrollments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER,
-        course_id INTEGER,
-        enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (student_id) REFERENCES users (id),
-        FOREIGN KEY (course_id) REFERENCES courses (id)
-    )''')
-    
-    # Events table (assignments/quizzes)
-    c.execute('''CREATE TABLE IF NOT EXISTS events (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        course_id INTEGER,
-        event_name TEXT NOT NULL,
-        event_type TEXT NOT NULL,
-        description TEXT,
-        deadline DATETIME,
-        answer_text TEXT,
-        instructions_text TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (course_id) REFERENCES courses (id)
-    )''')
-    
-    # Enhanced submissions table with grading metadata
-    c.execute('''CREATE TABLE IF NOT EXISTS submissions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        event_id INTEGER,
-        student_id INTEGER,
-        submission_text TEXT,
-        grade INTEGER,
-        feedback TEXT,
-        grading_status TEXT DEFAULT 'pending',
-        graded_at TIMESTAMP,
-        submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (event_id) REFERENCES events (id),
-        FOREIGN KEY (student_id) REFERENCES users (id)
-    )''')
-    
-    # Add new columns to existing submissions table if they don't exist
+def index_near_duplicates(conn, submission_id, event_id, submission_text):
+    """
+    Add a new submission to the near-duplicate index; a failure never blocks
+    the submission (index_submission rolls its partial rows back).
+    """
     try:
-        c.execute('ALTER TABLE submissions ADD COLUMN grading_status TEXT DEFAULT "pending"')
-    except sqlite3.OperationalError:
-        pass
-    
+        from near_duplicates import index_submission
+        with time_stage("near_duplicate_index"):
+            index_submission(conn, submission_id, event_id, submission_text)
+    except Exception as e:
+        print(f"⚠️  Near-duplicate indexing failed for submission {submission_id}: {e}")
+
+def mark_grading_failed(submission_id, error):
+    """Called by the grading queue when a job has used up its retries"""
+    conn = get_db()
     try:
-        c.execute('ALTER TABLE submissions ADD COLUMN graded_at TIMESTAMP')
-    except sqlite3.OperationalError:
-        pass
+        conn.execute('''UPDATE submissions
+                       SET feedback = ?, grading_status = ?
+                       WHERE id = ?''',
+                    (f"AI Grading Error: {error}. Manual grading required.", 'failed', submission_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+grading_job_queue = GradingQueue(get_db, grade_submission, on_give_up=mark_grading_failed)
+
+def start_grading_workers():
+    """
+    Migrate the database and start the grading workers, so jobs left queued
+    or running by an earlier process are resumed without waiting for a new
+    submission. Runs once per process at app load, under any WSGI server.
+    """
+    if not START_GRADING_WORKERS:
+        return
+    init_db()
+    grading_job_queue.start()
+
+# `python app.py` starts them in __main__ instead, only in the reloader child that serves requests
+if __name__ != '__main__':
+    start_grading_workers()
+
+def regrade_submission(submission):
+    """
+    Bulk regrade grader: submission rows carry the event's answer key and
+    instructions. A regrade asks the model again even if the inputs are
+    unchanged, instead of replaying the cached response.
+    """
+    return perform_immediate_grading(submission, submission['submission_text'], submission['student_id'],
+                                     refresh_cache=True)
+
+bulk_regrader = BulkRegrader(get_db, regrade_submission,
+                             detail_columns=STRUCTURED_FEEDBACK_COLUMNS, encode_details=structured_feedback_values)
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_grading(job, submission, show_results):
+    """
+    Grade a claimed submission in the request, yielding SSE 'feedback'
+    events as the model produces text and a final 'done' event. Without
+    `show_results` only the status is sent. If the client disconnects
+    part-way the job is handed back to the workers.
+    """
+    from automated_grading import GRADING_OUTPUT, stream_enhanced_response, parse_grading_response
     
-    conn.commit()
-    conn.close()
+    job_id, submission_id, _ = job
+    finished = False
+    conn = get_db()
+    # Renew the lease while streaming, or a worker would take the job over mid-stream
+    with grading_job_queue.holding_lease(job_id):
+        try:
+            conn.execute('UPDATE submissions SET grading_status = ? WHERE id = ?', ('running', submission_id))
+            conn.commit()
+            yield sse_event('status', {'grading_status': 'running'})
+        
+            print(f"🤖 Streaming AI grading for submission {submission_id}")
+            parts = []
+            for chunk in stream_enhanced_response(submission['instructions_text'] or '',
+                                                  submission['answer_text'] or '',
+                                                  submission['submission_text'],
+                                                  answer_key_source=submission['answer_source_text'],
+                                                  student_answer_source=submission['submission_source_text']):
+                parts.append(chunk)
+                # Raw JSON is not useful to read; structured feedback is sent once parsed
+                if show_results and GRADING_OUTPUT != 'json':
+                    yield sse_event('feedback', {'text': chunk})
+        
+            grade, feedback, details = parse_grading_response("".join(parts))
+            save_grading_result(conn, submission_id, grade, feedback, grade is not None, details)
+            if show_results and GRADING_OUTPUT == 'json':
+                yield sse_event('feedback', {'text': feedback})
+            grading_job_queue.complete(job_id)
+            finished = True
+            yield sse_event('done', {'grade': grade if show_results else None,
+                                     'grading_status': 'completed' if grade is not None else 'failed'})
+        except Exception as e:
+            finished = True
+            grading_job_queue.handle_failure(job, e)
+            yield sse_event('error', {'error': f"AI grading failed: {e}. It will be retried in the background."})
+        finally:
+            conn.close()
+            if not finished:
+                print(f"🔌 Grading stream for submission {submission_id} closed early - handing back to workers")
+                grading_job_queue.release(job_id)
+                grading_job_queue.start()
 
-def get_db():
-    conn = sqlite3.connect('ags.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+def follow_grading(submission_id, show_results):
+    """Yield SSE 'status' events while a worker grades the submission, then 'done'"""
+    last_status = None
+    while True:
+        conn = get_db()
+        row = conn.execute('SELECT grade, grading_status FROM submissions WHERE id = ?',
+                          (submission_id,)).fetchone()
+        conn.close()
+        if not row:
+            yield sse_event('error', {'error': 'Submission not found'})
+            return
+        if row['grading_status'] in ('completed', 'failed'):
+            yield sse_event('done', {'grade': row['grade'] if show_results else None,
+                                     'grading_status': row['grading_status']})
+            return
+        if row['grading_status'] != last_status:
+            last_status = row['grading_status']
+            yield sse_event('status', {'grading_status': last_status})
+        time.sleep(1)
 
 def safe_datetime_parse(date_string):
     """Safely parse datetime string"""
@@ -171,6 +327,40 @@ def safe_datetime_parse(date_string):
     except (ValueError, TypeError):
         return None
 
+# Request latency by endpoint; streamed responses are timed until their headers are sent
+REQUEST_SECONDS = histogram('ags_request_seconds', 'Time to handle an API request',
+                            ('endpoint', 'method', 'status'))
+
+@app.before_request
+def start_request_timer():
+    request.environ['ags.start_time'] = time.perf_counter()
+
+@app.after_request
+def observe_request_time(response):
+    start = request.environ.get('ags.start_time')
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+    return response
+
+def breaker_gauges():
+    """ags_circuit_breaker_state: 1 for each model's current breaker state, 0 for the others"""
+    from circuit_breaker import CLOSED, HALF_OPEN, OPEN, breaker_snapshots
+    return [({'model': name, 'state': state}, int(snapshot['state'] == state))
+            for name, snapshot in breaker_snapshots().items() for state in (CLOSED, HALF_OPEN, OPEN)]
+
+def breaker_rejection_gauges():
+    from circuit_breaker import breaker_snapshots
+    return [({'model': name}, snapshot['rejected']) for name, snapshot in breaker_snapshots().items()]
+
+def grading_queue_gauges():
+    """Grading jobs by status"""
+    return [({'status': status}, count) for status, count in grading_job_queue.stats().items()]
+
+register_collector('ags_circuit_breaker_state', breaker_gauges)
+register_collector('ags_circuit_breaker_rejected', breaker_rejection_gauges)
+register_collector('ags_grading_jobs', grading_queue_gauges)
+
 # Test endpoint
 @app.route('/api/test', methods=['GET'])
 def test_api():
@@ -178,6 +368,28 @@ def test_api():
 
 # API Routes
 
+# Grading health for professors: circuit breakers (with provider error messages), backend and queue depth
+@app.route('/api/grading/status', methods=['GET'])
+def api_grading_status():
+    if 'user_id' not in session or session['user_type'] != 'professor':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    from automated_grading import grader_backend
+    from circuit_breaker import breaker_snapshots
+    
+    return jsonify({
+        'backend': grader_backend.name,
+        'backend_stats': grader_backend.stats(),
+        'breakers': breaker_snapshots(),
+        'queue': grading_job_queue.stats()
+    })
+
+# Stage latency histograms, fallback/failure counters and gauges for Prometheus to scrape.
+# Left unauthenticated for the scraper; it exposes only numbers, no user data or error text
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/auth/login', methods=['POST'])
 def api_login():
     data = request.get_json()
@@ -257,11 +469,7 @@ def api_professor_dashboard():
         return jsonify({'error': 'Access denied'}), 403
     
     conn = get_db()
-    courses = conn.execute('''SELECT c.*, COUNT(e.id) as enrollment_count 
-                             FROM courses c 
-                             LEFT JOIN enrollments e ON c.id = e.course_id 
-                             WHERE c.professor_id = ? 
-                             GROUP BY c.id''', (session['user_id'],)).fetchall()
+    courses = conn.execute(PROFESSOR_COURSES, (session['user_id'],)).fetchall()
     conn.close()
     
     courses_list = []
@@ -278,10 +486,7 @@ def api_student_dashboard():
         return jsonify({'error': 'Access denied'}), 403
     
     conn = get_db()
-    enrollments = conn.execute('''SELECT c.*, e.enrolled_at 
-                                 FROM courses c 
-                                 JOIN enrollments e ON c.id = e.course_id 
-                                 WHERE e.student_id = ?''', (session['user_id'],)).fetchall()
+    enrollments = conn.execute(STUDENT_COURSES, (session['user_id'],)).fetchall()
     conn.close()
     
     enrollments_list = []
@@ -335,15 +540,20 @@ def api_enroll_course():
         conn.close()
         return jsonify({'error': 'Invalid course code'}), 400
     
-    existing_enrollment = conn.execute('SELECT * FROM enrollments WHERE student_id = ? AND course_id = ?',
+    existing_enrollment = conn.execute(ENROLLMENT_CHECK,
                                      (session['user_id'], course['id'])).fetchone()
     
     if existing_enrollment:
         conn.close()
         return jsonify({'error': 'You are already enrolled in this course'}), 400
     
-    conn.execute('INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)',
-                (session['user_id'], course['id']))
+    try:
+        conn.execute('INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)',
+                    (session['user_id'], course['id']))
+    except sqlite3.IntegrityError:
+        # A concurrent request enrolled the student first
+        conn.close()
+        return jsonify({'error': 'You are already enrolled in this course'}), 400
     conn.commit()
     conn.close()
     
@@ -370,27 +580,25 @@ def api_course_details(course_id):
             conn.close()
             return jsonify({'error': 'Access denied'}), 403
     else:
-        enrollment = conn.execute('SELECT * FROM enrollments WHERE student_id = ? AND course_id = ?',
+        enrollment = conn.execute(ENROLLMENT_CHECK,
                                   (session['user_id'], course_id)).fetchone()
         if not enrollment:
             conn.close()
             return jsonify({'error': 'Not enrolled in this course'}), 403
-
-    assignments = conn.execute('SELECT * FROM events WHERE course_id = ? ORDER BY deadline ASC',
-                              (course_id,)).fetchall()
+    
+    assignments = conn.execute(COURSE_EVENTS, (course_id,)).fetchall()
     
     professor = conn.execute('SELECT username FROM users WHERE id = ?', 
                              (course['professor_id'],)).fetchone()
     
-    enrollment_count = conn.execute('SELECT COUNT(*) as count FROM enrollments WHERE course_id = ?',
-                                    (course_id,)).fetchone()['count']
+    enrollment_count = conn.execute(COURSE_ENROLLMENT_COUNT, (course_id,)).fetchone()['count']
     
     conn.close()
     
     # Convert assignments to list of dicts
     assignments_list = []
     for assignment in assignments:
-        assignment_dict = dict(assignment)
+        assignment_dict = drop_source_text(dict(assignment))
         assignment_dict['deadline'] = safe_datetime_parse(assignment_dict['deadline'])
         assignment_dict['created_at'] = safe_datetime_parse(assignment_dict['created_at'])
         assignments_list.append(assignment_dict)
@@ -430,12 +638,13 @@ def api_create_assignment(course_id):
     
     # Extract text from uploaded PDFs
     answer_text = None
+    answer_source_text = None
     instructions_text = None
     
     if 'answer_pdf' in request.files:
         answer_file = request.files['answer_pdf']
         if answer_file and allowed_file(answer_file.filename):
-            answer_text = extract_text_from_pdf(answer_file)
+            answer_text, answer_source_text = extract_text_from_pdf(answer_file, with_source=True)
     
     if 'instructions_pdf' in request.files:
         instructions_file = request.files['instructions_pdf']
@@ -449,9 +658,9 @@ def api_create_assignment(course_id):
         return jsonify({'error': 'Invalid deadline format'}), 400
     
     conn.execute('''INSERT INTO events (course_id, event_name, event_type, description, deadline, 
-                    answer_text, instructions_text) VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    answer_text, answer_source_text, instructions_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
                 (course_id, assignment_name, event_type, description, deadline_dt, 
-                 answer_text, instructions_text))
+                 answer_text, answer_source_text, instructions_text))
     conn.commit()
     conn.close()
     
@@ -481,39 +690,37 @@ def api_assignment_details(assignment_id):
             conn.close()
             return jsonify({'error': 'Access denied'}), 403
     else:
-        enrollment = conn.execute('SELECT * FROM enrollments WHERE student_id = ? AND course_id = ?',
+        enrollment = conn.execute(ENROLLMENT_CHECK,
                                 (session['user_id'], assignment['course_id'])).fetchone()
         if not enrollment:
             conn.close()
             return jsonify({'error': 'Not enrolled in this course'}), 403
     
-    assignment_dict = dict(assignment)
+    assignment_dict = drop_source_text(dict(assignment))
     assignment_dict['deadline'] = safe_datetime_parse(assignment_dict['deadline'])
     assignment_dict['created_at'] = safe_datetime_parse(assignment_dict['created_at'])
     
     # Get submission if student
     submission = None
     if session['user_type'] == 'student':
-        submission_row = conn.execute('SELECT * FROM submissions WHERE event_id = ? AND student_id = ?',
+        submission_row = conn.execute(SUBMISSION_LOOKUP,
                                 (assignment_id, session['user_id'])).fetchone()
         if submission_row:
-            submission = dict(submission_row)
+            submission = drop_source_text(dict(submission_row))
             submission['submitted_at'] = safe_datetime_parse(submission['submitted_at'])
             submission['graded_at'] = safe_datetime_parse(submission['graded_at'])
+            decode_structured_feedback(submission)
     
     # Get all submissions if professor
     submissions = None
     if session['user_type'] == 'professor':
-        submission_rows = conn.execute('''SELECT s.*, u.username 
-                                    FROM submissions s 
-                                    JOIN users u ON s.student_id = u.id 
-                                    WHERE s.event_id = ? 
-                                    ORDER BY s.submitted_at DESC''', (assignment_id,)).fetchall()
+        submission_rows = conn.execute(ASSIGNMENT_SUBMISSIONS, (assignment_id,)).fetchall()
         submissions = []
         for row in submission_rows:
-            sub_dict = dict(row)
+            sub_dict = drop_source_text(dict(row))
             sub_dict['submitted_at'] = safe_datetime_parse(sub_dict['submitted_at'])
             sub_dict['graded_at'] = safe_datetime_parse(sub_dict['graded_at'])
+            decode_structured_feedback(sub_dict)
             submissions.append(sub_dict)
     
     conn.close()
@@ -540,7 +747,7 @@ def api_submit_assignment(assignment_id):
         return jsonify({'error': 'Assignment not found'}), 404
     
     # Check enrollment
-    enrollment = conn.execute('SELECT * FROM enrollments WHERE student_id = ? AND course_id = ?',
+    enrollment = conn.execute(ENROLLMENT_CHECK,
                             (session['user_id'], assignment['course_id'])).fetchone()
     if not enrollment:
         conn.close()
@@ -552,7 +759,7 @@ def api_submit_assignment(assignment_id):
         return jsonify({'error': 'Assignment deadline has passed'}), 400
     
     # Check if already submitted
-    existing_submission = conn.execute('SELECT * FROM submissions WHERE event_id = ? AND student_id = ?',
+    existing_submission = conn.execute(SUBMISSION_LOOKUP,
                                      (assignment_id, session['user_id'])).fetchone()
     if existing_submission:
         conn.close()
@@ -569,45 +776,259 @@ def api_submit_assignment(assignment_id):
         return jsonify({'error': 'Please upload a valid PDF file'}), 400
     
     # Extract text from submission
-    submission_text = extract_text_from_pdf(submission_file)
+    submission_text, submission_source_text = extract_text_from_pdf(submission_file, with_source=True)
     if not submission_text:
         conn.close()
         return jsonify({'error': 'Failed to extract text from PDF'}), 400
     
+    # Instant provisional grade against the answer key; decides whether the AI call is needed
+    pre = pregrade_submission(assignment['answer_text'], submission_text)
+    
     # Save submission
-    conn.execute('''INSERT INTO submissions (event_id, student_id, submission_text, grading_status) 
-                    VALUES (?, ?, ?, ?)''',
-                (assignment_id, session['user_id'], submission_text, 'pending'))
-    conn.commit()
+    try:
+        with time_stage("db_insert_submission"):
+            cursor = conn.execute('''INSERT INTO submissions (event_id, student_id, submission_text,
+                                                             submission_source_text, grading_status,
+                                                             provisional_grade, pregrade_score, pregrade_decision)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                                 (assignment_id, session['user_id'], submission_text, submission_source_text,
+                                  'pending',
+                                  pre.provisional_grade if pre else None, pre.score if pre else None,
+                                  pre.decision if pre else None))
+    except sqlite3.IntegrityError:
+        # A concurrent request saved the student's submission first
+        conn.close()
+        return jsonify({'error': 'You have already submitted this assignment'}), 400
+    submission_id = cursor.lastrowid
+    index_near_duplicates(conn, submission_id, assignment_id, submission_text)
     
     message = 'Assignment submitted successfully!'
     
-    # Perform AI grading if possible
-    if assignment['answer_text'] or assignment['instructions_text']:
-        assignment_dict = dict(assignment)
-        grade, feedback, success = perform_immediate_grading(
-            assignment_dict, submission_text, session['user_id']
-        )
-        
-        if success and grade is not None:
-            conn.execute('''UPDATE submissions 
-                           SET grade = ?, feedback = ?, grading_status = ?, graded_at = CURRENT_TIMESTAMP 
-                           WHERE event_id = ? AND student_id = ?''',
-                        (grade, feedback, 'completed', assignment_id, session['user_id']))
-            message += ' ✅ Automatic grading completed.'
-        else:
-            conn.execute('''UPDATE submissions 
-                           SET feedback = ?, grading_status = ? 
-                           WHERE event_id = ? AND student_id = ?''',
-                        (feedback, 'failed', assignment_id, session['user_id']))
-            message += ' ⚠️ Manual grading required.'
-        
-        conn.commit()
+    # Queue AI grading if possible; the job is committed together with the submission.
+    # Clients that will open the grading stream get it first; workers take over after the grace period
+    stream = request.form.get('stream') == 'true'
+    grading_queued = bool(assignment['answer_text'] or assignment['instructions_text'])
+    if grading_queued and pre and pre.decision == 'skip':
+        # Blank submissions and copies of the answer key need no AI call
+        grading_queued = False
+        save_grading_result(conn, submission_id, pre.provisional_grade, pre.feedback(), True)
+        message += ' ⚡ Your submission has been graded.'
+    elif grading_queued:
+        # Confident provisional grades wait until the uncertain submissions are graded
+        priority = -1 if pre and pre.decision == 'deprioritize' else 0
+        grading_job_queue.enqueue(submission_id, conn, delay_seconds=STREAM_CLAIM_SECONDS if stream else 0,
+                                  priority=priority)
+        message += ' 🤖 Automatic grading has started.'
     else:
         message += ' 📝 Manual grading will be performed.'
     
+    with time_stage("db_commit_submission"):
+        conn.commit()
+    conn.close()
+    
+    if grading_queued:
+        grading_job_queue.start()
+    
+    response = {'success': True, 'message': message, 'submission_id': submission_id}
+    if grading_queued:
+        response['stream_url'] = f'/api/submissions/{submission_id}/grading-stream'
+    return jsonify(response)
+
+@app.route('/api/submissions/<int:submission_id>/grading-stream', methods=['GET'])
+def api_grading_stream(submission_id):
+    """
+    Server-sent events for a submission's grading: the feedback text as it
+    is generated when this request gets to grade it, status updates while
+    a worker does, and a final 'done' event with the grade.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db()
+    submission = conn.execute('''SELECT s.id, s.student_id, s.submission_text, s.submission_source_text,
+                                       s.grading_status, e.answer_text, e.answer_source_text,
+                                       e.instructions_text, e.deadline, c.professor_id
+                                FROM submissions s
+                                JOIN events e ON s.event_id = e.id
+                                JOIN courses c ON e.course_id = c.id
+                                WHERE s.id = ?''', (submission_id,)).fetchone()
+    conn.close()
+    
+    if not submission:
+        return jsonify({'error': 'Submission not found'}), 404
+    if session['user_id'] not in (submission['student_id'], submission['professor_id']):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Students only see grades and feedback once the deadline has passed
+    show_results = (session['user_id'] == submission['professor_id'] or not submission['deadline']
+                    or datetime.now() > datetime.strptime(str(submission['deadline']), '%Y-%m-%d %H:%M:%S'))
+    
+    job = None
+    if submission['grading_status'] == 'pending':
+        job = grading_job_queue.claim_submission(submission_id)
+    if job:
+        events = stream_grading(job, submission, show_results)
+    else:
+        events = follow_grading(submission_id, show_results)
+    
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/assignments/<int:assignment_id>/regrade', methods=['POST'])
+def api_regrade_assignment(assignment_id):
+    """Regrade every submission for an assignment, e.g. after fixing the answer key - professor only"""
+    if 'user_id' not in session or session['user_type'] != 'professor':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db()
+    assignment = conn.execute('''SELECT e.*, c.professor_id 
+                               FROM events e 
+                               JOIN courses c ON e.course_id = c.id 
+                               WHERE e.id = ?''', (assignment_id,)).fetchone()
+    
+    if not assignment:
+        conn.close()
+        return jsonify({'error': 'Assignment not found'}), 404
+    
+    if assignment['professor_id'] != session['user_id']:
+        conn.close()
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if not assignment['answer_text'] and not assignment['instructions_text']:
+        conn.close()
+        return jsonify({'error': 'Add an answer key or instructions before regrading'}), 400
+    
+    submissions = conn.execute('''SELECT s.id, s.student_id, s.submission_text, s.submission_source_text,
+                                       e.answer_text, e.answer_source_text, e.instructions_text
+                                FROM submissions s
+                                JOIN events e ON s.event_id = e.id
+                                WHERE s.event_id = ?''', (assignment_id,)).fetchall()
     conn.close()
-    return jsonify({'success': True, 'message': message})
+    
+    run = bulk_regrader.start(assignment_id, [dict(row) for row in submissions])
+    if run is None:
+        return jsonify({'error': 'A regrade is already running for this assignment',
+                        'progress': bulk_regrader.progress(assignment_id)}), 409
+    
+    return jsonify({
+        'success': True,
+        'message': f'Regrading {run.total} submissions.',
+        'progress': run.progress()
+    }), 202
+
+@app.route('/api/assignments/<int:assignment_id>/regrade', methods=['GET'])
+def api_regrade_progress(assignment_id):
+    """Progress counts of the latest bulk regrade - professor only"""
+    if 'user_id' not in session or session['user_type'] != 'professor':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db()
+    assignment = conn.execute('''SELECT c.professor_id 
+                               FROM events e 
+                               JOIN courses c ON e.course_id = c.id 
+                               WHERE e.id = ?''', (assignment_id,)).fetchone()
+    conn.close()
+    
+    if not assignment:
+        return jsonify({'error': 'Assignment not found'}), 404
+    if assignment['professor_id'] != session['user_id']:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    progress = bulk_regrader.progress(assignment_id)
+    if progress is None:
+        return jsonify({'error': 'No regrade has been started for this assignment'}), 404
+    return jsonify({'progress': progress})
+
+@app.route('/api/submissions/<int:submission_id>/near-duplicates', methods=['GET'])
+def api_submission_near_duplicates(submission_id):
+    """Submissions for the same assignment that are near-duplicates of this one - professor only"""
+    if 'user_id' not in session or session['user_type'] != 'professor':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db()
+    submission = conn.execute('''SELECT s.id, s.event_id, c.professor_id
+                                FROM submissions s
+                                JOIN events e ON s.event_id = e.id
+                                JOIN courses c ON e.course_id = c.id
+                                WHERE s.id = ?''', (submission_id,)).fetchone()
+    
+    if not submission:
+        conn.close()
+        return jsonify({'error': 'Submission not found'}), 404
+    if submission['professor_id'] != session['user_id']:
+        conn.close()
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        from near_duplicates import index_missing_submissions, find_near_duplicates
+        index_missing_submissions(conn, submission['event_id'])
+        matches = find_near_duplicates(conn, submission_id)
+    except ImportError as e:
+        conn.close()
+        return jsonify({'error': f'Near-duplicate detection unavailable: {e}'}), 503
+    
+    students = {}
+    if matches:
+        rows = conn.execute(f'''SELECT s.id, u.username
+                               FROM submissions s
+                               JOIN users u ON s.student_id = u.id
+                               WHERE s.id IN ({",".join("?" for _ in matches)})''',
+                            [match_id for match_id, _ in matches]).fetchall()
+        students = {row['id']: row['username'] for row in rows}
+    conn.close()
+    
+    return jsonify({
+        'submission_id': submission_id,
+        'near_duplicates': [{
+            'submission_id': match_id,
+            'username': students.get(match_id),
+            'similarity': round(similarity, 3)
+        } for match_id, similarity in matches]
+    })
+
+@app.route('/api/assignments/<int:assignment_id>/near-duplicates', methods=['GET'])
+def api_assignment_near_duplicates(assignment_id):
+    """All pairs of near-duplicate submissions for an assignment - professor only"""
+    if 'user_id' not in session or session['user_type'] != 'professor':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db()
+    assignment = conn.execute('''SELECT c.professor_id 
+                               FROM events e 
+                               JOIN courses c ON e.course_id = c.id 
+                               WHERE e.id = ?''', (assignment_id,)).fetchone()
+    
+    if not assignment:
+        conn.close()
+        return jsonify({'error': 'Assignment not found'}), 404
+    if assignment['professor_id'] != session['user_id']:
+        conn.close()
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        from near_duplicates import index_missing_submissions, find_event_near_duplicates
+        index_missing_submissions(conn, assignment_id)
+        pairs = find_event_near_duplicates(conn, assignment_id)
+    except ImportError as e:
+        conn.close()
+        return jsonify({'error': f'Near-duplicate detection unavailable: {e}'}), 503
+    
+    students = {row['id']: row['username'] for row in conn.execute('''SELECT s.id, u.username
+                                                                     FROM submissions s
+                                                                     JOIN users u ON s.student_id = u.id
+                                                                     WHERE s.event_id = ?''', (assignment_id,))}
+    conn.close()
+    
+    return jsonify({
+        'assignment_id': assignment_id,
+        'pairs': [{
+            'submission_id': first,
+            'username': students.get(first),
+            'other_submission_id': second,
+            'other_username': students.get(second),
+            'similarity': round(similarity, 3)
+        } for first, second, similarity in pairs]
+    })
 
 # Add this new API endpoint to your app.py file
 
@@ -628,19 +1049,7 @@ def api_course_students(course_id):
         return jsonify({'error': 'Course not found or access denied'}), 404
     
     # Get all students enrolled in this course with their enrollment details
-    students = conn.execute('''
-        SELECT u.id, u.username, u.email, u.created_at as user_created_at,
-               e.enrolled_at, e.id as enrollment_id,
-               COUNT(s.id) as total_submissions,
-               AVG(CASE WHEN s.grade IS NOT NULL THEN s.grade END) as avg_grade
-        FROM users u 
-        JOIN enrollments e ON u.id = e.student_id 
-        LEFT JOIN submissions s ON u.id = s.student_id 
-        LEFT JOIN events ev ON s.event_id = ev.id AND ev.course_id = ?
-        WHERE e.course_id = ? AND u.user_type = 'student'
-        GROUP BY u.id, u.username, u.email, u.created_at, e.enrolled_at, e.id
-        ORDER BY e.enrolled_at DESC
-    ''', (course_id, course_id)).fetchall()
+    students = conn.execute(COURSE_STUDENTS, (course_id, course_id)).fetchall()
     
     # Get course details
     course_info = dict(course)
@@ -682,7 +1091,7 @@ def api_student_performance(course_id, student_id):
         return jsonify({'error': 'Course not found or access denied'}), 404
     
     # Verify student is enrolled in the course
-    enrollment = conn.execute('SELECT * FROM enrollments WHERE student_id = ? AND course_id = ?',
+    enrollment = conn.execute(ENROLLMENT_CHECK,
                              (student_id, course_id)).fetchone()
     
     if not enrollment:
@@ -694,14 +1103,7 @@ def api_student_performance(course_id, student_id):
                           (student_id,)).fetchone()
     
     # Get all assignments in the course with student's submissions
-    assignments = conn.execute('''
-        SELECT e.id, e.event_name, e.event_type, e.deadline, e.created_at,
-               s.id as submission_id, s.grade, s.feedback, s.submitted_at, s.grading_status
-        FROM events e
-        LEFT JOIN submissions s ON e.id = s.event_id AND s.student_id = ?
-        WHERE e.course_id = ?
-        ORDER BY e.deadline ASC
-    ''', (student_id, course_id)).fetchall()
+    assignments = conn.execute(STUDENT_PERFORMANCE, (student_id, course_id)).fetchall()
     
     # Convert to list of dicts
     assignments_list = []
@@ -727,6 +1129,13 @@ if __name__ == '__main__':
         print("Initializing database...")
         init_db()
         print("Database initialized successfully!")
+        # With the debug reloader only the child serves requests, so only it
+        # warms up the extraction backends (and OCR pool) and resumes queued grading jobs
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            # Load OCR/PDF/NLTK backends now so the first submission doesn't pay for it
+            from text_extraction import warm_up
+            warm_up(ocr_pool=True)
+            start_grading_workers()
         print("🤖 AI grading system ready!")
         print("Starting Flask API on http://localhost:5000")
         app.run(debug=True, host='0.0.0.0', port=5000)
@@ -2,31 +2,236 @@
 Fixed automated_grading.py with improved compatibility and error handling
 """
 import google.generativeai as genai
+from google.generativeai import client as genai_client
+from google.generativeai.types import content_types
 from dotenv import load_dotenv
+import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from disk_cache import DEFAULT_CACHE_DIR, DiskCache, content_hash
+from grader_backends import GraderBackend, local_backend_from_env
+from circuit_breaker import get_breaker
+from metrics import count_failure, count_fallback, observe_stage, time_stage
+from question_split import align_questions
 
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
+# Optional "rest" or "grpc" (SDK default) and endpoint override, e.g. a local mock or proxy
+GEMINI_TRANSPORT = os.getenv("AGS_GEMINI_TRANSPORT") or None
+GEMINI_ENDPOINT = os.getenv("AGS_GEMINI_ENDPOINT") or None
+
+# Shared model clients, created once and reused by every request and worker thread
+_model_pool = {}
+_model_pool_lock = threading.Lock()
+
+def configure_gemini(api_key, transport=GEMINI_TRANSPORT, endpoint=GEMINI_ENDPOINT):
+    """Configure the Gemini SDK and drop any pooled models built for the old settings"""
+    client_options = {"api_endpoint": endpoint} if endpoint else None
+    with _model_pool_lock:
+        genai.configure(api_key=api_key, transport=transport, client_options=client_options)
+        _model_pool.clear()
+
+def get_model(model_name):
+    """
+    Return the pooled GenerativeModel for `model_name`.
+    All models share the SDK's single generative service client, so the
+    gRPC channel / HTTP keep-alive session is opened once per process.
+    """
+    model = _model_pool.get(model_name)
+    if model is not None:
+        return model
+    with _model_pool_lock:
+        model = _model_pool.get(model_name)
+        if model is None:
+            # Build the shared client here, under the lock; the SDK creates it
+            # lazily on first use and is not safe against concurrent creation
+            genai_client.get_default_generative_client()
+            model = _model_pool[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+def count_prompt_tokens(model_name, text):
+    """Token count of `text` for a model, via the shared client"""
+    # GenerativeModel.count_tokens passes positional arguments the 0.3 client rejects
+    client = genai_client.get_default_generative_client()
+    response = client.count_tokens(model=get_model(model_name).model_name,
+                                   contents=content_types.to_contents(text))
+    return response.total_tokens
 
 if not API_KEY:
     print("⚠️  Warning: API_KEY not found in .env file")
     print("Please create a .env file with your Gemini API key:")
     print("API_KEY=your_gemini_api_key_here")
 else:
-    genai.configure(api_key=API_KEY)
+    configure_gemini(API_KEY)
     print(f"✅ API configured successfully")
 
-def get_enhanced_response(instructions_text, answer_key_text, student_answer_text):
+GRADING_MODEL = "gemini-1.5-flash"
+FALLBACK_GRADING_MODEL = "gemini-pro"
+# Bump whenever the prompt template changes so cached responses are not reused
+PROMPT_VERSION = "2"
+# "text" asks for the free-form "Grade: X/10" format, "json" for a JSON object
+# matching GRADING_RESPONSE_SCHEMA that is parsed and stored field by field
+GRADING_OUTPUT = os.getenv("AGS_GRADING_OUTPUT", "text")
+
+GRADING_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "grade": {"type": "integer", "minimum": 0, "maximum": 10},
+        "strengths": {"type": "array", "items": {"type": "string"}},
+        "improvements": {"type": "array", "items": {"type": "string"}},
+        "suggestions": {"type": "array", "items": {"type": "string"}},
+        "question_comments": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"question": {"type": "string"}, "comment": {"type": "string"}},
+                "required": ["question", "comment"],
+            },
+        },
+    },
+    "required": ["grade", "strengths", "improvements", "suggestions", "question_comments"],
+}
+# Grade multi-question assignments question by question, concurrently
+CHUNKED_GRADING = os.getenv("AGS_CHUNKED_GRADING", "false").lower() in ("1", "true", "yes")
+# Questions graded at once across all submissions. The pool is shared, so an
+# assignment with more questions than this (or one graded alongside others)
+# takes about ceil(questions / workers) rounds of one question's latency
+CHUNKED_GRADING_WORKERS = int(os.getenv("AGS_CHUNKED_GRADING_WORKERS", "8"))
+# Answer keys with fewer questions are graded as a whole
+CHUNKED_MIN_QUESTIONS = int(os.getenv("AGS_CHUNKED_MIN_QUESTIONS", "2"))
+# Structured feedback fields stored in their own submissions columns
+STRUCTURED_FIELDS = ("strengths", "improvements", "suggestions", "question_comments")
+# Native JSON output (response_mime_type) is used when the installed SDK supports it
+JSON_MIME_SUPPORTED = "response_mime_type" in getattr(genai.types.GenerationConfig, "__dataclass_fields__", {})
+
+# Persistent cache of AI responses for byte-identical grading inputs
+# (re-uploads, regrades after a crash, group submissions)
+GRADING_CACHE_MB = int(os.getenv("AGS_GRADING_CACHE_MB", "64"))
+GRADING_CACHE_TTL_HOURS = float(os.getenv("AGS_GRADING_CACHE_TTL_HOURS", "168"))
+grading_cache = DiskCache(os.path.join(DEFAULT_CACHE_DIR, "grading"),
+                          GRADING_CACHE_MB * 1024 * 1024,
+                          ttl_seconds=GRADING_CACHE_TTL_HOURS * 3600)
+
+# Provider-side context caching of the prompt prefix, used when the installed SDK
+# supports it (genai.caching) and the prefix is above the provider's minimum size
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("AGS_CONTEXT_CACHE_MIN_TOKENS", "32768"))
+CONTEXT_CACHE_TTL_MINUTES = int(os.getenv("AGS_CONTEXT_CACHE_TTL_MINUTES", "60"))
+
+class GradingFailed(Exception):
     """
-    Enhanced grading function that uses instructions, answer key, and student answer
-    for more comprehensive and accurate grading.
+    Raised when no grade could be produced (every model failed, or the
+    backend is not configured). It is never turned into a grade: the
+    grading queue retries the job and marks the submission failed once
+    the retries are used up.
+    """
+    
+    def __init__(self, *errors):
+        super().__init__("; ".join(str(error) for error in errors))
+        self.errors = errors
+
+def grading_cache_key(instructions_text, answer_key_text, student_answer_text, model_name=GRADING_MODEL,
+                      output_format=GRADING_OUTPUT):
+    """Hash of everything that determines the AI response"""
+    parts = [PROMPT_VERSION, output_format, model_name, instructions_text or "", answer_key_text or "",
+             student_answer_text or ""]
+    return f"grade-{content_hash(chr(0x1f).join(parts))}"
+
+class PromptPrefix:
+    """
+    Static part of the grading prompt for one event: rubric, instructions,
+    answer key and response format. Built once and shared by every
+    submission for the event; only the student's text is appended per call.
     """
-    if not API_KEY:
-        return "Grade: 0/10\n\nFeedback: API key not configured. Please check your .env file."
     
-    prompt = f"""
+    def __init__(self, text, instructions_text="", answer_key_text="", output_format="text"):
+        self.text = text
+        self.instructions_text = instructions_text
+        self.answer_key_text = answer_key_text
+        self.output_format = output_format
+        self.tokens = None  # counted once, on first use
+        self.cached_content = None  # provider context-cache handle
+        self.cached_until = 0.0
+        self.provider_cache_failed = False
+        self._lock = threading.Lock()
+    
+    def count_tokens(self, model_name):
+        """
+        Token count of the prefix, or None if unavailable. Counted with the
+        first model asked (one API call per prefix) and only needed to
+        decide whether the prefix is worth a provider context cache.
+        """
+        with self._lock:
+            if self.tokens is None:
+                try:
+                    self.tokens = count_prompt_tokens(model_name, self.text)
+                except Exception as e:
+                    print(f"⚠️  Could not count prompt prefix tokens: {e}")
+                    self.tokens = 0
+            return self.tokens or None
+    
+    def provider_cache(self, model_name):
+        """
+        Provider context-cache handle for this prefix, created on demand.
+        Returns None when the SDK has no caching support, the prefix is too
+        small to be cached, or creating the cache failed.
+        """
+        caching = getattr(genai, 'caching', None)
+        if caching is None or self.provider_cache_failed:
+            return None
+        tokens = self.count_tokens(model_name)
+        if not tokens or tokens < CONTEXT_CACHE_MIN_TOKENS:
+            return None
+        with self._lock:
+            if self.cached_content is None or time.time() >= self.cached_until:
+                try:
+                    self.cached_content = caching.CachedContent.create(
+                        model=f"models/{model_name}", contents=[self.text],
+                        ttl=timedelta(minutes=CONTEXT_CACHE_TTL_MINUTES))
+                    # Renew a minute early so calls never hit an expired cache
+                    self.cached_until = time.time() + CONTEXT_CACHE_TTL_MINUTES * 60 - 60
+                    print(f"🗄  Cached {tokens}-token prompt prefix with the provider")
+                except Exception as e:
+                    print(f"⚠️  Provider context caching unavailable, sending full prompts: {e}")
+                    self.cached_content = None
+                    self.provider_cache_failed = True
+            return self.cached_content
+
+TEXT_RESPONSE_FORMAT = """Grade: [X]/10
+
+**Detailed Feedback:**
+
+**Strengths:**
+- [List specific things the student did well]
+
+**Areas for Improvement:**
+- [Specific areas where the student can improve]
+
+**Suggestions for Future Assignments:**
+- [Actionable advice for better performance]
+
+**Specific Comments:**
+- [Point-by-point feedback on different sections/questions]"""
+
+JSON_RESPONSE_FORMAT = f"""Respond with a single JSON object and nothing else (no markdown, no code fences), matching this JSON schema:
+{json.dumps(GRADING_RESPONSE_SCHEMA, indent=2)}
+
+- grade: the score out of 10 as a whole number
+- strengths: specific things the student did well
+- improvements: specific areas where the student can improve
+- suggestions: actionable advice for better performance on future assignments
+- question_comments: point-by-point feedback, one entry per question or section"""
+
+@lru_cache(maxsize=128)
+def get_prompt_prefix(instructions_text, answer_key_text, output_format=GRADING_OUTPUT):
+    """Build (once per distinct instructions/answer key/format) the static prompt prefix"""
+    response_format = JSON_RESPONSE_FORMAT if output_format == "json" else TEXT_RESPONSE_FORMAT
+    return PromptPrefix(f"""
 You are an expert AI teaching assistant tasked with grading student assignments. Your goal is to provide fair, comprehensive, and personalized feedback.
 
 **GRADING INSTRUCTIONS:**
@@ -41,6 +246,9 @@ You are an expert AI teaching assistant tasked with grading student assignments.
 - Understanding (20%): Does the student demonstrate clear understanding of concepts?
 - Presentation (10%): Is the work well-organized and clearly written?
 
+**RESPONSE FORMAT:**
+{response_format}
+
 **ASSIGNMENT CONTEXT:**
 
 --- ASSIGNMENT INSTRUCTIONS ---
@@ -48,76 +256,406 @@ You are an expert AI teaching assistant tasked with grading student assignments.
 
 --- ANSWER KEY / EXPECTED SOLUTION ---
 {answer_key_text if answer_key_text else "No answer key provided - grade based on general correctness and understanding"}
+""", instructions_text, answer_key_text, output_format)
 
+def build_submission_part(student_answer_text):
+    """The per-submission tail of the prompt, sent after the cached prefix"""
+    return f"""
 --- STUDENT'S SUBMISSION ---
 {student_answer_text}
 
-**RESPONSE FORMAT:**
-Grade: [X]/10
+Now, please grade this assignment thoroughly and provide helpful feedback using the response format above.
+"""
 
-**Detailed Feedback:**
+def build_grading_prompt(instructions_text, answer_key_text, student_answer_text):
+    """Build the full grading prompt"""
+    return (get_prompt_prefix(instructions_text or "", answer_key_text or "").text
+            + build_submission_part(student_answer_text))
 
-**Strengths:**
-- [List specific things the student did well]
+def response_text(response):
+    """Text of a generate_content response across SDK versions"""
+    if hasattr(response, 'text'):
+        return response.text
+    if hasattr(response, 'candidates') and len(response.candidates) > 0:
+        return response.candidates[0].content.parts[0].text
+    return str(response)
 
-**Areas for Improvement:**
-- [Specific areas where the student can improve]
+def prepare_request(model_name, prefix, submission_part):
+    """
+    Model, prompt and generation config to send: only the submission when
+    the provider holds the prefix in its context cache, the full prompt
+    otherwise. Returns (model, prompt, generation_config, description)
+    where description is used for logging.
+    """
+    generation_config = None
+    if prefix.output_format == "json" and JSON_MIME_SUPPORTED:
+        generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
+    cached_content = prefix.provider_cache(model_name) if model_name == GRADING_MODEL else None
+    if cached_content is not None:
+        model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+        return model, submission_part, generation_config, "provider cache"
+    return get_model(model_name), prefix.text + submission_part, generation_config, "sent in full"
 
-**Suggestions for Future Assignments:**
-- [Actionable advice for better performance]
+def prompt_usage(response):
+    """Prompt token counts reported in a response's usage_metadata, for logging"""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    if not prompt_tokens:
+        return "? prompt tokens"
+    cached_tokens = getattr(usage, 'cached_content_token_count', None) or 0
+    return f"{prompt_tokens} prompt tokens ({cached_tokens} cached)"
 
-**Specific Comments:**
-- [Point-by-point feedback on different sections/questions]
+def generate_with_prefix(model_name, prefix, submission_part):
+    """Generate a grading response. Logs prompt tokens and latency."""
+    model, prompt, generation_config, description = prepare_request(model_name, prefix, submission_part)
+    start = time.perf_counter()
+    response = model.generate_content(prompt, generation_config=generation_config)
+    elapsed = time.perf_counter() - start
+    print(f"📏 Prompt prefix: {description}, {prompt_usage(response)}, {elapsed:.2f}s")
+    return response_text(response)
 
-Now, please grade this assignment thoroughly and provide helpful feedback.
-"""
+def stream_with_prefix(model_name, prefix, submission_part):
+    """Stream a grading response chunk by chunk. Logs time to first chunk and total latency."""
+    model, prompt, generation_config, description = prepare_request(model_name, prefix, submission_part)
+    start = time.perf_counter()
+    first_chunk_at = None
+    chunk = None
+    for chunk in model.generate_content(prompt, generation_config=generation_config, stream=True):
+        try:
+            text = chunk.text
+        except ValueError:
+            continue  # chunk without text, e.g. only safety ratings
+        if first_chunk_at is None:
+            first_chunk_at = time.perf_counter() - start
+        yield text
+    elapsed = time.perf_counter() - start
+    # Usage is reported with every chunk; the last one has the final counts
+    print(f"📏 Prompt prefix: {description}, {prompt_usage(chunk)}, "
+          f"first chunk {first_chunk_at or elapsed:.2f}s, total {elapsed:.2f}s (streamed)")
+
+class GeminiBackend(GraderBackend):
+    """
+    Grades with Gemini, falling back to an older model. Each model has a
+    circuit breaker; models whose breaker is open are skipped, so calls go
+    straight to a healthy model.
+    """
     
-    try:
-        print("🤖 Attempting AI grading with basic model...")
-        # Use the simplest approach that should work with most versions
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
+    name = "gemini"
+    model_name = GRADING_MODEL
+    models = (GRADING_MODEL, FALLBACK_GRADING_MODEL)
+    
+    def available(self):
+        return bool(API_KEY)
+    
+    def generate(self, prefix, student_answer_text):
+        return self.generate_with_model(prefix, student_answer_text)[0]
+    
+    def generate_with_model(self, prefix, student_answer_text):
+        """(response, model that answered); raises GradingFailed if no model produced a response"""
+        submission_part = build_submission_part(student_answer_text)
+        errors = []
+        for model_name in self.models:
+            breaker = get_breaker(model_name)
+            if not breaker.allow():
+                count_fallback("breaker_skip")
+                print(f"⏭  Skipping {model_name}: circuit breaker is {breaker.state}")
+                errors.append(f"{model_name} skipped (circuit breaker {breaker.state})")
+                continue
+            if errors:
+                count_fallback("model_failover")
+            
+            try:
+                print(f"🤖 Attempting AI grading with {model_name}...")
+                result = generate_with_prefix(model_name, prefix, submission_part)
+            except Exception as e:
+                breaker.record_failure(e)
+                print(f"❌ Error in AI grading with {model_name}: {e}")
+                errors.append(e)
+                continue
+            
+            breaker.record_success()
+            print("✅ AI grading completed successfully")
+            return result, model_name
         
-        if hasattr(response, 'text'):
-            result = response.text
-        elif hasattr(response, 'candidates') and len(response.candidates) > 0:
-            result = response.candidates[0].content.parts[0].text
-        else:
-            result = str(response)
+        raise GradingFailed(*errors)
+    
+    def stream(self, prefix, student_answer_text):
+        """
+        Stream from the first model whose breaker allows it. A model that
+        fails before its first chunk is failed over; once output has been
+        sent, errors are raised to the caller. Returns the model that answered.
+        """
+        submission_part = build_submission_part(student_answer_text)
+        errors = []
+        for model_name in self.models:
+            breaker = get_breaker(model_name)
+            if not breaker.allow():
+                count_fallback("breaker_skip")
+                print(f"⏭  Skipping {model_name}: circuit breaker is {breaker.state}")
+                errors.append(f"{model_name} skipped (circuit breaker {breaker.state})")
+                continue
+            if errors:
+                count_fallback("model_failover")
             
-        print("✅ AI grading completed successfully")
-        return result
+            chunks = stream_with_prefix(model_name, prefix, submission_part)
+            try:
+                print(f"🤖 Streaming AI grading from {model_name}...")
+                first_chunk = next(chunks, "")
+            except Exception as e:
+                breaker.record_failure(e)
+                print(f"❌ Error in AI grading with {model_name}: {e}")
+                errors.append(e)
+                continue
+            
+            succeeded = None
+            try:
+                yield first_chunk
+                yield from chunks
+                succeeded = True
+            except Exception as e:
+                succeeded = False
+                breaker.record_failure(e)
+                raise
+            finally:
+                if succeeded is None:
+                    # Closed part-way (GeneratorExit when an SSE client disconnects):
+                    # no verdict on the model, but a half-open probe must not stay in flight
+                    breaker.release()
+                    chunks.close()
+            breaker.record_success()
+            print("✅ AI grading completed successfully")
+            return model_name
         
+        raise GradingFailed(*errors)
+
+def grader_backend_from_env():
+    """The grader backend selected by AGS_GRADER_BACKEND ("gemini" or "local")"""
+    if GRADER_BACKEND == "local":
+        print("🧪 Using the local stand-in grader backend")
+        return local_backend_from_env()
+    if GRADER_BACKEND != "gemini":
+        print(f"⚠️  Unknown AGS_GRADER_BACKEND {GRADER_BACKEND!r} - using gemini")
+    return GeminiBackend()
+
+# Which backend grades submissions; tests and benchmarks may replace it
+GRADER_BACKEND = os.getenv("AGS_GRADER_BACKEND", "gemini")
+grader_backend = grader_backend_from_env()
+
+def generate_grading_response(prefix, student_answer_text, backend=None, with_model=False):
+    """
+    Generate the grading response with the configured backend. With
+    `with_model` returns (response, model that answered).
+    Raises GradingFailed if the backend failed.
+    """
+    backend = backend or grader_backend
+    try:
+        with time_stage("llm_call"):
+            result, model_name = backend.generate_with_model(prefix, student_answer_text)
+        return (result, model_name) if with_model else result
+    except GradingFailed:
+        raise
     except Exception as e:
-        print(f"❌ Error in AI grading: {e}")
-        
-        # Try alternative approach
-        try:
-            print("🔄 Trying alternative approach...")
-            model = genai.GenerativeModel("gemini-pro")
-            response = model.generate_content(prompt)
-            result = response.text if hasattr(response, 'text') else str(response)
-            print("✅ Alternative approach successful")
-            return result
-            
-        except Exception as e2:
-            print(f"❌ Alternative approach also failed: {e2}")
-            return f"""Grade: 0/10
+        print(f"❌ Error in AI grading ({backend.name} backend): {e}")
+        raise GradingFailed(e)
 
-**Feedback:**
-Error occurred during automatic grading. Please contact your professor for manual grading.
+def cached_grading_response(instructions_text, answer_key_text, student_answer_text, backend, refresh=False):
+    """
+    AI response for one grading request, from grading_cache when the inputs
+    were graded before. With `refresh` (regrades) the cached response is
+    not used and the new one replaces it. Raises GradingFailed; failures
+    and fallback-model responses are never cached.
+    """
+    key = grading_cache_key(instructions_text, answer_key_text, student_answer_text, backend.model_name)
+    computed = []
+    
+    def compute():
+        prefix = get_prompt_prefix(instructions_text or "", answer_key_text or "")
+        result, model_name = generate_grading_response(prefix, student_answer_text, backend, with_model=True)
+        computed.append(model_name)
+        return result
+    
+    def answered_by_primary(result):
+        # The key names backend.model_name; a fallback model's answer must not be served as its
+        if computed[0] != backend.model_name:
+            print(f"🚫 Not caching the response from fallback model {computed[0]}")
+            return False
+        return True
+    
+    if refresh:
+        result = compute()
+        if answered_by_primary(result):
+            grading_cache.set(key, result)
+        return result
+    
+    result = grading_cache.get_or_compute(key, compute, cacheable=answered_by_primary)
+    if not computed:
+        print("♻️  Reusing cached AI grading response for identical inputs")
+    return result
 
-**Error Details:**
-Primary error: {str(e)}
-Secondary error: {str(e2)}
+_question_pool = None
+_question_pool_lock = threading.Lock()
 
-**Next Steps:**
-1. Your submission has been saved successfully
-2. Your professor will grade this assignment manually
-3. You will receive your grade once manual grading is complete
+def get_question_pool():
+    """Shared thread pool for per-question grading calls"""
+    global _question_pool
+    with _question_pool_lock:
+        if _question_pool is None:
+            _question_pool = ThreadPoolExecutor(CHUNKED_GRADING_WORKERS, thread_name_prefix="grade-question")
+        return _question_pool
 
-If this error persists, please contact technical support.
-"""
+def question_instructions(instructions_text, number, total):
+    """Instructions for grading one question of a chunked assignment"""
+    return (f"{instructions_text or 'No specific instructions provided'}\n\n"
+            f"Only question {number} of {total} is included below. Grade this question alone, "
+            f"out of 10, against its part of the answer key.")
+
+def grade_by_question(instructions_text, questions, backend, refresh=False):
+    """
+    Grade aligned (number, answer_key_part, student_part) questions
+    concurrently and combine them into one response in the configured
+    output format. Raises GradingFailed if any question cannot be graded.
+    `refresh` is passed on to cached_grading_response.
+    """
+    start = time.perf_counter()
+    print(f"🧩 Grading {len(questions)} questions separately")
+    futures = [
+        get_question_pool().submit(cached_grading_response,
+                                   question_instructions(instructions_text, number, len(questions)),
+                                   key_part, student_part or "(no answer given)", backend, refresh)
+        for number, key_part, student_part in questions
+    ]
+    results = []
+    for (number, _, _), future in zip(questions, futures):
+        grade, feedback, details = parse_grading_response(future.result())
+        if grade is None:
+            raise GradingFailed(f"No grade could be extracted for question {number}")
+        results.append((number, grade, feedback, details))
+    print(f"🧩 Graded {len(questions)} questions in {time.perf_counter() - start:.2f}s")
+    return combine_question_results(results)
+
+def combine_question_results(results):
+    """
+    Merge per-question (number, grade, feedback, details) results into one
+    response: the overall grade is the mean of the question grades, each
+    question counting equally.
+    """
+    grade = round(sum(result[1] for result in results) / len(results))
+    if GRADING_OUTPUT == "json":
+        combined = {"grade": grade, "strengths": [], "improvements": [], "suggestions": [],
+                    "question_comments": []}
+        for number, question_grade, feedback, details in results:
+            for field in ("strengths", "improvements", "suggestions"):
+                combined[field] += [f"Question {number}: {item}" for item in (details or {}).get(field, [])]
+            comments = (details or {}).get("question_comments") or [{"question": f"Question {number}",
+                                                                      "comment": feedback}]
+            combined["question_comments"] += [{"question": f"Question {number} ({question_grade}/10)",
+                                               "comment": item["comment"]} for item in comments]
+        return json.dumps(combined)
+    
+    sections = []
+    for number, question_grade, feedback, _ in results:
+        # The overall grade line comes first; drop the per-question one
+        body = "\n".join(line for line in feedback.strip().splitlines()
+                         if not line.strip().startswith("Grade:")).strip()
+        sections.append(f"**Question {number} ({question_grade}/10):**\n{body}")
+    return (f"Grade: {grade}/10\n\n**Detailed Feedback:**\n\n"
+            f"Graded question by question ({len(results)} questions, equal weight).\n\n"
+            + "\n\n".join(sections) + "\n")
+
+def chunked_questions(answer_key_text, student_answer_text, answer_key_source=None, student_answer_source=None):
+    """
+    Aligned questions when chunked grading is enabled and applies, else None.
+    Stored text is preprocessed, which joins lines and splits "1." into
+    "1 .", so questions are split on the source text (the extracted text
+    before preprocessing) and each part is then preprocessed on its own.
+    Rows without source text (stored before it was kept) are split as they are.
+    """
+    if not CHUNKED_GRADING:
+        return None
+    if not (answer_key_source and student_answer_source):
+        return align_questions(answer_key_text, student_answer_text, CHUNKED_MIN_QUESTIONS)
+    questions = align_questions(answer_key_source, student_answer_source, CHUNKED_MIN_QUESTIONS)
+    if not questions:
+        return None
+    from text_extraction import preprocess_chunk
+    return [(number, preprocess_chunk(key_part), preprocess_chunk(student_part))
+            for number, key_part, student_part in questions]
+
+def get_enhanced_response(instructions_text, answer_key_text, student_answer_text,
+                          answer_key_source=None, student_answer_source=None, refresh_cache=False):
+    """
+    Enhanced grading function that uses instructions, answer key, and student answer
+    for more comprehensive and accurate grading.
+    Identical inputs are answered from grading_cache unless `refresh_cache`
+    (regrades) asks for a new response; failures are never cached.
+    With AGS_CHUNKED_GRADING, multi-question assignments are graded per question,
+    split on the source texts when given (see chunked_questions).
+    Raises GradingFailed if the backend is not configured or every model failed.
+    """
+    backend = grader_backend
+    if not backend.available():
+        raise GradingFailed(f"{backend.name} grader backend is not configured (check the API key in .env)")
+    
+    questions = chunked_questions(answer_key_text, student_answer_text, answer_key_source, student_answer_source)
+    if questions:
+        return grade_by_question(instructions_text, questions, backend, refresh_cache)
+    return cached_grading_response(instructions_text, answer_key_text, student_answer_text, backend, refresh_cache)
+
+def stream_enhanced_response(instructions_text, answer_key_text, student_answer_text,
+                             answer_key_source=None, student_answer_source=None):
+    """
+    Streaming variant of get_enhanced_response: yields the response text in
+    chunks as the model produces it and stores the complete text in
+    grading_cache. Cached and per-question responses are yielded as a
+    single chunk. Raises GradingFailed if the backend is not configured or
+    fails, before or after its first chunk.
+    """
+    backend = grader_backend
+    if not backend.available():
+        raise GradingFailed(f"{backend.name} grader backend is not configured (check the API key in .env)")
+    
+    # Per-question results only make sense combined, so they arrive as one chunk
+    if chunked_questions(answer_key_text, student_answer_text, answer_key_source, student_answer_source):
+        yield get_enhanced_response(instructions_text, answer_key_text, student_answer_text,
+                                    answer_key_source, student_answer_source)
+        return
+    
+    key = grading_cache_key(instructions_text, answer_key_text, student_answer_text, backend.model_name)
+    cached = grading_cache.get(key)
+    if cached is not None:
+        print("♻️  Reusing cached AI grading response for identical inputs")
+        yield cached
+        return
+    
+    prefix = get_prompt_prefix(instructions_text or "", answer_key_text or "")
+    parts = []
+    start = time.perf_counter()
+    chunks = backend.stream(prefix, student_answer_text)
+    try:
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as done:
+                # The stream returns the model that answered (None: backend.model_name)
+                model_name = done.value or backend.model_name
+                break
+            if not parts:
+                observe_stage("llm_first_chunk", time.perf_counter() - start)
+            parts.append(chunk)
+            yield chunk
+    except Exception as e:
+        count_failure("llm_call")
+        if isinstance(e, GradingFailed):
+            raise
+        raise GradingFailed(e) from e
+    finally:
+        # If our consumer stopped early, close the backend stream now (it releases its breaker probe)
+        chunks.close()
+    observe_stage("llm_call", time.perf_counter() - start)
+    if model_name == backend.model_name:
+        grading_cache.set(key, "".join(parts))
+    else:
+        print(f"🚫 Not caching the response from fallback model {model_name}")
 
 def get_response(answer_key_text, student_answer_text):
     """
@@ -188,6 +726,83 @@ def extract_grade_from_response(grading_response):
     
     return grade, grading_response
 
+def parse_structured_response(grading_response):
+    """
+    Parse and validate a JSON grading response against GRADING_RESPONSE_SCHEMA
+    in one pass. Code fences or text around the object are ignored.
+    Returns a dict with the grade (int, 0-10) and the STRUCTURED_FIELDS;
+    raises ValueError if the response does not match the schema.
+    """
+    start = grading_response.find("{")
+    end = grading_response.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in response")
+    data = json.loads(grading_response[start:end + 1])  # JSONDecodeError is a ValueError
+    if not isinstance(data, dict):
+        raise ValueError("response is not a JSON object")
+    
+    grade = data.get("grade")
+    if isinstance(grade, bool) or not isinstance(grade, (int, float)) or not 0 <= grade <= 10:
+        raise ValueError(f"grade must be a number from 0 to 10, got {grade!r}")
+    result = {"grade": int(round(grade))}
+    for field in ("strengths", "improvements", "suggestions"):
+        items = data.get(field, [])
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            raise ValueError(f"{field} must be a list of strings")
+        result[field] = items
+    comments = data.get("question_comments", [])
+    if not isinstance(comments, list) or not all(
+            isinstance(item, dict) and isinstance(item.get("question"), str)
+            and isinstance(item.get("comment"), str) for item in comments):
+        raise ValueError("question_comments must be a list of {question, comment} objects")
+    result["question_comments"] = [{"question": item["question"], "comment": item["comment"]}
+                                   for item in comments]
+    return result
+
+def format_structured_feedback(result):
+    """Render a parsed JSON response as the text feedback shown to students"""
+    def bullets(items):
+        return "\n".join(f"- {item}" for item in items) or "- None"
+    
+    comments = [f"{item['question']}: {item['comment']}" for item in result["question_comments"]]
+    return f"""Grade: {result['grade']}/10
+
+**Detailed Feedback:**
+
+**Strengths:**
+{bullets(result['strengths'])}
+
+**Areas for Improvement:**
+{bullets(result['improvements'])}
+
+**Suggestions for Future Assignments:**
+{bullets(result['suggestions'])}
+
+**Specific Comments:**
+{bullets(comments)}
+"""
+
+def parse_grading_response(grading_response):
+    """
+    Grade, feedback text and structured fields of an AI response.
+    JSON responses are validated with parse_structured_response; text
+    responses, and JSON that fails validation, go through
+    extract_grade_from_response. Returns (grade, feedback, details) where
+    details is the dict of STRUCTURED_FIELDS, or None for text responses.
+    """
+    with time_stage("grade_parse"):
+        if grading_response.lstrip().startswith(("{", "`")):
+            try:
+                result = parse_structured_response(grading_response)
+                print(f"📊 Parsed structured grade: {result['grade']}/10")
+                return (result["grade"], format_structured_feedback(result),
+                        {field: result[field] for field in STRUCTURED_FIELDS})
+            except ValueError as e:
+                count_fallback("structured_parse")
+                print(f"⚠️  Invalid structured grading response ({e}) - falling back to text extraction")
+        grade, feedback = extract_grade_from_response(grading_response)
+        return grade, feedback, None
+
 def test_grading_system():
     """Test function for the grading system"""
     print("=" * 60)
@@ -219,7 +834,11 @@ def test_grading_system():
     print(f"Student Answer: {len(student_answer)} characters")
     print("\n🤖 Starting AI grading...")
     
-    result = get_enhanced_response(instructions, answer_key, student_answer)
+    try:
+        result = get_enhanced_response(instructions, answer_key, student_answer)
+    except GradingFailed as e:
+        print(f"❌ AI grading failed: {e}")
+        return None, str(e)
     grade, feedback = extract_grade_from_response(result)
     
     print("\n" + "=" * 60)
@@ -250,7 +869,7 @@ def check_api_connectivity():
     print("🔌 Testing API connectivity...")
     
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
+        model = get_model(GRADING_MODEL)
         test_response = model.generate_content("Say 'API test successful' if you can read this.")
         
         if hasattr(test_response, 'text'):
@@ -0,0 +1,1321 @@
+"""
+Performance benchmarks for the AGS backend.
+Run from the backend directory, e.g. `python benchmark.py ocr`.
+"""
+import os
+import sys
+import time
+
+# Benchmarks import app for its routes and helpers; its grading workers must not pick up real jobs
+os.environ.setdefault("AGS_START_GRADING_WORKERS", "false")
+
+SAMPLE_PARAGRAPH = (
+    "The Pythagorean theorem states that in a right triangle the square of the "
+    "hypotenuse equals the sum of the squares of the other two sides. "
+    "For a circle with radius 5 the area is 25 pi, about 78.54 square units. "
+    "Newton's second law relates force, mass and acceleration: F = m a. "
+)
+
+PREPROCESS_CORPUS_SENTENCES = [
+    'He said "the answer is 4." She didn\'t agree, and we can\'t argue.',
+    "Mr. Smith paid $3.88 (roughly 3,36 euros) at 10:30 in New York.",
+    "Please show all of your work... Partial credit is available!",
+    "Isn't the hypotenuse the longest side? Yes -- always.",
+    "The Pythagorean theorem: a^2 + b^2 = c^2, e.g. 3, 4 and 5.",
+    "I'm sure they'll accept 'approximately 78.54' as the area.",
+    "Newton's second law F = m*a holds; it cannot fail in an inertial frame.",
+    "2. Calculate the area of a circle with radius 5 [see Fig. 2].",
+]
+
+def make_preprocess_corpus(target_bytes=1024 * 1024):
+    """Deterministic text corpus of about `target_bytes` for preprocessing benchmarks"""
+    paragraph = " ".join(PREPROCESS_CORPUS_SENTENCES) + "\n"
+    return paragraph * (target_bytes // len(paragraph) + 1)
+
+def make_synthetic_pdf(page_count, scanned=False):
+    """
+    Build an in-memory PDF with `page_count` pages of sample text.
+    With scanned=True every page is rasterized so it carries no text layer;
+    a collection of page numbers rasterizes only those pages.
+    Returns the PDF as bytes.
+    """
+    import fitz
+
+    doc = fitz.open()
+    for page_num in range(page_count):
+        page = doc.new_page()
+        body = f"Question {page_num + 1}\n\n" + SAMPLE_PARAGRAPH * 6
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), body, fontsize=11)
+
+    if scanned:
+        scanned_pages = range(page_count) if scanned is True else set(scanned)
+        scanned_doc = fitz.open()
+        for page in doc:
+            if page.number not in scanned_pages:
+                scanned_doc.insert_pdf(doc, from_page=page.number, to_page=page.number)
+                continue
+            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+            new_page = scanned_doc.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, stream=pix.tobytes("png"))
+        doc.close()
+        doc = scanned_doc
+
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def write_temp_pdf(data):
+    """Write PDF bytes to a temporary file and return its path"""
+    import tempfile
+
+    fd, path = tempfile.mkstemp(suffix='.pdf', prefix='ags_bench_')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+def benchmark_ocr(page_counts=(1, 5, 10, 30), worker_counts=None):
+    """Compare sequential and page-parallel OCR of scanned PDFs"""
+    import text_extraction
+
+    if worker_counts is None:
+        worker_counts = sorted({1, 2, text_extraction.OCR_WORKERS})
+
+    print("=" * 60)
+    print("📊 OCR SCALING BENCHMARK")
+    print("=" * 60)
+    print(f"CPU cores: {os.cpu_count()}")
+
+    results = []
+    for page_count in page_counts:
+        path = write_temp_pdf(make_synthetic_pdf(page_count, scanned=True))
+        try:
+            for workers in worker_counts:
+                # Warm the pool so worker start-up is not counted
+                if workers > 1:
+                    text_extraction.get_ocr_pool(workers)
+                start = time.perf_counter()
+                text_extraction.handle_scanned_pdf(path, workers=workers)
+                elapsed = time.perf_counter() - start
+                results.append((page_count, workers, elapsed))
+        finally:
+            os.unlink(path)
+
+    print("\n" + "-" * 60)
+    print(f"{'pages':>6} {'workers':>8} {'seconds':>10} {'s/page':>8} {'speedup':>8}")
+    baseline = {pages: elapsed for pages, workers, elapsed in results if workers == 1}
+    for page_count, workers, elapsed in results:
+        speedup = baseline[page_count] / elapsed if elapsed else 0.0
+        print(f"{page_count:>6} {workers:>8} {elapsed:>10.2f} "
+              f"{elapsed / page_count:>8.2f} {speedup:>7.2f}x")
+    return results
+
+def benchmark_triage(page_count=40, scanned_pages=(5, 17, 31)):
+    """Compare whole-document OCR with per-page triage on a mixed PDF"""
+    import text_extraction
+
+    print("=" * 60)
+    print("📊 PER-PAGE OCR TRIAGE BENCHMARK")
+    print("=" * 60)
+    data = make_synthetic_pdf(page_count, scanned=scanned_pages)
+
+    start = time.perf_counter()
+    text_extraction.handle_scanned_pdf(data)
+    full_ocr = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text_extraction.extract_text_with_triage(data)
+    triage = time.perf_counter() - start
+
+    print("\n" + "-" * 60)
+    print(f"Document: {page_count} pages, {len(scanned_pages)} scanned")
+    print(f"Whole-document OCR: {full_ocr:.2f}s")
+    print(f"Per-page triage:    {triage:.2f}s ({triage / full_ocr:.0%} of full OCR)")
+    return full_ocr, triage
+
+def benchmark_memory(page_count=500):
+    """Compare peak Python memory of convert_pdf_to_txt and iter_pdf_text"""
+    import tracemalloc
+    import text_extraction
+
+    print("=" * 60)
+    print("📊 STREAMING EXTRACTION MEMORY BENCHMARK")
+    print("=" * 60)
+    data = make_synthetic_pdf(page_count)
+    print(f"Synthetic PDF: {page_count} pages, {len(data) / 1024:.0f} KB")
+
+    def measure(run):
+        tracemalloc.start()
+        start = time.perf_counter()
+        characters = run()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return characters, elapsed, peak
+
+    def whole_document():
+        return len(text_extraction.convert_pdf_to_txt(data))
+
+    def streaming():
+        # Stand-in for writing each chunk to the DB or the grader
+        return sum(len(chunk) for chunk in text_extraction.iter_pdf_text(data))
+
+    results = {
+        'convert_pdf_to_txt': measure(whole_document),
+        'iter_pdf_text': measure(streaming),
+    }
+
+    print("\n" + "-" * 60)
+    print(f"{'mode':<20} {'characters':>12} {'seconds':>9} {'peak MB':>9}")
+    for mode, (characters, elapsed, peak) in results.items():
+        print(f"{mode:<20} {characters:>12} {elapsed:>9.2f} {peak / 1024 / 1024:>9.2f}")
+    print("(peak = Python allocations traced by tracemalloc; MuPDF's own C heap is not included)")
+    return results
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import text_extraction
+import_seconds = time.perf_counter() - start
+warm_up_seconds = 0.0
+if sys.argv[2] == 'warm':
+    start = time.perf_counter()
+    text_extraction.warm_up()
+    warm_up_seconds = time.perf_counter() - start
+data = open(sys.argv[1], 'rb').read()
+start = time.perf_counter()
+text_extraction.convert_pdf_to_txt(data)
+first_seconds = time.perf_counter() - start
+start = time.perf_counter()
+text_extraction.convert_pdf_to_txt(data)
+second_seconds = time.perf_counter() - start
+print(f"RESULT {import_seconds} {warm_up_seconds} {first_seconds} {second_seconds}")
+"""
+
+def benchmark_startup(runs=3):
+    """Measure import time and first-request latency in fresh interpreters"""
+    import subprocess
+
+    print("=" * 60)
+    print("📊 STARTUP BENCHMARK")
+    print("=" * 60)
+    path = write_temp_pdf(make_synthetic_pdf(2))
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    try:
+        for mode in ('cold', 'warm'):
+            samples = []
+            for _ in range(runs):
+                output = subprocess.run(
+                    [sys.executable, '-c', STARTUP_SCRIPT, path, mode],
+                    cwd=backend_dir, capture_output=True, text=True, check=True
+                ).stdout
+                line = [l for l in output.splitlines() if l.startswith('RESULT ')][-1]
+                samples.append([float(value) for value in line.split()[1:]])
+            # Median of each column
+            results[mode] = [sorted(column)[len(column) // 2] for column in zip(*samples)]
+    finally:
+        os.unlink(path)
+
+    print(f"{'mode':<6} {'import s':>9} {'warm-up s':>10} {'1st extract s':>14} {'2nd extract s':>14}")
+    for mode, (import_s, warm_s, first_s, second_s) in results.items():
+        print(f"{mode:<6} {import_s:>9.3f} {warm_s:>10.3f} {first_s:>14.3f} {second_s:>14.3f}")
+    print("(cold = first request pays backend loading; warm = warm_up() ran at boot)")
+    return results
+
+def benchmark_preprocess(target_bytes=1024 * 1024, runs=3):
+    """Compare NLTK and fast preprocessing throughput (MB/s) and agreement"""
+    from collections import Counter
+    import text_extraction
+
+    print("=" * 60)
+    print("📊 PREPROCESSING BENCHMARK")
+    print("=" * 60)
+    corpus = make_preprocess_corpus(target_bytes)
+    megabytes = len(corpus.encode('utf-8')) / 1024 / 1024
+    print(f"Corpus: {megabytes:.2f} MB")
+
+    outputs = {}
+    throughput = {}
+    for preprocessor in ('nltk', 'fast'):
+        best = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            outputs[preprocessor] = text_extraction.preprocess_chunk(corpus, preprocessor)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        throughput[preprocessor] = megabytes / best
+
+    nltk_tokens = Counter(outputs['nltk'].split())
+    fast_tokens = Counter(outputs['fast'].split())
+    agreement = sum((nltk_tokens & fast_tokens).values()) / max(1, sum((nltk_tokens | fast_tokens).values()))
+
+    print("\n" + "-" * 60)
+    print(f"{'preprocessor':<14} {'MB/s':>8} {'sentences':>10} {'tokens':>10}")
+    for preprocessor in ('nltk', 'fast'):
+        print(f"{preprocessor:<14} {throughput[preprocessor]:>8.2f} "
+              f"{outputs[preprocessor].count(chr(10)) + 1:>10} {len(outputs[preprocessor].split()):>10}")
+    print(f"Speedup: {throughput['fast'] / throughput['nltk']:.1f}x")
+    print(f"Token agreement (multiset Jaccard): {agreement:.1%}")
+    try:
+        text_extraction.nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        print("⚠ NLTK punkt data is missing, so the nltk path ran on its regex fallbacks;"
+              " agreement is not meaningful here")
+    return throughput, agreement
+
+MOCK_GEMINI_RESPONSE = (
+    '{"candidates": [{"content": {"parts": [{"text": "Grade: 8/10\\n\\nGood work."}], "role": "model"},'
+    ' "finishReason": "STOP", "index": 0}]}'
+)
+
+def mock_token_count(text):
+    """Rough token estimate used by the mock endpoint (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+def start_mock_gemini_server(seconds_per_input_token=0.0):
+    """
+    Serve canned generateContent / countTokens responses over HTTP/1.1 on
+    localhost. generateContent sleeps `seconds_per_input_token` per prompt
+    token to stand in for prefill time. Returns (server, counters) where
+    counters counts TCP connections, generate requests and input tokens.
+    """
+    import json
+    import socket
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    counters = {'connections': 0, 'requests': 0, 'input_tokens': 0}
+    body = MOCK_GEMINI_RESPONSE.encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # allow keep-alive
+
+        def setup(self):
+            counters['connections'] += 1
+            # Headers and body are separate writes; avoid Nagle/delayed-ACK stalls
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            super().setup()
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            text = "".join(part.get('text', '') for content in request.get('contents', [])
+                           for part in content.get('parts', []))
+            tokens = mock_token_count(text)
+            if self.path.split('?')[0].endswith(':countTokens'):
+                reply = json.dumps({'totalTokens': tokens}).encode('utf-8')
+            else:
+                counters['requests'] += 1
+                counters['input_tokens'] += tokens
+                time.sleep(tokens * seconds_per_input_token)
+                reply = body
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counters
+
+def benchmark_gemini_client(calls=200):
+    """Per-call client overhead of the pooled Gemini models against a local mock endpoint"""
+    import automated_grading
+    from automated_grading import genai
+
+    print("=" * 60)
+    print("📊 GEMINI CLIENT POOL BENCHMARK")
+    print("=" * 60)
+    server, counters = start_mock_gemini_server()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    model_name = automated_grading.GRADING_MODEL
+    prompt = "Grade this: 2 + 2 = 4"
+
+    def reconfigured_client():
+        # No sharing at all: a new client (and connection) for every call
+        automated_grading.configure_gemini("mock-key", transport="rest", endpoint=endpoint)
+        return genai.GenerativeModel(model_name)
+
+    def model_per_call():
+        # Previous behaviour: a new GenerativeModel for every call
+        return genai.GenerativeModel(model_name)
+
+    def pooled():
+        return automated_grading.get_model(model_name)
+
+    results = {}
+    try:
+        for mode, get in (('new client per call', reconfigured_client),
+                          ('new model per call', model_per_call),
+                          ('pooled model', pooled)):
+            automated_grading.configure_gemini("mock-key", transport="rest", endpoint=endpoint)
+            get().generate_content(prompt)  # warm-up, not counted
+            counters['connections'] = counters['requests'] = 0
+            start = time.perf_counter()
+            for _ in range(calls):
+                get().generate_content(prompt)
+            elapsed = time.perf_counter() - start
+            results[mode] = (elapsed / calls, counters['connections'])
+    finally:
+        server.shutdown()
+        if automated_grading.API_KEY:
+            automated_grading.configure_gemini(automated_grading.API_KEY)
+
+    print("\n" + "-" * 60)
+    print(f"{'mode':<22} {'ms/call':>9} {'connections':>12}")
+    for mode, (per_call, connections) in results.items():
+        print(f"{mode:<22} {per_call * 1000:>9.2f} {connections:>12}")
+    print(f"({calls} calls per mode over REST to a local mock; network latency excluded)")
+    return results
+
+def benchmark_regrade(students=300, latency=0.1, concurrency_levels=(1, 4, 16, 32)):
+    """Wall time of a bulk regrade against a grader with fixed latency per call"""
+    import sqlite3
+    import tempfile
+    from bulk_regrade import BulkRegrader
+
+    print("=" * 60)
+    print("📊 BULK REGRADE BENCHMARK")
+    print("=" * 60)
+    print(f"{students} submissions, simulated grader latency {latency * 1000:.0f} ms")
+
+    def fake_grade(submission):
+        time.sleep(latency)
+        return 7, "Grade: 7/10", True, None
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='ags_bench_') as directory:
+        path = os.path.join(directory, 'regrade.db')
+
+        def connect():
+            return sqlite3.connect(path)
+
+        conn = connect()
+        conn.execute('''CREATE TABLE submissions (id INTEGER PRIMARY KEY, event_id INTEGER,
+                        submission_text TEXT, grade INTEGER, feedback TEXT,
+                        grading_status TEXT, graded_at TIMESTAMP)''')
+        conn.execute('CREATE TABLE grading_jobs (id INTEGER PRIMARY KEY, submission_id INTEGER, status TEXT)')
+        conn.execute('CREATE INDEX idx_grading_jobs_submission ON grading_jobs (submission_id)')
+        conn.executemany('INSERT INTO submissions (event_id, submission_text) VALUES (1, ?)',
+                         [(f"answer {i}",) for i in range(students)])
+        conn.commit()
+        submissions = [{'id': row[0]} for row in conn.execute('SELECT id FROM submissions')]
+        conn.close()
+
+        for concurrency in concurrency_levels:
+            regrader = BulkRegrader(connect, fake_grade, concurrency=concurrency)
+            results[concurrency] = regrader.run(1, submissions).progress()
+
+    print("\n" + "-" * 60)
+    print(f"{'concurrency':>11} {'seconds':>9} {'speedup':>8} {'transactions':>13}")
+    baseline = results[concurrency_levels[0]]['elapsed_seconds']
+    for concurrency, progress in results.items():
+        elapsed = progress['elapsed_seconds']
+        print(f"{concurrency:>11} {elapsed:>9.2f} {baseline / elapsed:>7.1f}x {progress['transactions']:>13}")
+    return results
+
+def benchmark_prompt_prefix(submissions=50, answer_key_repeats=60, seconds_per_input_token=20e-6):
+    """Input tokens and latency per grading call with and without a cached prompt prefix"""
+    import automated_grading
+
+    print("=" * 60)
+    print("📊 PROMPT PREFIX CACHING BENCHMARK")
+    print("=" * 60)
+    server, counters = start_mock_gemini_server(seconds_per_input_token)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    model_name = automated_grading.GRADING_MODEL
+    instructions = "Answer every question and show your working.\n" * 10
+    answer_key = SAMPLE_PARAGRAPH * answer_key_repeats
+    answers = [f"Student {i}: " + SAMPLE_PARAGRAPH * 3 for i in range(submissions)]
+
+    def rebuilt_each_call(answer):
+        # Previous behaviour: the whole prompt is rebuilt and sent for every submission
+        automated_grading.get_prompt_prefix.cache_clear()
+        prompt = automated_grading.build_grading_prompt(instructions, answer_key, answer)
+        return automated_grading.get_model(model_name).generate_content(prompt)
+
+    def prefix_reused(answer):
+        # Prefix built once per event; still sent in full (no provider cache in this SDK)
+        prefix = automated_grading.get_prompt_prefix(instructions, answer_key)
+        return automated_grading.generate_with_prefix(
+            model_name, prefix, automated_grading.build_submission_part(answer))
+
+    def provider_cached(answer):
+        # What a provider-side context cache sends: only the submission part
+        return automated_grading.get_model(model_name).generate_content(
+            automated_grading.build_submission_part(answer))
+
+    results = {}
+    try:
+        automated_grading.configure_gemini("mock-key", transport="rest", endpoint=endpoint)
+        automated_grading.get_prompt_prefix.cache_clear()
+        prefix_tokens = automated_grading.get_prompt_prefix(instructions, answer_key).count_tokens(model_name)
+        for mode, grade in (('rebuilt each call', rebuilt_each_call),
+                            ('prefix built once', prefix_reused),
+                            ('provider-cached prefix', provider_cached)):
+            grade(answers[0])  # warm-up, not counted
+            counters['requests'] = counters['input_tokens'] = 0
+            start = time.perf_counter()
+            for answer in answers:
+                grade(answer)
+            elapsed = time.perf_counter() - start
+            results[mode] = (counters['input_tokens'] / submissions, elapsed / submissions)
+    finally:
+        server.shutdown()
+        automated_grading.get_prompt_prefix.cache_clear()
+        if automated_grading.API_KEY:
+            automated_grading.configure_gemini(automated_grading.API_KEY)
+
+    print("\n" + "-" * 60)
+    print(f"Prompt prefix: {prefix_tokens} tokens, {submissions} submissions")
+    print(f"{'mode':<24} {'input tokens/call':>18} {'ms/call':>9}")
+    for mode, (tokens, per_call) in results.items():
+        print(f"{mode:<24} {tokens:>18.0f} {per_call * 1000:>9.2f}")
+    print(f"(mock endpoint: ~4 chars/token, {seconds_per_input_token * 1e6:.0f} µs simulated prefill per input token;"
+          " the provider-cached row is what is sent once genai.caching is available)")
+    return prefix_tokens, results
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def benchmark_grading_load(submissions=200, worker_counts=(1, 4, 16), latency="lognormal:0.25,0.5",
+                           error_rate=0.02, rate_limit_per_minute=0):
+    """Throughput and tail latency of queue -> grade_submission -> local stand-in backend"""
+    import tempfile
+    import threading
+    import automated_grading
+    from grader_backends import LocalGraderBackend
+    from grading_queue import GradingQueue
+
+    print("=" * 60)
+    print("📊 GRADING PIPELINE LOAD BENCHMARK")
+    print("=" * 60)
+    print(f"{submissions} submissions, local backend latency {latency}, "
+          f"error rate {error_rate:.0%}, rate limit {rate_limit_per_minute or 'none'}/min")
+
+    original_dir = os.getcwd()
+    original_backend = automated_grading.grader_backend
+    original_cache_bytes = automated_grading.grading_cache.max_bytes
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='ags_bench_') as directory:
+        try:
+            import app as ags_app
+            os.chdir(directory)  # app.get_db() opens ./ags.db
+            ags_app.init_db()
+            automated_grading.grading_cache.max_bytes = 0  # measure the backend, not the cache
+            conn = ags_app.get_db()
+            conn.execute('''INSERT INTO events (course_id, event_name, event_type, answer_text)
+                            VALUES (1, 'Load test', 'assignment', ?)''', (SAMPLE_PARAGRAPH * 4,))
+            conn.commit()
+            conn.close()
+
+            for workers in worker_counts:
+                backend = automated_grading.grader_backend = LocalGraderBackend(
+                    latency=latency, error_rate=error_rate, rate_limit_per_minute=rate_limit_per_minute)
+                enqueued_at = {}
+                latencies = []
+                finished = threading.Event()
+
+                def record(submission_id, error=None):
+                    latencies.append(time.perf_counter() - enqueued_at[submission_id])
+                    if len(latencies) == submissions:
+                        finished.set()
+
+                def handler(submission_id):
+                    # Backend errors raise here and the job is retried with backoff
+                    ags_app.grade_submission(submission_id)
+                    record(submission_id)
+
+                def give_up(submission_id, error):
+                    ags_app.mark_grading_failed(submission_id, error)
+                    record(submission_id)
+
+                queue = GradingQueue(ags_app.get_db, handler, on_give_up=give_up, workers=workers)
+                conn = ags_app.get_db()
+                start = time.perf_counter()
+                for index in range(submissions):
+                    # One submission per student and assignment: new students for every worker count
+                    student_id = len(results) * submissions + index
+                    cursor = conn.execute('''INSERT INTO submissions (event_id, student_id, submission_text)
+                                             VALUES (1, ?, ?)''',
+                                          (student_id, f"Student {student_id}: " + SAMPLE_PARAGRAPH))
+                    enqueued_at[cursor.lastrowid] = time.perf_counter()
+                    queue.enqueue(cursor.lastrowid, conn)
+                conn.commit()
+                conn.close()
+                queue.start()
+                finished.wait()
+                elapsed = time.perf_counter() - start
+                queue.stop()
+                results[workers] = {
+                    'throughput': submissions / elapsed,
+                    'p50': percentile(latencies, 0.50),
+                    'p95': percentile(latencies, 0.95),
+                    'p99': percentile(latencies, 0.99),
+                    **backend.stats(),
+                }
+        finally:
+            os.chdir(original_dir)
+            automated_grading.grader_backend = original_backend
+            automated_grading.grading_cache.max_bytes = original_cache_bytes
+
+    print("\n" + "-" * 60)
+    print(f"{'workers':>7} {'grades/s':>9} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>7} {'429s':>5}")
+    for workers, row in results.items():
+        print(f"{workers:>7} {row['throughput']:>9.2f} {row['p50']:>7.2f} {row['p95']:>7.2f} "
+              f"{row['p99']:>7.2f} {row['errors']:>7} {row['rate_limited']:>5}")
+    print("(latency = enqueue to graded row written, including retries after backend errors; "
+          "all submissions are enqueued at once)")
+    return results
+
+def benchmark_streaming(submissions=10, latency="lognormal:4.0,0.3"):
+    """Time to first feedback over the SSE grading stream vs waiting for the blocking grade"""
+    import statistics
+    import tempfile
+    import automated_grading
+    from grader_backends import LocalGraderBackend
+
+    print("=" * 60)
+    print("📊 STREAMING FEEDBACK BENCHMARK")
+    print("=" * 60)
+    print(f"{submissions} submissions per mode, local backend latency {latency}")
+
+    original_dir = os.getcwd()
+    original_backend = automated_grading.grader_backend
+    original_cache_bytes = automated_grading.grading_cache.max_bytes
+    blocking, first_feedback, stream_total = [], [], []
+    with tempfile.TemporaryDirectory(prefix='ags_bench_') as directory:
+        try:
+            import app as ags_app
+            os.chdir(directory)  # app.get_db() opens ./ags.db
+            ags_app.init_db()
+            automated_grading.grading_cache.max_bytes = 0  # measure the backend, not the cache
+            automated_grading.grader_backend = LocalGraderBackend(latency=latency)
+            conn = ags_app.get_db()
+            conn.execute('''INSERT INTO courses (course_name, course_code, professor_id)
+                            VALUES ('Benchmark', 'BENCH', 1)''')
+            conn.execute('''INSERT INTO events (course_id, event_name, event_type, answer_text)
+                            VALUES (1, 'Streaming test', 'assignment', ?)''', (SAMPLE_PARAGRAPH * 4,))
+            conn.commit()
+
+            def add_submission(student_id, stream):
+                cursor = conn.execute('''INSERT INTO submissions (event_id, student_id, submission_text, grading_status)
+                                         VALUES (1, ?, ?, 'pending')''',
+                                      (student_id, f"Student {student_id}: " + SAMPLE_PARAGRAPH))
+                ags_app.grading_job_queue.enqueue(cursor.lastrowid, conn,
+                                                  delay_seconds=ags_app.STREAM_CLAIM_SECONDS if stream else 0)
+                conn.commit()
+                return cursor.lastrowid
+
+            # Blocking: the student sees nothing until the whole response is graded and stored
+            for index in range(submissions):
+                submission_id = add_submission(index, stream=False)
+                start = time.perf_counter()
+                ags_app.grade_submission(submission_id)
+                blocking.append(time.perf_counter() - start)
+                ags_app.grading_job_queue.complete(ags_app.grading_job_queue.claim()[0])
+
+            # Streaming: the grading-stream request claims the job and forwards chunks as they arrive
+            client = ags_app.app.test_client()
+            for index in range(submissions):
+                student_id = 1000 + index
+                submission_id = add_submission(student_id, stream=True)
+                with client.session_transaction() as client_session:
+                    client_session['user_id'] = student_id
+                    client_session['user_type'] = 'student'
+                start = time.perf_counter()
+                response = client.get(f'/api/submissions/{submission_id}/grading-stream', buffered=False)
+                first = None
+                for data in response.response:
+                    if first is None and b'event: feedback' in data:
+                        first = time.perf_counter() - start
+                stream_total.append(time.perf_counter() - start)
+                first_feedback.append(first if first is not None else stream_total[-1])
+                response.close()
+            conn.close()
+        finally:
+            os.chdir(original_dir)
+            automated_grading.grader_backend = original_backend
+            automated_grading.grading_cache.max_bytes = original_cache_bytes
+
+    print("\n" + "-" * 60)
+    print(f"{'mode':<34} {'median s':>9} {'max s':>7}")
+    print(f"{'blocking: until grade stored':<34} {statistics.median(blocking):>9.2f} {max(blocking):>7.2f}")
+    print(f"{'streaming: first feedback event':<34} {statistics.median(first_feedback):>9.2f} "
+          f"{max(first_feedback):>7.2f}")
+    print(f"{'streaming: until done event':<34} {statistics.median(stream_total):>9.2f} {max(stream_total):>7.2f}")
+    return {'blocking': blocking, 'first_feedback': first_feedback, 'stream_total': stream_total}
+
+# Regression corpus of grading responses in the shapes models have returned:
+# (expected grade, response text). JSON entries come from the structured mode.
+GRADING_RESPONSE_CORPUS = [
+    (8, "Grade: 8/10\n\n**Detailed Feedback:**\n\n**Strengths:**\n- Correct use of the formula"),
+    (8, "**Grade:** 8/10\n\n**Strengths:**\n- Clear working for question 2"),
+    (7, "Grade: 7.5/10\n\nMostly correct; question 3 lacks an explanation."),
+    (6, "## Grade\n6 out of 10\n\n### Strengths\n- Question 1 is correct"),
+    (9, "Final Grade: 9 / 10\n\nExcellent work overall."),
+    (5, "Grade: [5]/10\n\n**Areas for Improvement:**\n- Show all 3 steps"),
+    (6, "I reviewed all 3 answers against the answer key.\n\nOverall score - 6/10\n\n"
+        "**Strengths:**\n- Question 1 is correct"),
+    (4, "Thank you for the submission. Below is my evaluation of questions 1 to 3.\n\n"
+        "**Question 1:** correct\n**Question 2:** the area uses the diameter instead of the radius\n"
+        "**Question 3:** incomplete\n\n**Overall:** 4/10"),
+    (7, "Score: Question 1 fully correct, question 2 minor slip.\n\nTotal: 7/10"),
+    (10, "Grade: 10/10\n\nPerfect answers to all 3 questions."),
+    (3, "The student earns 3 points out of 10.\n\nMost answers are missing."),
+    (8, "**Evaluation**\n\nThe submission answers all 3 questions.\n\n| Criterion | Score |\n"
+        "|---|---|\n| Correctness | 4/4 |\n| Overall | 8/10 |"),
+    (8, '{"grade": 8, "strengths": ["Correct area of 25 pi"], "improvements": ["Explain question 3"], '
+        '"suggestions": ["Show each step"], "question_comments": '
+        '[{"question": "Question 2", "comment": "Correct, 78.54 square units"}]}'),
+    (6, '```json\n{"grade": 6, "strengths": ["Question 1 correct"], "improvements": ["Units missing in 2"], '
+        '"suggestions": [], "question_comments": []}\n```'),
+    (9, '{\n  "grade": 9,\n  "strengths": ["All 3 answers correct"],\n  "improvements": ["Minor notation"],\n'
+        '  "suggestions": ["Label the triangle sides"],\n  "question_comments": [\n'
+        '    {"question": "1", "comment": "2 + 2 = 4, correct"},\n'
+        '    {"question": "3", "comment": "a^2 + b^2 = c^2 stated for right triangles"}\n  ]\n}'),
+    (5, '{"grade": 5.0, "strengths": ["Attempted every question"], "improvements": ["Question 2 uses 2 pi r"], '
+        '"suggestions": ["Review the area formula"], "question_comments": []}'),
+    (7, '{"grade": 7, "strengths": ["Good explanation of question 3"], "improvements": ["Question 2'),
+    (9, '{"question_comments": [{"question": "Question 3", "comment": "Correct for all 3 sides"}], '
+        '"strengths": ["Clear working"], "improvements": [], "suggestions": [], "grade": 9}'),
+]
+
+def benchmark_grade_parsing():
+    """Parse-failure rate of the text extractor and the structured parser over saved responses"""
+    import contextlib
+    import io
+    import automated_grading
+
+    print("=" * 60)
+    print("📊 GRADE PARSING BENCHMARK")
+    print("=" * 60)
+    corpus = list(GRADING_RESPONSE_CORPUS)
+    # Real responses saved in the grading cache (no expected grade known)
+    cache_dir = automated_grading.grading_cache.directory
+    if os.path.isdir(cache_dir):
+        for name in sorted(os.listdir(cache_dir)):
+            if name.endswith('.txt'):
+                with open(os.path.join(cache_dir, name), encoding='utf-8') as f:
+                    corpus.append((None, f.read()))
+    print(f"{len(GRADING_RESPONSE_CORPUS)} corpus responses, "
+          f"{len(corpus) - len(GRADING_RESPONSE_CORPUS)} from {cache_dir}")
+
+    parsers = {
+        'extract_grade_from_response': lambda text: automated_grading.extract_grade_from_response(text)[0],
+        'parse_grading_response': lambda text: automated_grading.parse_grading_response(text)[0],
+    }
+    results = {}
+    for name, parse in parsers.items():
+        for kind in ('text', 'json'):
+            responses = [(expected, text) for expected, text in corpus
+                         if text.lstrip().startswith(('{', '`')) == (kind == 'json')]
+            failed = wrong = 0
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                grades = [parse(text) for _, text in responses]
+            elapsed = time.perf_counter() - start
+            for (expected, _), grade in zip(responses, grades):
+                if grade is None:
+                    failed += 1
+                elif expected is not None and grade != expected:
+                    wrong += 1
+            results[(name, kind)] = {
+                'responses': len(responses),
+                'failed': failed,
+                'wrong': wrong,
+                'failure_rate': (failed + wrong) / len(responses) if responses else 0.0,
+                'us_per_response': elapsed / len(responses) * 1e6 if responses else 0.0,
+            }
+
+    print("\n" + "-" * 60)
+    print(f"{'parser':<28} {'format':<6} {'n':>4} {'no grade':>9} {'wrong':>6} {'fail %':>7} {'µs':>7}")
+    for (name, kind), row in results.items():
+        print(f"{name:<28} {kind:<6} {row['responses']:>4} {row['failed']:>9} {row['wrong']:>6} "
+              f"{row['failure_rate']:>7.0%} {row['us_per_response']:>7.1f}")
+    print("(fail % counts responses with no grade or a grade different from the expected one)")
+    return results
+
+def benchmark_chunked(questions=20, latency="lognormal:0.5,0.3", seconds_per_kb=2.0, runs=3):
+    """
+    End-to-end latency of whole-prompt vs per-question grading of a long
+    assignment, on the text as stored (preprocessed, with its source text)
+    and with the shared question pool at its configured size
+    """
+    import statistics
+    import automated_grading
+    from grader_backends import LocalGraderBackend
+    from text_extraction import preprocess_text
+
+    print("=" * 60)
+    print("📊 CHUNKED GRADING BENCHMARK")
+    print("=" * 60)
+    answer_source = "\n\n".join(f"{number}. " + SAMPLE_PARAGRAPH * (1 + number % 3)
+                                for number in range(1, questions + 1))
+    # What the routes store: convert_pdf_to_txt preprocesses the extracted text
+    answer_key = preprocess_text(answer_source)
+    print(f"{questions} questions, {len(answer_key) / 1024:.1f} KB answer key, "
+          f"local backend latency {latency} + {seconds_per_kb}s/KB of submission")
+
+    class TimedBackend(LocalGraderBackend):
+        """Records the latency of every call"""
+
+        def generate(self, prefix, student_answer_text):
+            start = time.perf_counter()
+            try:
+                return super().generate(prefix, student_answer_text)
+            finally:
+                self.durations.append(time.perf_counter() - start)
+
+    originals = (automated_grading.grader_backend, automated_grading.grading_cache.max_bytes,
+                 automated_grading.CHUNKED_GRADING, automated_grading.CHUNKED_GRADING_WORKERS,
+                 automated_grading._question_pool)
+    pool_sizes = {'chunked': originals[3], 'chunked_pool_per_question': questions}
+    results = {'whole': [], 'chunked': [], 'chunked_pool_per_question': [], 'slowest_question': []}
+    try:
+        automated_grading.grading_cache.max_bytes = 0  # measure the backend, not the cache
+        for run in range(runs):
+            submission_source = f"Student {run}\n\n" + answer_source
+            submission = preprocess_text(submission_source)
+            for mode in ('whole', 'chunked', 'chunked_pool_per_question'):
+                backend = automated_grading.grader_backend = TimedBackend(
+                    latency=latency, seed=run, seconds_per_kb=seconds_per_kb)
+                backend.durations = []
+                automated_grading.CHUNKED_GRADING = mode != 'whole'
+                if mode != 'whole' and automated_grading.CHUNKED_GRADING_WORKERS != pool_sizes[mode]:
+                    automated_grading.CHUNKED_GRADING_WORKERS = pool_sizes[mode]
+                    automated_grading._question_pool = None
+                start = time.perf_counter()
+                response = automated_grading.get_enhanced_response("", answer_key, submission,
+                                                                   answer_source, submission_source)
+                results[mode].append(time.perf_counter() - start)
+                assert response.startswith("Grade:"), response[:200]
+                assert len(backend.durations) == (1 if mode == 'whole' else questions), len(backend.durations)
+                if mode == 'chunked':
+                    results['slowest_question'].append(max(backend.durations))
+    finally:
+        (automated_grading.grader_backend, automated_grading.grading_cache.max_bytes,
+         automated_grading.CHUNKED_GRADING, automated_grading.CHUNKED_GRADING_WORKERS,
+         automated_grading._question_pool) = originals
+
+    workers = pool_sizes['chunked']
+    rows = [('whole prompt', results['whole']),
+            (f"per question, {workers} workers (configured)", results['chunked']),
+            ('per question, slowest single question', results['slowest_question']),
+            (f"per question, {questions} workers (one per question)", results['chunked_pool_per_question'])]
+    print("\n" + "-" * 60)
+    print(f"{'mode':<44} {'median s':>9}")
+    for label, values in rows:
+        print(f"{label:<44} {statistics.median(values):>9.2f}")
+    print(f"(questions beyond AGS_CHUNKED_GRADING_WORKERS queue for the shared pool: "
+          f"about {-(-questions // workers)} rounds of per-question latency here)")
+    return results
+
+# Questions for the synthetic pre-grading corpus: (answer key, correct paraphrase, wrong answer)
+PREGRADE_QUESTIONS = [
+    ("2 + 2 = 4", "Adding two and two gives four.", "2 + 2 = 5"),
+    ("The area of a circle with radius 5 is 25 pi, about 78.54 square units.",
+     "With r = 5 we get pi times 25, roughly 78.5 units squared.",
+     "The area of a circle with radius 5 is 10 pi, about 31.4 units."),
+    ("The Pythagorean theorem states that in a right triangle the square of the hypotenuse "
+     "equals the sum of the squares of the other two sides.",
+     "For right-angled triangles a^2 + b^2 = c^2, where c is the longest side.",
+     "The Pythagorean theorem says all three angles of a triangle add up to 180 degrees."),
+    ("Newton's second law states that force equals mass times acceleration, F = m a.",
+     "Net force is the product of an object's mass and its acceleration.",
+     "Newton's second law states that every action has an equal and opposite reaction."),
+    ("Photosynthesis converts carbon dioxide and water into glucose and oxygen using light energy.",
+     "Plants use sunlight to turn CO2 and H2O into sugar, releasing O2.",
+     "Photosynthesis breaks down glucose to release energy in the mitochondria."),
+    ("The derivative of x squared is 2 x.", "d/dx of x^2 equals twice x.", "The derivative of x squared is x cubed over 3."),
+    ("Water boils at 100 degrees Celsius at sea level.", "At normal atmospheric pressure H2O boils at 100 C.",
+     "Water boils at 50 degrees Celsius at sea level."),
+    ("The mitochondria produce ATP through cellular respiration.",
+     "Cellular respiration in the mitochondrion generates the cell's ATP.",
+     "The mitochondria store the genetic information of the cell."),
+]
+
+def make_pregrade_corpus(submissions=400, seed=7):
+    """
+    Synthetic held-out corpus of (answer key, submission, reference grade).
+    Each question is answered verbatim, paraphrased, wrongly or not at all;
+    the reference grade is the share of correct answers, as an AI grader
+    would give it. Includes blank submissions and copies of the key.
+    """
+    import random
+
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(submissions):
+        questions = rng.sample(PREGRADE_QUESTIONS, rng.randint(3, 6))
+        answer_key = "\n".join(f"{number}. {key}" for number, (key, _, _) in enumerate(questions, 1))
+        kind = rng.random()
+        if kind < 0.05:
+            corpus.append((answer_key, rng.choice(["", "n/a", "I don't know"]), 0))
+            continue
+        if kind < 0.10:
+            corpus.append((answer_key, answer_key, 10))
+            continue
+        lines, correct = [], 0
+        for number, (key, paraphrase, wrong) in enumerate(questions, 1):
+            choice = rng.choices(['verbatim', 'paraphrase', 'wrong', 'missing'], weights=(4, 3, 2, 1))[0]
+            if choice == 'missing':
+                continue
+            correct += choice != 'wrong'
+            lines.append(f"{number}. " + {'verbatim': key, 'paraphrase': paraphrase, 'wrong': wrong}[choice])
+        corpus.append((answer_key, "\n".join(lines), round(10 * correct / len(questions))))
+    return corpus
+
+def load_graded_corpus(path='ags.db'):
+    """(answer key, submission, AI grade) of every AI-graded submission in a database"""
+    import sqlite3
+
+    if not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('''SELECT e.answer_text, s.submission_text, s.grade
+                               FROM submissions s JOIN events e ON s.event_id = e.id
+                               WHERE s.grading_status = 'completed' AND s.grade IS NOT NULL
+                                 AND e.answer_text IS NOT NULL AND e.answer_text != '' ''').fetchall()
+    except sqlite3.Error:
+        return []
+    finally:
+        conn.close()
+
+def benchmark_pregrade(submissions=400):
+    """Latency and precision/recall of the lexical pre-grader against reference (AI) grades"""
+    import statistics
+    import pregrader
+
+    print("=" * 60)
+    print("📊 PRE-GRADER BENCHMARK")
+    print("=" * 60)
+    corpus = load_graded_corpus()
+    if corpus:
+        print(f"{len(corpus)} AI-graded submissions from ags.db")
+    else:
+        corpus = make_pregrade_corpus(submissions)
+        print(f"{len(corpus)} synthetic submissions (no AI-graded submissions in ags.db)")
+
+    results = [(pregrader.pregrade(answer_key, submission), grade) for answer_key, submission, grade in corpus]
+    milliseconds = [result.seconds * 1000 for result, _ in results]
+    errors = [abs(result.provisional_grade - grade) for result, grade in results]
+
+    def precision_recall(decision, tolerance):
+        """A decision is right when the provisional grade is within `tolerance` of the reference"""
+        chosen = [error for (result, _), error in zip(results, errors) if result.decision == decision]
+        right = sum(error <= tolerance for error in chosen)
+        eligible = sum(error <= tolerance for error in errors)
+        return len(chosen), (right / len(chosen) if chosen else 1.0), (right / eligible if eligible else 0.0)
+
+    skipped, skip_precision, skip_recall = precision_recall(pregrader.SKIP, 1)
+    deprioritized, low_precision, low_recall = precision_recall(pregrader.DEPRIORITIZE, 2)
+
+    print("\n" + "-" * 60)
+    print(f"Pre-grade latency: median {statistics.median(milliseconds):.2f}ms, "
+          f"p99 {percentile(milliseconds, 0.99):.2f}ms")
+    print(f"Provisional grade: mean absolute error {statistics.mean(errors):.2f}, "
+          f"within 1 point {sum(error <= 1 for error in errors) / len(errors):.0%}")
+    print(f"{'decision':<14} {'count':>6} {'share':>6} {'precision':>10} {'recall':>7}  (right = within)")
+    print(f"{'skip':<14} {skipped:>6} {skipped / len(results):>6.0%} {skip_precision:>10.0%} "
+          f"{skip_recall:>7.0%}  1 point")
+    print(f"{'deprioritize':<14} {deprioritized:>6} {deprioritized / len(results):>6.0%} {low_precision:>10.0%} "
+          f"{low_recall:>7.0%}  2 points")
+    print("(recall = share of submissions whose provisional grade was that close that got the decision)")
+    return {'skip': (skipped, skip_precision, skip_recall),
+            'deprioritize': (deprioritized, low_precision, low_recall),
+            'mean_absolute_error': statistics.mean(errors)}
+
+def make_near_duplicate_corpus(submissions=10000, pairs=200, words=250, edit_rate=0.015, seed=11):
+    """
+    Synthetic submissions of random words, plus `pairs` planted near-duplicates:
+    copies of an earlier submission with `edit_rate` of the words replaced.
+    Returns (texts, {copy index: original index}).
+    """
+    import random
+
+    rng = random.Random(seed)
+    vocabulary = [f"w{index}" for index in range(3000)]
+    texts, planted = [], {}
+    copies = set(rng.sample(range(1, submissions), pairs))
+    for index in range(submissions):
+        if index in copies:
+            original = rng.randrange(index)
+            text = texts[original].split()
+            for position in rng.sample(range(len(text)), int(len(text) * edit_rate)):
+                text[position] = rng.choice(vocabulary)
+            texts.append(" ".join(text))
+            planted[index] = original
+        else:
+            texts.append(" ".join(rng.choices(vocabulary, k=words)))
+    return texts, planted
+
+def benchmark_near_duplicates(sizes=(1000, 2500, 5000, 10000), pairs=400, queries=100):
+    """Indexing throughput and near-duplicate query latency (LSH vs scanning every signature) as submissions grow"""
+    import random
+    import sqlite3
+    import statistics
+    import numpy as np
+    import near_duplicates
+    from migrations import create_near_duplicate_tables
+
+    print("=" * 60)
+    print("📊 NEAR-DUPLICATE INDEX BENCHMARK")
+    print("=" * 60)
+    print(f"{near_duplicates.LSH_BANDS} bands x {near_duplicates.LSH_ROWS} rows, "
+          f"threshold {near_duplicates.NEAR_DUPLICATE_THRESHOLD}")
+    texts, planted = make_near_duplicate_corpus(max(sizes), pairs)
+
+    def naive_near_duplicates(conn, submission_id):
+        """Compare against every signature of the event"""
+        event_id, signature = conn.execute('SELECT event_id, signature FROM submission_minhash WHERE submission_id = ?',
+                                           (submission_id,)).fetchone()
+        signature = np.frombuffer(signature, dtype=np.uint32)
+        matches = []
+        for other_id, other in conn.execute('SELECT submission_id, signature FROM submission_minhash '
+                                            'WHERE event_id = ? AND submission_id != ?', (event_id, submission_id)):
+            similarity = near_duplicates.estimated_similarity(signature, np.frombuffer(other, dtype=np.uint32))
+            if similarity >= near_duplicates.NEAR_DUPLICATE_THRESHOLD:
+                matches.append((other_id, similarity))
+        return matches
+
+    rows = []
+    for size in sizes:
+        conn = sqlite3.connect(':memory:')
+        create_near_duplicate_tables(conn)
+        start = time.perf_counter()
+        for submission_id, text in enumerate(texts[:size], 1):
+            near_duplicates.index_submission(conn, submission_id, 1, text)
+        conn.commit()
+        index_seconds = time.perf_counter() - start
+
+        copies = [index for index in planted if index < size]
+        rng = random.Random(size)
+        query_ids = [index + 1 for index in rng.sample(copies, min(len(copies), queries // 2))]
+        query_ids += rng.sample(range(1, size + 1), queries - len(query_ids))
+
+        lsh_ms, naive_ms, found, expected = [], [], 0, 0
+        for submission_id in query_ids:
+            start = time.perf_counter()
+            matches = near_duplicates.find_near_duplicates(conn, submission_id)
+            lsh_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            naive = naive_near_duplicates(conn, submission_id)
+            naive_ms.append((time.perf_counter() - start) * 1000)
+            expected += len(naive)
+            found += len({match_id for match_id, _ in matches} & {match_id for match_id, _ in naive})
+
+        start = time.perf_counter()
+        event_pairs = near_duplicates.find_event_near_duplicates(conn, 1)
+        pairs_seconds = time.perf_counter() - start
+        true_pairs = {(original + 1, copy + 1) for copy, original in planted.items() if copy < size}
+        pair_recall = len(true_pairs & {(first, second) for first, second, _ in event_pairs}) / max(len(true_pairs), 1)
+        conn.close()
+
+        rows.append((size, size / index_seconds, statistics.median(lsh_ms), statistics.median(naive_ms),
+                     found / expected if expected else 1.0, len(event_pairs), pair_recall, pairs_seconds))
+        print(f"  {size} submissions indexed")
+
+    print("\n" + "-" * 60)
+    print(f"{'submissions':>11} {'index/s':>8} {'LSH ms':>7} {'scan ms':>8} {'recall':>7} "
+          f"{'pairs':>6} {'pair recall':>11} {'all pairs s':>11}")
+    for size, rate, lsh, naive, recall, found_pairs, pair_recall, pairs_seconds in rows:
+        print(f"{size:>11} {rate:>8.0f} {lsh:>7.2f} {naive:>8.2f} {recall:>7.0%} "
+              f"{found_pairs:>6} {pair_recall:>11.0%} {pairs_seconds:>11.2f}")
+    print("(LSH/scan ms = median per-submission query; recall = LSH matches / full-scan matches;")
+    print(" pair recall = planted near-duplicate pairs found by the assignment-wide query)")
+    return rows
+
+def benchmark_metrics(calls=200000, threads=8):
+    """Overhead of recording a stage timing, single-threaded and contended, and of rendering a scrape"""
+    import threading
+    import metrics
+
+    print("=" * 60)
+    print("📊 METRICS OVERHEAD BENCHMARK")
+    print("=" * 60)
+
+    def per_call(func, count):
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        return (time.perf_counter() - start) / count * 1e9
+
+    def empty_block():
+        pass
+
+    def timed_block():
+        with metrics.time_stage("benchmark"):
+            pass
+
+    baseline = per_call(empty_block, calls)
+    observe_ns = per_call(lambda: metrics.observe_stage("benchmark", 0.0042), calls)
+    timed_ns = per_call(timed_block, calls)
+    fallback_ns = per_call(lambda: metrics.count_fallback("benchmark"), calls)
+
+    def worker():
+        for _ in range(calls // threads):
+            metrics.observe_stage("benchmark", 0.0042)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    contended_ns = (time.perf_counter() - start) / (calls // threads * threads) * 1e9
+
+    for index in range(40):
+        metrics.observe_stage(f"stage_{index}", 0.01 * index)
+    start = time.perf_counter()
+    for _ in range(100):
+        text = metrics.render()
+    render_ms = (time.perf_counter() - start) / 100 * 1000
+
+    # A graded submission records about 15 stage timings and a few counters
+    per_submission_us = (15 * timed_ns + 5 * fallback_ns) / 1000
+
+    print(f"observe_stage:               {observe_ns:8.0f} ns/call")
+    print(f"time_stage block:            {timed_ns - baseline:8.0f} ns/call")
+    print(f"count_fallback:              {fallback_ns:8.0f} ns/call")
+    print(f"observe_stage, {threads} threads:     {contended_ns:8.0f} ns/call")
+    print(f"render ({len(text.splitlines())} lines):          {render_ms:8.2f} ms/scrape")
+    print(f"Per submission (~20 records): {per_submission_us:7.1f} µs")
+    return {'observe_ns': observe_ns, 'time_stage_ns': timed_ns - baseline, 'contended_ns': contended_ns,
+            'render_ms': render_ms, 'per_submission_us': per_submission_us}
+
+def seed_course_database(ags_app, students=200, assignments=20, submitted_per_assignment=50):
+    """One professor, one course with `assignments` events, enrolled students and some submissions"""
+    conn = ags_app.get_db()
+    conn.execute('''INSERT INTO users (username, email, password_hash, user_type)
+                    VALUES ('professor', 'professor@example.com', '-', 'professor')''')
+    conn.execute('''INSERT INTO courses (course_name, course_code, professor_id) VALUES ('Load', 'LOAD1', 1)''')
+    conn.executemany('''INSERT INTO events (course_id, event_name, event_type, description)
+                        VALUES (1, ?, 'assignment', ?)''',
+                     [(f"Assignment {index}", SAMPLE_PARAGRAPH) for index in range(assignments)])
+    conn.executemany('''INSERT INTO users (username, email, password_hash, user_type)
+                        VALUES (?, ?, '-', 'student')''',
+                     [(f"student{index}", f"student{index}@example.com") for index in range(students)])
+    student_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE user_type = 'student'")]
+    conn.executemany('INSERT INTO enrollments (student_id, course_id) VALUES (?, 1)',
+                     [(student_id,) for student_id in student_ids])
+    conn.executemany('''INSERT INTO submissions (event_id, student_id, submission_text, grading_status)
+                        VALUES (?, ?, ?, 'pending')''',
+                     [(event_id, student_id, f"Student {student_id}: " + SAMPLE_PARAGRAPH)
+                      for event_id in range(1, assignments + 1)
+                      for student_id in student_ids[:submitted_per_assignment]])
+    conn.commit()
+    conn.close()
+    return student_ids
+
+def benchmark_database(threads=16, requests_per_thread=150, write_share=0.2, students=200, assignments=20):
+    """
+    Concurrent reads and submissions through the Flask test client: a new
+    rollback-journal connection per request vs pooled WAL connections
+    """
+    import io
+    import random
+    import sqlite3
+    import tempfile
+    import threading
+    import database
+
+    print("=" * 60)
+    print("📊 DATABASE CONCURRENCY BENCHMARK")
+    print("=" * 60)
+    print(f"{threads} threads x {requests_per_thread} requests, {write_share:.0%} submissions, "
+          f"{students} students, {assignments} assignments")
+
+    import app as ags_app
+
+    def legacy_get_db():
+        """get_db before pooling"""
+        conn = sqlite3.connect('ags.db')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    original_dir = os.getcwd()
+    original_get_db = ags_app.get_db
+    original_extract = ags_app.extract_text_from_pdf
+    original_start = ags_app.grading_job_queue.start
+    results = {}
+    try:
+        # Measure the database, not PDF extraction or grading
+        ags_app.extract_text_from_pdf = lambda pdf_file: "Submitted answer. " + SAMPLE_PARAGRAPH
+        ags_app.grading_job_queue.start = lambda: None
+        for mode in ('per-request', 'pooled'):
+            with tempfile.TemporaryDirectory(prefix='ags_bench_') as directory:
+                os.chdir(directory)
+                ags_app.init_db()
+                student_ids = seed_course_database(ags_app, students, assignments)
+                database.close_pool()
+                if mode == 'per-request':
+                    conn = sqlite3.connect('ags.db')
+                    conn.execute('PRAGMA journal_mode = DELETE')
+                    conn.close()
+                    ags_app.get_db = legacy_get_db
+                else:
+                    ags_app.get_db = original_get_db
+
+                # Each (student, assignment) pair not submitted yet can be submitted once
+                open_pairs = [(student_id, event_id) for event_id in range(1, assignments + 1)
+                              for student_id in student_ids[50:]]
+                random.Random(1).shuffle(open_pairs)
+                pairs_lock = threading.Lock()
+                read_ms, write_ms, errors = [], [], []
+
+                def client_thread(seed):
+                    rng = random.Random(seed)
+                    client = ags_app.app.test_client()
+                    for _ in range(requests_per_thread):
+                        if rng.random() < write_share:
+                            with pairs_lock:
+                                student_id, event_id = open_pairs.pop()
+                            with client.session_transaction() as flask_session:
+                                flask_session['user_id'], flask_session['user_type'] = student_id, 'student'
+                            start = time.perf_counter()
+                            response = client.post(f'/api/assignments/{event_id}/submit',
+                                                   data={'submission_file': (io.BytesIO(b'%PDF-1.4'), 'answer.pdf')})
+                            timings = write_ms
+                        else:
+                            if rng.random() < 0.1:
+                                user = (1, 'professor')
+                                path = f'/api/assignments/{rng.randint(1, assignments)}'
+                            else:
+                                user = (rng.choice(student_ids), 'student')
+                                path = rng.choice([f'/api/assignments/{rng.randint(1, assignments)}',
+                                                   '/api/student/dashboard', '/api/courses/1'])
+                            with client.session_transaction() as flask_session:
+                                flask_session['user_id'], flask_session['user_type'] = user
+                            start = time.perf_counter()
+                            response = client.get(path)
+                            timings = read_ms
+                        timings.append((time.perf_counter() - start) * 1000)
+                        if response.status_code >= 400:
+                            errors.append(response.get_data(as_text=True)[:120])
+
+                workers = [threading.Thread(target=client_thread, args=(seed,)) for seed in range(threads)]
+                start = time.perf_counter()
+                for thread in workers:
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+                database.close_pool()
+                os.chdir(original_dir)
+
+                results[mode] = {
+                    'throughput': (len(read_ms) + len(write_ms)) / elapsed,
+                    'read_p50': percentile(read_ms, 0.50), 'read_p99': percentile(read_ms, 0.99),
+                    'write_p50': percentile(write_ms, 0.50), 'write_p99': percentile(write_ms, 0.99),
+                    'errors': len(errors),
+                }
+                if errors:
+                    print(f"  {mode}: {len(errors)} failed requests, e.g. {errors[0]!r}")
+    finally:
+        os.chdir(original_dir)
+        ags_app.get_db = original_get_db
+        ags_app.extract_text_from_pdf = original_extract
+        ags_app.grading_job_queue.start = original_start
+
+    print("\n" + "-" * 60)
+    print(f"{'connections':<12} {'req/s':>7} {'read p50':>9} {'read p99':>9} {'write p50':>10} "
+          f"{'write p99':>10} {'errors':>7}")
+    for mode, row in results.items():
+        print(f"{mode:<12} {row['throughput']:>7.0f} {row['read_p50']:>7.2f}ms {row['read_p99']:>7.2f}ms "
+              f"{row['write_p50']:>8.2f}ms {row['write_p99']:>8.2f}ms {row['errors']:>7}")
+    return results
+
+def benchmark_indexes(students=3000, assignments=40, submitted_per_assignment=2000, runs=200):
+    """Latency of the hot route queries (migrations.ROUTE_QUERIES) before and after the index migration"""
+    import random
+    import tempfile
+    import database
+    import migrations
+
+    print("=" * 60)
+    print("📊 ROUTE QUERY INDEX BENCHMARK")
+    print("=" * 60)
+    print(f"{students} students, {assignments} assignments, "
+          f"{assignments * submitted_per_assignment} submissions")
+
+    import app as ags_app
+
+    original_dir = os.getcwd()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix='ags_bench_') as directory:
+            os.chdir(directory)
+            conn = database.connect()
+            migrations.migrate(conn, target=migrations.LATEST_VERSION - 1)
+            conn.close()
+            student_ids = seed_course_database(ags_app, students, assignments, submitted_per_assignment)
+            rng = random.Random(3)
+            # Random students and assignments of the seeded course (course and professor id 1)
+            query_params = {
+                'enrollment check': lambda: (rng.choice(student_ids), 1),
+                'submission lookup': lambda: (rng.randint(1, assignments), rng.choice(student_ids)),
+                'student dashboard': lambda: (rng.choice(student_ids),),
+                'assignment submissions': lambda: (rng.randint(1, assignments),),
+                'student performance': lambda: (rng.choice(student_ids), 1),
+            }
+            for label in ('before', 'after'):
+                conn = database.connect()
+                if label == 'after':
+                    migrations.migrate(conn)
+                for name, sql, params in migrations.ROUTE_QUERIES:
+                    timings = []
+                    for _ in range(runs):
+                        values = query_params.get(name, lambda: params)()
+                        start = time.perf_counter()
+                        conn.execute(sql, values).fetchall()
+                        timings.append((time.perf_counter() - start) * 1000)
+                    results.setdefault(name, {})[label] = sorted(timings)[len(timings) // 2]
+                conn.close()
+            database.close_pool()
+    finally:
+        os.chdir(original_dir)
+
+    print("\n" + "-" * 60)
+    print(f"{'query':<32} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, row in results.items():
+        print(f"{name:<32} {row['before']:>10.3f} {row['after']:>10.3f} {row['before'] / row['after']:>7.0f}x")
+    print("(median of", runs, "runs per query)")
+    return results
+
+BENCHMARKS = {
+    'ocr': benchmark_ocr,
+    'triage': benchmark_triage,
+    'memory': benchmark_memory,
+    'startup': benchmark_startup,
+    'preprocess': benchmark_preprocess,
+    'gemini_client': benchmark_gemini_client,
+    'regrade': benchmark_regrade,
+    'prompt_prefix': benchmark_prompt_prefix,
+    'grading_load': benchmark_grading_load,
+    'streaming': benchmark_streaming,
+    'grade_parsing': benchmark_grade_parsing,
+    'chunked': benchmark_chunked,
+    'pregrade': benchmark_pregrade,
+    'near_duplicates': benchmark_near_duplicates,
+    'metrics': benchmark_metrics,
+    'database': benchmark_database,
+    'indexes': benchmark_indexes,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in BENCHMARKS:
+        print("Usage: python benchmark.py <benchmark>")
+        print(f"Available benchmarks: {', '.join(BENCHMARKS)}")
+        sys.exit(1)
+
+    BENCHMARKS[sys.argv[1]]()
@@ -0,0 +1,254 @@
+"""
+Bulk re-grading of every submission for one event.
+
+After a professor fixes an answer key, all submissions are fanned out to
+the grader with bounded asyncio concurrency. The blocking grader calls run
+on a thread pool, and results are written back in batched transactions
+instead of one commit per student. Progress is kept in memory per event.
+A submission whose regrade fails keeps its previous grade, feedback and
+status; the failure is only reported in the regrade's progress.
+
+Submissions with a queued or running grading job are left to the grading
+queue: they are skipped when the regrade starts, and a result is not
+written if a job was queued for the submission while it was regraded.
+Otherwise whichever finished last would overwrite the other's grade.
+"""
+import asyncio
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Grader calls in flight at once during a bulk regrade
+REGRADE_CONCURRENCY = int(os.getenv("AGS_REGRADE_CONCURRENCY", "16"))
+# Results written per transaction
+REGRADE_BATCH_SIZE = int(os.getenv("AGS_REGRADE_BATCH_SIZE", "25"))
+# A partial batch is flushed after this many seconds so progress stays visible
+REGRADE_FLUSH_SECONDS = float(os.getenv("AGS_REGRADE_FLUSH_SECONDS", "2"))
+
+class RegradeRun:
+    """Progress of one bulk regrade"""
+
+    def __init__(self, event_id, total):
+        self.event_id = event_id
+        self.total = total
+        self.graded = 0     # grader returned a grade
+        self.failed = 0     # grader returned no grade or raised (submission left as it was)
+        self.failures = []  # (submission_id, error) of the failed regrades
+        self.skipped = []   # submission ids left to their active grading job
+        self.written = 0    # new grades committed to the database
+        self.transactions = 0
+        self.status = 'running'
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def progress(self):
+        """Snapshot of the counters for the API"""
+        with self._lock:
+            finished_at = self.finished_at or time.time()
+            return {
+                'event_id': self.event_id,
+                'status': self.status,
+                'total': self.total,
+                'graded': self.graded,
+                'failed': self.failed,
+                'skipped': len(self.skipped),
+                'skipped_submissions': list(self.skipped),
+                'remaining': self.total - self.graded - self.failed - len(self.skipped),
+                'written': self.written,
+                'transactions': self.transactions,
+                'elapsed_seconds': round(finished_at - self.started_at, 2),
+                'error': self.error,
+                'failures': [{'submission_id': submission_id, 'error': error}
+                             for submission_id, error in self.failures],
+            }
+
+class BulkRegrader:
+    """
+    Runs bulk regrades in background threads, one per event.
+
+    `connect` returns a new sqlite3 connection. `grade(submission)` takes a
+    submission row (dict) and returns (grade, feedback, success, details),
+    like perform_immediate_grading. For completed grades,
+    `encode_details(details)` gives the values written to `detail_columns`.
+    Only completed grades are written back.
+    """
+
+    def __init__(self, connect, grade, concurrency=REGRADE_CONCURRENCY,
+                 batch_size=REGRADE_BATCH_SIZE, flush_seconds=REGRADE_FLUSH_SECONDS,
+                 detail_columns=(), encode_details=None):
+        self.connect = connect
+        self.grade = grade
+        self.detail_columns = tuple(detail_columns)
+        self.encode_details = encode_details
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._runs = {}  # event_id -> RegradeRun
+        self._lock = threading.Lock()
+
+    def start(self, event_id, submissions):
+        """
+        Start regrading `submissions` (dicts with at least an 'id') for an
+        event. Returns the new RegradeRun, or None if one is already running.
+        """
+        with self._lock:
+            current = self._runs.get(event_id)
+            if current and current.status == 'running':
+                return None
+            run = self._runs[event_id] = RegradeRun(event_id, len(submissions))
+        thread = threading.Thread(target=self._run_thread, args=(run, submissions),
+                                  name=f"regrade-event-{event_id}", daemon=True)
+        thread.start()
+        print(f"🔁 Regrading {len(submissions)} submissions for event {event_id} "
+              f"({self.concurrency} at a time)")
+        return run
+
+    def run(self, event_id, submissions):
+        """Regrade synchronously in the calling thread and return the finished RegradeRun"""
+        run = RegradeRun(event_id, len(submissions))
+        with self._lock:
+            self._runs[event_id] = run
+        self._run_thread(run, submissions)
+        return run
+
+    def progress(self, event_id):
+        """Progress dict of the latest regrade for an event, or None"""
+        run = self._runs.get(event_id)
+        return run.progress() if run else None
+
+    def _run_thread(self, run, submissions):
+        try:
+            asyncio.run(self._regrade(run, submissions))
+            status, error = 'completed', None
+        except Exception as e:
+            traceback.print_exc()
+            status, error = 'failed', f"{type(e).__name__}: {e}"
+        with run._lock:
+            run.status = status
+            run.error = error
+            run.finished_at = time.time()
+        progress = run.progress()
+        print(f"✅ Regrade of event {run.event_id} {status}: {progress['graded']} graded, "
+              f"{progress['failed']} failed in {progress['elapsed_seconds']}s "
+              f"({progress['transactions']} transactions)")
+
+    def _submissions_with_active_jobs(self, submission_ids):
+        """The ids among `submission_ids` that have a queued or running grading job"""
+        if not submission_ids:
+            return set()
+        placeholders = ", ".join("?" for _ in submission_ids)
+        conn = self.connect()
+        try:
+            return {row[0] for row in conn.execute(f'''SELECT DISTINCT submission_id FROM grading_jobs
+                                                       WHERE status IN ('queued', 'running')
+                                                       AND submission_id IN ({placeholders})''',
+                                                    list(submission_ids))}
+        finally:
+            conn.close()
+
+    async def _regrade(self, run, submissions):
+        loop = asyncio.get_running_loop()
+        active = await loop.run_in_executor(None, self._submissions_with_active_jobs,
+                                            [submission['id'] for submission in submissions])
+        if active:
+            print(f"⏭  Regrade of event {run.event_id}: skipping {len(active)} submissions "
+                  f"the grading queue is still working on")
+            with run._lock:
+                run.skipped.extend(sorted(active))
+            submissions = [submission for submission in submissions if submission['id'] not in active]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = asyncio.Queue()
+
+        async def grade_one(submission):
+            async with semaphore:
+                try:
+                    outcome = await loop.run_in_executor(executor, self.grade, submission)
+                except Exception as e:
+                    outcome = (None, f"{type(e).__name__}: {e}", False, None)
+            grade, feedback, success, details = outcome
+            if not (success and grade is not None):
+                # Keep the submission's previous result; report the failure in the run only
+                with run._lock:
+                    run.failed += 1
+                    run.failures.append((submission['id'], feedback))
+                return
+            with run._lock:
+                run.graded += 1
+            await results.put((submission['id'], grade, feedback, details))
+
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix=f"regrade-{run.event_id}") as executor:
+            writer = asyncio.create_task(self._write_results(run, results))
+            try:
+                await asyncio.gather(*(grade_one(submission) for submission in submissions))
+            finally:
+                await results.put(None)
+                await writer
+
+    async def _write_results(self, run, results):
+        """Drain graded results and commit them in batches"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        flush_at = None
+        done = False
+        while not done:
+            timeout = None if flush_at is None else max(0.0, flush_at - loop.time())
+            try:
+                item = await asyncio.wait_for(results.get(), timeout)
+                if item is None:
+                    done = True
+                else:
+                    batch.append(item)
+                    if flush_at is None:
+                        flush_at = loop.time() + self.flush_seconds
+            except asyncio.TimeoutError:
+                pass
+            if batch and (done or len(batch) >= self.batch_size or loop.time() >= flush_at):
+                superseded = await loop.run_in_executor(None, self._write_batch, batch)
+                with run._lock:
+                    run.written += len(batch) - len(superseded)
+                    run.graded -= len(superseded)
+                    run.skipped.extend(superseded)
+                    run.transactions += 1
+                batch = []
+                flush_at = None
+
+    def _detail_values(self, details):
+        if not self.detail_columns:
+            return ()
+        return tuple(self.encode_details(details))
+
+    def _write_batch(self, batch):
+        """
+        Write one batch of completed grades in a single transaction. Grades of
+        submissions that got a queued or running grading job in the meantime
+        are not written; returns their ids.
+        """
+        detail_assignments = "".join(f", {column} = ?" for column in self.detail_columns)
+        superseded = []
+        conn = self.connect()
+        try:
+            # Take the write lock first so no job can be queued between the check and the update
+            conn.execute('BEGIN IMMEDIATE')
+            for submission_id, grade, feedback, details in batch:
+                updated = conn.execute(f'''UPDATE submissions
+                                           SET grade = ?, feedback = ?, grading_status = ?,
+                                               graded_at = CURRENT_TIMESTAMP{detail_assignments}
+                                           WHERE id = ? AND NOT EXISTS (
+                                               SELECT 1 FROM grading_jobs
+                                               WHERE submission_id = submissions.id
+                                               AND status IN ('queued', 'running'))''',
+                                       (grade, feedback, 'completed', *self._detail_values(details),
+                                        submission_id)).rowcount
+                if not updated:
+                    superseded.append(submission_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return superseded
@@ -0,0 +1,151 @@
+"""
+Circuit breakers for the grading models.
+
+Each model gets a breaker that watches the error rate of its recent calls.
+When too many calls fail the breaker opens and the model is skipped, so
+callers go straight to a healthy model instead of waiting for a failure
+first. After a cool-down the breaker lets a probe call through
+(half-open); a successful probe closes it again.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+# Calls within this many seconds count towards the error rate
+BREAKER_WINDOW_SECONDS = float(os.getenv("AGS_BREAKER_WINDOW_SECONDS", "60"))
+# Minimum calls in the window before the breaker may open
+BREAKER_MIN_CALLS = int(os.getenv("AGS_BREAKER_MIN_CALLS", "5"))
+# Error rate in the window that opens the breaker
+BREAKER_ERROR_RATE = float(os.getenv("AGS_BREAKER_ERROR_RATE", "0.5"))
+# How long an open breaker rejects calls before probing
+BREAKER_OPEN_SECONDS = float(os.getenv("AGS_BREAKER_OPEN_SECONDS", "30"))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    """Thread-safe closed / open / half-open breaker for one model"""
+
+    def __init__(self, name, window_seconds=BREAKER_WINDOW_SECONDS, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, open_seconds=BREAKER_OPEN_SECONDS, half_open_probes=1):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.opened_at = None
+        self.rejected = 0
+        self.transitions = deque(maxlen=20)  # (time, from, to, reason)
+        self._calls = deque()  # (time, succeeded) within the window
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, new_state, reason):
+        """Change state (caller holds the lock)"""
+        now = time.time()
+        self.transitions.append((now, self.state, new_state, reason))
+        print(f"🔌 Circuit breaker {self.name}: {self.state} -> {new_state} ({reason})")
+        self.state = new_state
+        if new_state == OPEN:
+            self.opened_at = now
+        elif new_state == CLOSED:
+            self.opened_at = None
+            self._calls.clear()
+        self._probes_in_flight = 0
+
+    def _prune(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def allow(self):
+        """
+        True if a call may go to this model now. In the half-open state
+        only `half_open_probes` calls are let through until one reports back.
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self._transition(HALF_OPEN, f"probing after {self.open_seconds:g}s open")
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self.rejected += 1
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED, "probe succeeded")
+                return
+            now = time.time()
+            self._calls.append((now, True))
+            self._prune(now)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(OPEN, f"probe failed: {error}")
+                return
+            if self.state == OPEN:
+                return
+            now = time.time()
+            self._calls.append((now, False))
+            self._prune(now)
+            failures = sum(1 for _, succeeded in self._calls if not succeeded)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.error_rate:
+                self._transition(OPEN, f"{failures}/{len(self._calls)} calls failed "
+                                       f"in {self.window_seconds:g}s: {error}")
+
+    def release(self):
+        """
+        A call that was let through ended without an outcome (its caller
+        went away). It does not count either way, but a half-open probe
+        slot it held is freed so another call can probe.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def snapshot(self):
+        """State, window counts and recent transitions for monitoring"""
+        with self._lock:
+            now = time.time()
+            self._prune(now)
+            failures = sum(1 for _, succeeded in self._calls if not succeeded)
+            return {
+                'name': self.name,
+                'state': self.state,
+                'window_calls': len(self._calls),
+                'window_failures': failures,
+                'error_rate': failures / len(self._calls) if self._calls else 0.0,
+                'rejected': self.rejected,
+                'open_for_seconds': round(now - self.opened_at, 1) if self.opened_at else None,
+                'transitions': [
+                    {'at': at, 'from': old, 'to': new, 'reason': reason}
+                    for at, old, new, reason in self.transitions
+                ],
+            }
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name):
+    """The shared breaker for a model name, created on first use"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+def breaker_snapshots():
+    """Snapshots of every breaker, keyed by model name"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
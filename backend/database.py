@@ -0,0 +1,101 @@
+"""
+Pooled SQLite connections.
+
+Opening a connection per request means re-reading the schema, starting
+with an empty page cache and preparing every statement again. Connections
+here are opened once with WAL journaling and tuned pragmas, and `close()`
+hands them back to a shared pool instead of closing them, so the next
+request (on any thread) reuses the connection, its page cache and its
+prepared statements. In WAL mode readers no longer block the writer or the
+other way round, and busy_timeout makes writers wait for the lock instead
+of failing with "database is locked".
+"""
+import atexit
+import os
+import sqlite3
+import threading
+
+DATABASE_PATH = os.getenv("AGS_DATABASE", "ags.db")
+# Idle connections kept per database file; extra connections are really closed
+DB_POOL_SIZE = int(os.getenv("AGS_DB_POOL_SIZE", "16"))
+# How long a writer waits for the write lock before "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.getenv("AGS_DB_BUSY_TIMEOUT_MS", "5000"))
+# Page cache per connection, in KiB
+DB_CACHE_KB = int(os.getenv("AGS_DB_CACHE_KB", "16384"))
+# Memory-mapped I/O per connection, in MiB (0 disables it)
+DB_MMAP_MB = int(os.getenv("AGS_DB_MMAP_MB", "128"))
+# Prepared statements kept per connection
+DB_CACHED_STATEMENTS = int(os.getenv("AGS_DB_CACHED_STATEMENTS", "256"))
+
+_pools = {}  # absolute database path -> idle connections
+_pools_lock = threading.Lock()
+
+class PooledConnection(sqlite3.Connection):
+    """A connection whose close() returns it to the pool"""
+
+    def close(self):
+        if getattr(self, '_idle', False):
+            return
+        try:
+            if self.in_transaction:
+                self.rollback()
+        except sqlite3.Error:
+            super().close()
+            return
+        self.row_factory = None
+        with _pools_lock:
+            idle = _pools.setdefault(self._pool_key, [])
+            if len(idle) < DB_POOL_SIZE:
+                self._idle = True
+                idle.append(self)
+                return
+        super().close()
+
+    def close_for_good(self):
+        super().close()
+
+def configure(conn):
+    """Apply the journal, durability and cache pragmas to a new connection"""
+    conn.execute('PRAGMA journal_mode = WAL')
+    # With WAL, NORMAL only syncs at checkpoints: a crash can lose the last
+    # commits but never corrupts the database
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_MB * 1024 * 1024}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+def connect(path=None):
+    """
+    A connection to `path` (default AGS_DATABASE), from the pool when one
+    is idle. Call close() when done with it, as with a plain connection.
+    """
+    key = os.path.abspath(path or DATABASE_PATH)
+    with _pools_lock:
+        idle = _pools.get(key)
+        conn = idle.pop() if idle else None
+    if conn is not None:
+        conn._idle = False
+        return conn
+    # Pooled connections move between request threads, but only one uses a connection at a time
+    conn = sqlite3.connect(key, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           cached_statements=DB_CACHED_STATEMENTS, factory=PooledConnection)
+    conn._pool_key = key
+    conn._idle = False
+    configure(conn)
+    return conn
+
+def close_pool():
+    """Close every idle connection (at exit, or before replacing the database file)"""
+    with _pools_lock:
+        connections = [conn for idle in _pools.values() for conn in idle]
+        _pools.clear()
+    for conn in connections:
+        conn.close_for_good()
+
+def pool_stats():
+    """Idle connections by database path"""
+    with _pools_lock:
+        return {path: len(idle) for path, idle in _pools.items()}
+
+atexit.register(close_pool)
@@ -0,0 +1,199 @@
+"""
+Small on-disk key/value cache with size-bounded LRU eviction.
+Each entry is stored as one UTF-8 text file. A file's mtime is when the
+entry was written (for TTL expiry) and its atime, set explicitly on every
+hit, is when it was last used (for LRU eviction).
+"""
+import hashlib
+import os
+import threading
+import time
+
+# Shared root for the extraction and grading caches
+DEFAULT_CACHE_DIR = os.getenv("AGS_CACHE_DIR",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ags_cache"))
+
+def content_hash(data):
+    """SHA-256 hex digest of bytes (or a str, encoded as UTF-8)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+class _Flight:
+    """One in-progress computation that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class DiskCache:
+    """
+    Thread-safe on-disk text cache.
+    When the stored entries exceed `max_bytes` the least recently used
+    entries are deleted. A `max_bytes` of 0 disables the cache. With
+    `ttl_seconds`, entries older than that are treated as misses.
+    """
+
+    def __init__(self, directory, max_bytes, ttl_seconds=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._sizes = None  # key -> size in bytes, loaded lazily
+        self._inflight_lock = threading.Lock()
+        self._inflight = {}  # key -> _Flight
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def _load_index(self):
+        """Scan the cache directory once so eviction knows the current size"""
+        if self._sizes is not None:
+            return
+        self._sizes = {}
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith('.txt'):
+                try:
+                    self._sizes[name[:-4]] = os.path.getsize(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def get(self, key):
+        """Return the cached value for `key`, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        with self._lock:
+            try:
+                written_at = os.stat(path).st_mtime
+                now = time.time()
+                if self.ttl_seconds is not None and now - written_at > self.ttl_seconds:
+                    self._delete(key)
+                    self.expired += 1
+                    self.misses += 1
+                    return None
+                with open(path, 'r', encoding='utf-8') as f:
+                    value = f.read()
+                os.utime(path, (now, written_at))  # mark as recently used, keep write time
+                self.hits += 1
+                return value
+            except OSError:
+                self.misses += 1
+                return None
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """
+        Return the cached value for `key`, computing and storing it on a
+        miss. Concurrent callers missing on the same key share a single
+        compute() call (single-flight); if it raises, they all see the error
+        and nothing is cached. A computed value for which `cacheable(value)`
+        is false is returned but not stored.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        
+        if not leader:
+            flight.done.wait()
+            with self._lock:
+                self.coalesced += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        
+        try:
+            flight.value = compute()
+            if cacheable is None or cacheable(flight.value):
+                self.set(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def _delete(self, key):
+        """Remove one entry (caller holds the lock)"""
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+        if self._sizes is not None:
+            self._sizes.pop(key, None)
+
+    def set(self, key, value):
+        """Store `value` under `key` and evict old entries if over budget"""
+        if not self.enabled:
+            return
+        data = value.encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"⚠ Cache write failed for {key}: {e}")
+                return
+            self._sizes[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits its budget"""
+        total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_last_use = []
+        for key in self._sizes:
+            try:
+                by_last_use.append((os.stat(self._path(key)).st_atime, key))
+            except OSError:
+                by_last_use.append((0, key))
+        by_last_use.sort()
+        for _, key in by_last_use:
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes[key]
+            self._delete(key)
+            self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            if self.enabled:
+                self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'coalesced': self.coalesced,
+                'entries': len(self._sizes or {}),
+                'bytes': sum((self._sizes or {}).values()),
+                'max_bytes': self.max_bytes,
+            }
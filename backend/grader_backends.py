@@ -0,0 +1,209 @@
+"""
+Grader backends used by automated_grading.
+
+A backend turns a grading prompt into the AI response text. The Gemini
+backend lives in automated_grading; LocalGraderBackend is an offline
+stand-in with configurable latency, error rate and rate limit, for load
+testing the submission and grading pipeline on one machine.
+"""
+import abc
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
+class GraderBackendError(Exception):
+    """A backend call failed (transient provider error)"""
+
+class RateLimited(GraderBackendError):
+    """The backend refused the call because of its rate limit (HTTP 429)"""
+
+class GraderBackend(abc.ABC):
+    """
+    Interface for grader backends. Subclasses must implement `generate`.
+
+    `generate(prefix, student_answer_text)` returns the response text for
+    one submission; `prefix` is the automated_grading.PromptPrefix of the
+    event. `stream(...)` yields the same text in chunks as it is produced.
+    Raise on failure; automated_grading turns errors into GradingFailed
+    and the grading queue retries the job.
+
+    Backends that may answer with a fallback model report which model
+    answered: `generate_with_model` returns (text, model_name) and the
+    `stream` generator returns the model name. Only responses from
+    `model_name` are cached.
+    """
+
+    name = "base"
+    model_name = None  # part of the grading cache key
+
+    def available(self):
+        """False if the backend is not configured (e.g. no API key)"""
+        return True
+
+    @abc.abstractmethod
+    def generate(self, prefix, student_answer_text):
+        """Response text for one submission"""
+
+    def generate_with_model(self, prefix, student_answer_text):
+        """(response text, name of the model that answered)"""
+        return self.generate(prefix, student_answer_text), self.model_name
+
+    def stream(self, prefix, student_answer_text):
+        """Backends without streaming yield the whole response at once"""
+        text, model_name = self.generate_with_model(prefix, student_answer_text)
+        yield text
+        return model_name
+
+    def stats(self):
+        return {}
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec into a sampler taking a random.Random:
+    "fixed:SECONDS", "uniform:LOW,HIGH" or "lognormal:MEDIAN,SIGMA".
+    """
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value.strip()]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal' and len(values) == 2:
+        median, sigma = values
+        return lambda rng: median * math.exp(sigma * rng.gauss(0.0, 1.0))
+    raise ValueError(f"Invalid latency spec {spec!r}; use fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+class LocalGraderBackend(GraderBackend):
+    """
+    Deterministic offline grader.
+
+    The grade is the share of answer-key words that appear in the
+    submission, so identical inputs always get identical responses; the
+    response is text or JSON following the prefix's output format. Each
+    call sleeps for a latency drawn from `latency`, fails with probability
+    `error_rate`, and is refused with RateLimited when more than
+    `rate_limit_per_minute` calls arrive within a minute (0 = no limit).
+    `seconds_per_kb` adds latency per KB of submission text, since a model
+    takes longer to read and comment on a longer answer. When streaming,
+    the first chunk arrives after `first_chunk_fraction` of the latency
+    and the rest is spread over the remainder.
+    """
+
+    name = "local"
+    model_name = "local-standin"
+
+    def __init__(self, latency="lognormal:1.0,0.4", error_rate=0.0, rate_limit_per_minute=0, seed=0,
+                 first_chunk_fraction=0.1, stream_chunks=8, seconds_per_kb=0.0):
+        self.latency_spec = latency
+        self.seconds_per_kb = seconds_per_kb
+        self.first_chunk_fraction = first_chunk_fraction
+        self.stream_chunks = stream_chunks
+        self._sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent_calls = deque()
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def _admit(self, student_answer_text):
+        """Draw this call's latency and failure, enforcing the rate limit"""
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            if self.rate_limit_per_minute:
+                while self._recent_calls and now - self._recent_calls[0] >= 60:
+                    self._recent_calls.popleft()
+                if len(self._recent_calls) >= self.rate_limit_per_minute:
+                    self.rate_limited += 1
+                    raise RateLimited(f"429 Resource has been exhausted "
+                                      f"({self.rate_limit_per_minute} requests per minute)")
+                self._recent_calls.append(now)
+            latency = max(0.0, self._sample_latency(self._rng))
+            latency += self.seconds_per_kb * len((student_answer_text or "").encode('utf-8')) / 1024
+            fails = self._rng.random() < self.error_rate
+        return latency, fails
+
+    def _fail(self):
+        with self._lock:
+            self.errors += 1
+        raise GraderBackendError("503 The service is currently unavailable (simulated)")
+
+    def generate(self, prefix, student_answer_text):
+        latency, fails = self._admit(student_answer_text)
+        time.sleep(latency)
+        if fails:
+            self._fail()
+        return self._response(prefix, student_answer_text, latency)
+
+    def stream(self, prefix, student_answer_text):
+        latency, fails = self._admit(student_answer_text)
+        first_chunk_delay = latency * self.first_chunk_fraction
+        time.sleep(first_chunk_delay)
+        if fails:
+            self._fail()
+        lines = self._response(prefix, student_answer_text, latency).splitlines(keepends=True)
+        chunk_size = max(1, math.ceil(len(lines) / self.stream_chunks))
+        chunks = ["".join(lines[i:i + chunk_size]) for i in range(0, len(lines), chunk_size)]
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep((latency - first_chunk_delay) / max(1, len(chunks) - 1))
+            yield chunk
+
+    def _response(self, prefix, student_answer_text, latency):
+        expected = set(_WORD.findall((prefix.answer_key_text or prefix.instructions_text or "").lower()))
+        given = set(_WORD.findall((student_answer_text or "").lower()))
+        coverage = len(expected & given) / len(expected) if expected else 0.5
+        grade = round(10 * coverage)
+        if getattr(prefix, 'output_format', 'text') == 'json':
+            return json.dumps({
+                'grade': grade,
+                'strengths': [f"Covers {len(expected & given)} of {len(expected)} key terms from the answer key"],
+                'improvements': ["Address the missing parts of the expected solution"],
+                'suggestions': [],
+                'question_comments': [{
+                    'question': "Overall",
+                    'comment': f"Graded by the local stand-in backend ({self.latency_spec}, "
+                               f"simulated latency {latency:.2f}s)",
+                }],
+            }, indent=2)
+        return f"""Grade: {grade}/10
+
+**Detailed Feedback:**
+
+**Strengths:**
+- Covers {len(expected & given)} of {len(expected)} key terms from the answer key
+
+**Areas for Improvement:**
+- Address the missing parts of the expected solution
+
+**Specific Comments:**
+- Graded by the local stand-in backend ({self.latency_spec}, simulated latency {latency:.2f}s)
+"""
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'rate_limited': self.rate_limited,
+            }
+
+def local_backend_from_env():
+    """LocalGraderBackend configured from AGS_LOCAL_GRADER_* environment variables"""
+    return LocalGraderBackend(
+        latency=os.getenv("AGS_LOCAL_GRADER_LATENCY", "lognormal:1.0,0.4"),
+        error_rate=float(os.getenv("AGS_LOCAL_GRADER_ERROR_RATE", "0")),
+        rate_limit_per_minute=int(os.getenv("AGS_LOCAL_GRADER_RATE_LIMIT", "0")),
+        seed=int(os.getenv("AGS_LOCAL_GRADER_SEED", "0")),
+        seconds_per_kb=float(os.getenv("AGS_LOCAL_GRADER_SECONDS_PER_KB", "0")),
+    )
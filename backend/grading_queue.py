@@ -0,0 +1,266 @@
+"""
+Durable SQLite-backed job queue for background AI grading.
+
+Jobs live in the `grading_jobs` table next to the submissions they grade,
+so nothing is lost on restart. A worker claims a job by taking a lease;
+if the worker dies the lease expires and another worker picks the job up.
+Failed jobs are retried with exponential backoff up to `max_attempts`.
+"""
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+# Number of grading worker threads per server process
+GRADING_WORKERS = int(os.getenv("AGS_GRADING_WORKERS", "4"))
+# How long a claimed job stays leased before another worker may take it over.
+# A job being worked on renews its lease every third of this, so only a
+# dead worker's jobs are taken over, however long grading takes
+LEASE_SECONDS = int(os.getenv("AGS_GRADING_LEASE_SECONDS", "300"))
+# Attempts per job before it is given up on
+MAX_ATTEMPTS = int(os.getenv("AGS_GRADING_MAX_ATTEMPTS", "3"))
+# Seconds before the first retry; doubles with every further attempt
+RETRY_BACKOFF_SECONDS = float(os.getenv("AGS_GRADING_RETRY_BACKOFF", "10"))
+# Idle workers re-check the table this often (jobs enqueued by other processes)
+POLL_INTERVAL_SECONDS = float(os.getenv("AGS_GRADING_POLL_INTERVAL", "2"))
+
+# Claim SQL, shared with migrations.check_query_plans so the checked plan is the one that runs
+CLAIM_SQL = '''SELECT id, submission_id, attempts FROM grading_jobs
+               WHERE {condition}
+               ORDER BY priority DESC, available_at, id LIMIT 1'''
+# Any runnable job (now, now)
+RUNNABLE_JOB = '''(status = 'queued' AND available_at <= ?)
+                  OR (status = 'running' AND lease_expires_at < ?)'''
+# The job of one submission (submission_id, now)
+SUBMISSION_JOB = '''submission_id = ? AND (status = 'queued'
+                    OR (status = 'running' AND lease_expires_at < ?))'''
+
+class GradingQueue:
+    """
+    Background grading queue.
+
+    `connect` returns a new sqlite3 connection. `handler(submission_id)`
+    grades one submission; raising makes the job retry. When a job runs
+    out of attempts, `on_give_up(submission_id, error)` is called.
+    """
+
+    def __init__(self, connect, handler, on_give_up=None, workers=GRADING_WORKERS,
+                 lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.connect = connect
+        self.handler = handler
+        self.on_give_up = on_give_up
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._threads = []
+        self._pid = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def enqueue(self, submission_id, conn, delay_seconds=0, priority=0):
+        """
+        Add a grading job using the caller's connection, so the job is
+        committed in the same transaction as the submission row. With
+        `delay_seconds` workers leave the job alone for that long, giving
+        a streaming request the chance to claim it first. Jobs with a
+        higher `priority` are claimed first.
+        """
+        now = time.time()
+        conn.execute('''INSERT INTO grading_jobs (submission_id, status, available_at, updated_at, priority)
+                        VALUES (?, 'queued', ?, ?, ?)''', (submission_id, now + delay_seconds, now, priority))
+        self._wakeup.set()
+
+    def claim(self):
+        """
+        Lease the next runnable job, highest priority first: a queued job
+        whose backoff has passed, or a running job whose lease expired.
+        Returns (job_id, submission_id, attempts) or None.
+        """
+        now = time.time()
+        return self._claim(RUNNABLE_JOB, (now, now))
+
+    def claim_submission(self, submission_id):
+        """
+        Lease the queued job of one submission, even if its start delay has
+        not passed, so the caller can grade it in-process (streaming). Returns
+        (job_id, submission_id, attempts), or None if a worker already has it.
+        """
+        return self._claim(SUBMISSION_JOB, (submission_id, time.time()))
+
+    def _claim(self, condition, params):
+        conn = self.connect()
+        try:
+            now = time.time()
+            # BEGIN IMMEDIATE takes the write lock so two workers never claim the same row
+            conn.execute('BEGIN IMMEDIATE')
+            job = conn.execute(CLAIM_SQL.format(condition=condition), params).fetchone()
+            if not job:
+                conn.execute('COMMIT')
+                return None
+            job_id, submission_id, attempts = job[0], job[1], job[2] + 1
+            conn.execute('''UPDATE grading_jobs
+                            SET status = 'running', attempts = ?, lease_expires_at = ?, updated_at = ?
+                            WHERE id = ?''', (attempts, now + self.lease_seconds, now, job_id))
+            conn.execute('COMMIT')
+            return job_id, submission_id, attempts
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def renew(self, job_id):
+        """Extend the lease of a running job; False if the job is no longer running"""
+        now = time.time()
+        conn = self.connect()
+        try:
+            renewed = conn.execute('''UPDATE grading_jobs SET lease_expires_at = ?, updated_at = ?
+                                      WHERE status = 'running' AND id = ?''',
+                                   (now + self.lease_seconds, now, job_id)).rowcount
+            conn.commit()
+            return bool(renewed)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def holding_lease(self, job_id):
+        """Keep renewing a claimed job's lease while the block runs"""
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    if not self.renew(job_id):
+                        return
+                except Exception as e:
+                    print(f"⚠️  Could not renew the lease of grading job {job_id}: {e}")
+
+        thread = threading.Thread(target=heartbeat, name=f"grading-lease-{job_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def complete(self, job_id):
+        """Mark a job as done"""
+        conn = self.connect()
+        try:
+            conn.execute('''UPDATE grading_jobs SET status = 'completed', lease_expires_at = NULL,
+                            updated_at = ? WHERE id = ?''', (time.time(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def release(self, job_id):
+        """Hand a claimed job back to the workers without counting the attempt"""
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.execute('''UPDATE grading_jobs SET status = 'queued', attempts = MAX(attempts - 1, 0),
+                            available_at = ?, lease_expires_at = NULL, updated_at = ?
+                            WHERE status = 'running' AND id = ?''', (now, now, job_id))
+            conn.commit()
+        finally:
+            conn.close()
+        self._wakeup.set()
+
+    def fail(self, job_id, attempts, error):
+        """
+        Record a failed attempt: requeue with backoff, or give up once
+        max_attempts is reached. Returns True if the job was given up on.
+        """
+        now = time.time()
+        give_up = attempts >= self.max_attempts
+        conn = self.connect()
+        try:
+            if give_up:
+                conn.execute('''UPDATE grading_jobs SET status = 'failed', last_error = ?,
+                                lease_expires_at = NULL, updated_at = ? WHERE id = ?''',
+                             (error, now, job_id))
+            else:
+                retry_at = now + RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+                conn.execute('''UPDATE grading_jobs SET status = 'queued', last_error = ?,
+                                available_at = ?, lease_expires_at = NULL, updated_at = ?
+                                WHERE id = ?''', (error, retry_at, now, job_id))
+            conn.commit()
+        finally:
+            conn.close()
+        return give_up
+
+    def run_job(self, job):
+        """Run one claimed job through the handler and record the outcome"""
+        job_id, submission_id, attempts = job
+        try:
+            with self.holding_lease(job_id):
+                self.handler(submission_id)
+            self.complete(job_id)
+        except Exception as e:
+            traceback.print_exc()
+            self.handle_failure(job, e)
+
+    def handle_failure(self, job, exception):
+        """Record a failed attempt of a claimed job; gives up after max_attempts"""
+        job_id, submission_id, attempts = job
+        error = f"{type(exception).__name__}: {exception}"
+        print(f"❌ Grading job {job_id} (submission {submission_id}) attempt {attempts} failed: {error}")
+        if self.fail(job_id, attempts, error):
+            print(f"⚠️  Giving up on grading job {job_id} after {attempts} attempts")
+            if self.on_give_up:
+                try:
+                    self.on_give_up(submission_id, error)
+                except Exception as give_up_error:
+                    print(f"❌ Could not mark submission {submission_id} as failed: {give_up_error}")
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.claim()
+            except Exception as e:
+                print(f"⚠️  Grading queue claim failed: {e}")
+                job = None
+            if job:
+                self.run_job(job)
+                continue
+            self._wakeup.wait(POLL_INTERVAL_SECONDS)
+            self._wakeup.clear()
+
+    def start(self):
+        """
+        Start the worker threads (safe to call more than once). A forked
+        process (pre-forking WSGI servers) starts its own workers, since
+        threads do not survive a fork.
+        """
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            self._threads = []
+            self._pid = os.getpid()
+            self._stop.clear()
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"grading-worker-{index + 1}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"🧵 Grading queue started with {self.workers} workers")
+
+    def stop(self, timeout=None):
+        """Ask the workers to stop and wait for their current job to finish"""
+        with self._lock:
+            self._stop.set()
+            self._wakeup.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def stats(self):
+        """Job counts by status"""
+        conn = self.connect()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) FROM grading_jobs GROUP BY status').fetchall()
+            return {row[0]: row[1] for row in rows}
+        finally:
+            conn.close()
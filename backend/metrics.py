@@ -0,0 +1,190 @@
+"""
+In-process metrics, exported in the Prometheus text format.
+
+Histograms time each stage of handling a submission (upload read, each
+extraction backend, OCR per page, preprocessing, the LLM call, grade
+parsing, database writes) and counters record fallbacks and failures.
+Recording a value is a dict lookup and a few additions under a lock, so
+instrumentation can stay on in production. Gauges that describe current
+state (circuit breakers, queue depth) are read by collectors at scrape time.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Record metrics (disable to take the instrumentation out entirely)
+METRICS_ENABLED = os.getenv("AGS_METRICS", "true").lower() in ("1", "true", "yes")
+
+# Latency buckets in seconds, from 1ms up to the LLM and OCR timescales
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in values]
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(name, "") for name in self.labelnames))
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in
+                            self._series.items())
+        samples = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, (le,)), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+_metrics = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+def _register(metric_class, name, help_text, labelnames, **kwargs):
+    with _registry_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = metric_class(name, help_text, labelnames, **kwargs)
+        return metric
+
+def counter(name, help_text, labelnames=()):
+    """The counter registered under `name`, created on first use"""
+    return _register(Counter, name, help_text, labelnames)
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """The histogram registered under `name`, created on first use"""
+    return _register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+def register_collector(name, collector):
+    """
+    Add a scrape-time gauge: `collector()` returns [(labels dict, value)].
+    Registering the same name again replaces the collector.
+    """
+    with _registry_lock:
+        _collectors[:] = [entry for entry in _collectors if entry[0] != name]
+        _collectors.append((name, collector))
+
+STAGE_SECONDS = histogram('ags_stage_seconds', 'Time spent in each stage of handling a submission', ('stage',))
+FALLBACKS = counter('ags_fallbacks_total', 'Fallbacks to a slower or less accurate path', ('kind',))
+FAILURES = counter('ags_failures_total', 'Stages that failed', ('stage',))
+IMAGE_OCR = counter('ags_image_ocr_total', 'Embedded images by OCR outcome (OCRed or skipped and why)',
+                    ('outcome',))
+
+def observe_stage(stage, seconds):
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+@contextmanager
+def time_stage(stage):
+    """Time a block as `stage`; an exception leaving the block also counts as a failure of the stage"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        FAILURES.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+def count_fallback(kind):
+    if METRICS_ENABLED:
+        FALLBACKS.inc(kind=kind)
+
+def count_failure(stage):
+    if METRICS_ENABLED:
+        FAILURES.inc(stage=stage)
+
+def count_image_ocr(outcome, amount):
+    if METRICS_ENABLED and amount:
+        IMAGE_OCR.inc(amount, outcome=outcome)
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    with _registry_lock:
+        metrics = list(_metrics.values())
+        collectors = list(_collectors)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+    for name, collector in collectors:
+        try:
+            values = collector()
+        except Exception as e:
+            print(f"⚠️  Metrics collector {name} failed: {e}")
+            continue
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in values:
+            label_text = "{" + ",".join(f'{key}="{_escape(item)}"' for key, item in labels.items()) + "}" \
+                if labels else ""
+            lines.append(f"{name}{label_text} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
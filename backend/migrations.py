@@ -0,0 +1,283 @@
+"""
+Versioned schema migrations.
+
+The schema version is kept in SQLite's `PRAGMA user_version`. `migrate()`
+runs every migration newer than the database, in order, each in its own
+transaction, and bumps the version after each one. Databases created
+before versioning (user_version 0 with tables already present) go through
+every migration; the early ones only create what is missing.
+
+Run `python migrations.py` to migrate ags.db, or `python migrations.py check`
+to verify that the hot route queries use indexes (EXPLAIN QUERY PLAN).
+"""
+import sys
+import time
+
+import grading_queue
+import queries
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+def add_column(conn, table, column, column_type):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    if column not in table_columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+def create_base_tables(conn):
+    """Users, courses, enrollments, events and submissions"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        user_type TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS courses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_name TEXT NOT NULL,
+        course_code TEXT UNIQUE NOT NULL,
+        professor_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (professor_id) REFERENCES users (id)
+    )''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS enrollments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        course_id INTEGER,
+        enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (student_id) REFERENCES users (id),
+        FOREIGN KEY (course_id) REFERENCES courses (id)
+    )''')
+
+    # Events (assignments/quizzes)
+    conn.execute('''CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER,
+        event_name TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        description TEXT,
+        deadline DATETIME,
+        answer_text TEXT,
+        instructions_text TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (course_id) REFERENCES courses (id)
+    )''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS submissions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id INTEGER,
+        student_id INTEGER,
+        submission_text TEXT,
+        grade INTEGER,
+        feedback TEXT,
+        submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (event_id) REFERENCES events (id),
+        FOREIGN KEY (student_id) REFERENCES users (id)
+    )''')
+
+def add_grading_status_columns(conn):
+    add_column(conn, 'submissions', 'grading_status', "TEXT DEFAULT 'pending'")
+    add_column(conn, 'submissions', 'graded_at', 'TIMESTAMP')
+
+def add_structured_feedback_columns(conn):
+    """JSON-encoded lists filled from structured (JSON) grading responses"""
+    for column in ('strengths', 'improvements', 'suggestions', 'question_comments'):
+        add_column(conn, 'submissions', column, 'TEXT')
+
+def add_pregrade_columns(conn):
+    """Lexical pre-grade: provisional grade, similarity score and triage decision"""
+    add_column(conn, 'submissions', 'provisional_grade', 'INTEGER')
+    add_column(conn, 'submissions', 'pregrade_score', 'REAL')
+    add_column(conn, 'submissions', 'pregrade_decision', 'TEXT')
+
+def create_grading_jobs_table(conn):
+    """Background grading jobs (see grading_queue.py)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS grading_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        submission_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL,
+        lease_expires_at REAL,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at REAL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (submission_id) REFERENCES submissions (id)
+    )''')
+    add_column(conn, 'grading_jobs', 'priority', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_grading_jobs_status
+                    ON grading_jobs (status, available_at)''')
+
+def create_near_duplicate_tables(conn):
+    """MinHash signatures and LSH buckets (see near_duplicates.py)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS submission_minhash (
+        submission_id INTEGER PRIMARY KEY,
+        event_id INTEGER NOT NULL,
+        signature BLOB NOT NULL,
+        FOREIGN KEY (submission_id) REFERENCES submissions (id)
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS submission_lsh_buckets (
+        event_id INTEGER NOT NULL,
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        submission_id INTEGER NOT NULL,
+        FOREIGN KEY (submission_id) REFERENCES submissions (id)
+    )''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_lsh_buckets_lookup
+                    ON submission_lsh_buckets (event_id, band, bucket)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_lsh_buckets_submission
+                    ON submission_lsh_buckets (submission_id)''')
+
+def duplicate_ids(conn, table, columns):
+    """Ids of rows repeating an earlier row's `columns` (the lowest id is the original)"""
+    key = ", ".join(columns)
+    present = " AND ".join(f"{column} IS NOT NULL" for column in columns)
+    return [row[0] for row in conn.execute(f'''SELECT id FROM {table} WHERE {present}
+                                              AND id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {key})''')]
+
+def archive_rows(conn, table, column, ids):
+    """
+    Move the rows of `table` whose `column` is in `ids` to `<table>_duplicates`
+    (same columns plus archived_at), so nothing is lost; returns the number moved.
+    """
+    if not ids:
+        return 0
+    archive = f"{table}_duplicates"
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {archive} AS SELECT *, 0.0 AS archived_at FROM {table} WHERE 0')
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM archive_ids')
+    conn.executemany('INSERT OR IGNORE INTO archive_ids (id) VALUES (?)', [(row_id,) for row_id in ids])
+    archived_at = time.time()
+    moved = conn.execute(f'''INSERT INTO {archive} SELECT *, ? FROM {table}
+                             WHERE {column} IN (SELECT id FROM archive_ids)''', (archived_at,)).rowcount
+    conn.execute(f'DELETE FROM {table} WHERE {column} IN (SELECT id FROM archive_ids)')
+    conn.execute('DELETE FROM archive_ids')
+    return moved
+
+def add_hot_path_indexes(conn):
+    """
+    Indexes for the enrollment checks, submission lookups and course event
+    listings every route runs, and unique constraints for the rows the app
+    already treats as unique. Existing duplicates (every row but the
+    earliest, which the app has been showing) are moved to
+    enrollments_duplicates / submissions_duplicates first, with the grading
+    jobs of the moved submissions in grading_jobs_duplicates, so an operator
+    can review or restore them. Nothing is deleted outright except the
+    near-duplicate index rows, which are derived from the submission text.
+    """
+    enrollments = duplicate_ids(conn, 'enrollments', ('student_id', 'course_id'))
+    submissions = duplicate_ids(conn, 'submissions', ('event_id', 'student_id'))
+    for table, column, ids in (('enrollments', 'id', enrollments), ('submissions', 'id', submissions),
+                               ('grading_jobs', 'submission_id', submissions)):
+        moved = archive_rows(conn, table, column, ids)
+        if moved:
+            print(f"📦 Moved {moved} duplicate {table} rows to {table}_duplicates")
+    if submissions:
+        for table in ('submission_minhash', 'submission_lsh_buckets'):
+            conn.executemany(f'DELETE FROM {table} WHERE submission_id = ?', [(row_id,) for row_id in submissions])
+
+    conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_enrollments_student_course
+                    ON enrollments (student_id, course_id)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_course ON enrollments (course_id)')
+    conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_event_student
+                    ON submissions (event_id, student_id)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_submissions_student ON submissions (student_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_events_course_deadline ON events (course_id, deadline)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_courses_professor ON courses (professor_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_grading_jobs_submission ON grading_jobs (submission_id)')
+
+def add_source_text_columns(conn):
+    """Extracted text before preprocessing, which per-question grading splits on"""
+    add_column(conn, 'events', 'answer_source_text', 'TEXT')
+    add_column(conn, 'submissions', 'submission_source_text', 'TEXT')
+
+# (version, description, migration); append new migrations, never edit applied ones
+MIGRATIONS = [
+    (1, 'base tables', create_base_tables),
+    (2, 'grading status columns', add_grading_status_columns),
+    (3, 'structured feedback columns', add_structured_feedback_columns),
+    (4, 'pre-grade columns', add_pregrade_columns),
+    (5, 'grading jobs table', create_grading_jobs_table),
+    (6, 'near-duplicate index tables', create_near_duplicate_tables),
+    (7, 'hot path indexes and unique constraints', add_hot_path_indexes),
+    (8, 'source text columns', add_source_text_columns),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn, target=LATEST_VERSION):
+    """Apply the migrations newer than the database up to `target`; returns the resulting version"""
+    version = schema_version(conn)
+    for migration_version, description, migration in MIGRATIONS:
+        if migration_version <= version or migration_version > target:
+            continue
+        # Commit anything pending so the migration and its version bump share one transaction
+        conn.commit()
+        try:
+            conn.execute('BEGIN')
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {migration_version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"❌ Migration {migration_version} ({description}) failed")
+            raise
+        print(f"🗃  Applied migration {migration_version}: {description}")
+        version = migration_version
+    return version
+
+# The lookups of the hot routes, with the tables each must reach through an index
+ROUTE_QUERIES = [
+    ('enrollment check', queries.ENROLLMENT_CHECK, (1, 1)),
+    ('submission lookup', queries.SUBMISSION_LOOKUP, (1, 1)),
+    ('course event listing', queries.COURSE_EVENTS, (1,)),
+    ('course enrollment count', queries.COURSE_ENROLLMENT_COUNT, (1,)),
+    ('professor dashboard', queries.PROFESSOR_COURSES, (1,)),
+    ('student dashboard', queries.STUDENT_COURSES, (1,)),
+    ('assignment submissions', queries.ASSIGNMENT_SUBMISSIONS, (1,)),
+    ('student performance', queries.STUDENT_PERFORMANCE, (1, 1)),
+    ('course students', queries.COURSE_STUDENTS, (1, 1)),
+    ('grading job claim', grading_queue.CLAIM_SQL.format(condition=grading_queue.RUNNABLE_JOB), (0, 0)),
+    ('grading job claim by submission',
+     grading_queue.CLAIM_SQL.format(condition=grading_queue.SUBMISSION_JOB), (1, 0)),
+]
+
+def query_plan(conn, sql, params):
+    """EXPLAIN QUERY PLAN detail lines"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+def check_query_plans(conn):
+    """
+    Regression check for ROUTE_QUERIES: returns [(name, plan)] for every
+    query whose plan scans a whole table instead of using an index.
+    """
+    failures = []
+    for name, sql, params in ROUTE_QUERIES:
+        plan = query_plan(conn, sql, params)
+        if any(detail.startswith('SCAN') and 'INDEX' not in detail for detail in plan):
+            failures.append((name, plan))
+    return failures
+
+# Command line interface
+if __name__ == "__main__":
+    from database import connect
+
+    conn = connect(sys.argv[2] if len(sys.argv) > 2 else None)
+    version = migrate(conn)
+    print(f"✓ Schema at version {version}")
+    if len(sys.argv) > 1 and sys.argv[1] == 'check':
+        failures = check_query_plans(conn)
+        for name, sql, params in ROUTE_QUERIES:
+            print(f"{'✗' if any(name == failed for failed, _ in failures) else '✓'} {name}: "
+                  f"{'; '.join(query_plan(conn, sql, params))}")
+        conn.close()
+        sys.exit(1 if failures else 0)
+    conn.close()
@@ -0,0 +1,166 @@
+"""
+Near-duplicate detection for submissions.
+
+Every submission gets a MinHash signature of its word shingles when it is
+inserted. Signatures are split into LSH bands and each band is stored as a
+bucket row, so "which submissions are near-duplicates of this one" only
+looks at submissions sharing at least one bucket instead of comparing
+against every submission for the event. Candidates are then checked with
+the Jaccard similarity estimated from the signatures.
+"""
+import hashlib
+import os
+import re
+import zlib
+
+import numpy as np
+
+# Words per shingle
+SHINGLE_WORDS = int(os.getenv("AGS_NEAR_DUP_SHINGLE_WORDS", "5"))
+# LSH bands x rows per band = signature length. With 16 x 8, pairs at
+# Jaccard 0.8 share a bucket 99.96% of the time, pairs at 0.5 only 6%
+LSH_BANDS = int(os.getenv("AGS_NEAR_DUP_BANDS", "16"))
+LSH_ROWS = int(os.getenv("AGS_NEAR_DUP_ROWS", "8"))
+# Estimated Jaccard similarity at or above which two submissions are near-duplicates
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("AGS_NEAR_DUP_THRESHOLD", "0.8"))
+
+NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+_MERSENNE_PRIME = (1 << 31) - 1
+# Fixed seed: signatures stored in the database must stay comparable across restarts
+_rng = np.random.RandomState(1)
+_HASH_A = _rng.randint(1, _MERSENNE_PRIME, size=(NUM_PERMUTATIONS, 1), dtype=np.int64)
+_HASH_B = _rng.randint(0, _MERSENNE_PRIME, size=(NUM_PERMUTATIONS, 1), dtype=np.int64)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def shingle_hashes(text):
+    """Unique 31-bit hashes of the text's word shingles"""
+    words = _WORD.findall((text or "").lower())
+    if len(words) < SHINGLE_WORDS:
+        shingles = {" ".join(words)} if words else set()
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return np.fromiter((zlib.crc32(shingle.encode('utf-8')) % _MERSENNE_PRIME for shingle in shingles),
+                       dtype=np.int64, count=len(shingles))
+
+def minhash_signature(text, hashes=None):
+    """
+    MinHash signature (NUM_PERMUTATIONS uint32 values) of a text, or of its
+    precomputed shingle_hashes. Texts without shingles all get the same
+    signature, which is why index_submission does not index them.
+    """
+    if hashes is None:
+        hashes = shingle_hashes(text)
+    if not len(hashes):
+        return np.full(NUM_PERMUTATIONS, _MERSENNE_PRIME, dtype=np.uint32)
+    # One universal hash (a * x + b) mod p per permutation, minimum over shingles
+    return ((_HASH_A * hashes[np.newaxis, :] + _HASH_B) % _MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+def band_buckets(signature):
+    """One signed 64-bit bucket key per LSH band"""
+    bands = signature.reshape(LSH_BANDS, LSH_ROWS)
+    return [int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), 'little', signed=True)
+            for band in bands]
+
+def estimated_similarity(signature, other):
+    """Jaccard similarity estimated from two signatures"""
+    return float(np.mean(signature == other))
+
+def index_submission(conn, submission_id, event_id, text):
+    """
+    Store the signature and LSH buckets of a submission using the caller's
+    connection, so they are committed together with the submission row.
+    The writes run in a savepoint: if any of them fails, all are rolled
+    back and the caller's transaction is left as it was.
+    Texts without a single word (blank submissions, failed extractions)
+    are not indexed, so they match nothing: they would all share one
+    signature and look like copies of each other. Returns the signature,
+    or None if the text was not indexed.
+    """
+    hashes = shingle_hashes(text)
+    signature = minhash_signature(text, hashes) if len(hashes) else None
+    conn.execute('SAVEPOINT index_submission')
+    try:
+        conn.execute('DELETE FROM submission_lsh_buckets WHERE submission_id = ?', (submission_id,))
+        if signature is None:
+            conn.execute('DELETE FROM submission_minhash WHERE submission_id = ?', (submission_id,))
+        else:
+            conn.execute('''INSERT OR REPLACE INTO submission_minhash (submission_id, event_id, signature)
+                            VALUES (?, ?, ?)''', (submission_id, event_id, signature.tobytes()))
+            conn.executemany('''INSERT INTO submission_lsh_buckets (event_id, band, bucket, submission_id)
+                                VALUES (?, ?, ?, ?)''',
+                             [(event_id, band, bucket, submission_id)
+                              for band, bucket in enumerate(band_buckets(signature))])
+    except BaseException:
+        conn.execute('ROLLBACK TO index_submission')
+        conn.execute('RELEASE index_submission')
+        raise
+    conn.execute('RELEASE index_submission')
+    return signature
+
+def index_missing_submissions(conn, event_id):
+    """
+    Index the event's submissions that have no signature yet (made before
+    indexing existed); returns how many were indexed. Blank submissions
+    stay unindexed and are looked at again on the next call.
+    """
+    rows = conn.execute('''SELECT s.id, s.submission_text FROM submissions s
+                           LEFT JOIN submission_minhash m ON m.submission_id = s.id
+                           WHERE s.event_id = ? AND m.submission_id IS NULL''', (event_id,)).fetchall()
+    indexed = sum(1 for submission_id, text in rows
+                  if index_submission(conn, submission_id, event_id, text) is not None)
+    if rows:
+        conn.commit()
+    if indexed:
+        print(f"🔎 Indexed {indexed} existing submissions of event {event_id} for near-duplicate detection")
+    return indexed
+
+def find_near_duplicates(conn, submission_id, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Near-duplicates of one submission within its event, most similar first:
+    [(submission_id, estimated_similarity)]. Only submissions sharing an
+    LSH bucket are compared.
+    """
+    row = conn.execute('SELECT event_id, signature FROM submission_minhash WHERE submission_id = ?',
+                       (submission_id,)).fetchone()
+    if not row:
+        return []
+    event_id, signature = row[0], np.frombuffer(row[1], dtype=np.uint32)
+    # One index lookup per band (an OR across bands would scan the event's buckets)
+    band_lookup = '''SELECT submission_id FROM submission_lsh_buckets
+                     WHERE event_id = ? AND band = ? AND bucket = ?'''
+    candidates = conn.execute(f'''SELECT submission_id, signature FROM submission_minhash
+                                  WHERE submission_id != ? AND submission_id IN
+                                      ({" UNION ".join(band_lookup for _ in range(LSH_BANDS))})''',
+                              [submission_id] + [value for band, bucket in enumerate(band_buckets(signature))
+                                                 for value in (event_id, band, bucket)]).fetchall()
+    matches = []
+    for candidate_id, candidate_signature in candidates:
+        similarity = estimated_similarity(signature, np.frombuffer(candidate_signature, dtype=np.uint32))
+        if similarity >= threshold:
+            matches.append((candidate_id, similarity))
+    return sorted(matches, key=lambda match: -match[1])
+
+def find_event_near_duplicates(conn, event_id, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    All near-duplicate pairs within an event: [(submission_id, other_id,
+    estimated_similarity)] with submission_id < other_id, most similar first.
+    Pairs come from a self-join on the LSH buckets, not all n^2 pairs.
+    """
+    pairs = conn.execute('''SELECT DISTINCT a.submission_id, b.submission_id
+                            FROM submission_lsh_buckets a
+                            JOIN submission_lsh_buckets b
+                              ON b.event_id = a.event_id AND b.band = a.band AND b.bucket = a.bucket
+                             AND b.submission_id > a.submission_id
+                            WHERE a.event_id = ?''', (event_id,)).fetchall()
+    if not pairs:
+        return []
+    signatures = {submission_id: np.frombuffer(signature, dtype=np.uint32) for submission_id, signature in
+                  conn.execute('SELECT submission_id, signature FROM submission_minhash WHERE event_id = ?',
+                               (event_id,))}
+    matches = []
+    for first, second in pairs:
+        similarity = estimated_similarity(signatures[first], signatures[second])
+        if similarity >= threshold:
+            matches.append((first, second, similarity))
+    return sorted(matches, key=lambda match: -match[2])
@@ -0,0 +1,182 @@
+"""
+Local lexical pre-grading.
+
+Scores a submission against the event's answer key in a few milliseconds,
+using TF-IDF cosine similarity and word trigram overlap computed with
+NumPy. The score gives the student an instant provisional grade and
+decides whether the AI grading call can be skipped (blank submissions,
+copies of the answer key, near-perfect matches) or deprioritized.
+"""
+import math
+import os
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from question_split import split_questions
+
+# Run the pre-grader on new submissions
+PREGRADING = os.getenv("AGS_PREGRADING", "true").lower() in ("1", "true", "yes")
+# Submissions with fewer words are blank: grade 0 without an AI call
+PREGRADE_MIN_WORDS = int(os.getenv("AGS_PREGRADE_MIN_WORDS", "5"))
+# Trigram overlap, in both directions, above which a submission is a copy of the answer key
+PREGRADE_COPY_OVERLAP = float(os.getenv("AGS_PREGRADE_COPY_OVERLAP", "0.97"))
+# Similarity score at or above which the AI call is skipped
+PREGRADE_SKIP_SCORE = float(os.getenv("AGS_PREGRADE_SKIP_SCORE", "0.97"))
+# Scores at or above this (or at or below PREGRADE_ZERO_SCORE) are confident: grade them last
+PREGRADE_DEPRIORITIZE_SCORE = float(os.getenv("AGS_PREGRADE_DEPRIORITIZE_SCORE", "0.75"))
+# Similarity scores mapped to a provisional 0/10 and 10/10
+PREGRADE_ZERO_SCORE = float(os.getenv("AGS_PREGRADE_ZERO_SCORE", "0.1"))
+PREGRADE_FULL_SCORE = float(os.getenv("AGS_PREGRADE_FULL_SCORE", "0.8"))
+
+SKIP = 'skip'
+DEPRIORITIZE = 'deprioritize'
+GRADE = 'grade'
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return _WORD.findall((text or "").lower())
+
+class PreGrade:
+    """Outcome of pre-grading one submission"""
+
+    def __init__(self, words, cosine, overlap, copy_overlap):
+        self.words = words
+        self.cosine = cosine            # TF-IDF cosine similarity to the answer key
+        self.overlap = overlap          # share of answer-key trigrams found in the submission
+        self.copy_overlap = copy_overlap  # share of submission trigrams found in the answer key
+        self.score = 0.5 * cosine + 0.5 * overlap
+        span = max(PREGRADE_FULL_SCORE - PREGRADE_ZERO_SCORE, 1e-9)
+        self.provisional_grade = int(round(10 * min(1.0, max(0.0, (self.score - PREGRADE_ZERO_SCORE) / span))))
+        self.decision, self.reason = self._decide()
+        self.seconds = 0.0
+
+    def _decide(self):
+        if self.words < PREGRADE_MIN_WORDS:
+            self.provisional_grade = 0
+            return SKIP, 'blank submission'
+        if min(self.overlap, self.copy_overlap) >= PREGRADE_COPY_OVERLAP:
+            self.provisional_grade = 10
+            return SKIP, 'copy of the answer key'
+        if self.score >= PREGRADE_SKIP_SCORE:
+            return SKIP, 'near-perfect match'
+        if self.score >= PREGRADE_DEPRIORITIZE_SCORE or self.score <= PREGRADE_ZERO_SCORE:
+            return DEPRIORITIZE, 'confident provisional grade'
+        return GRADE, 'needs AI grading'
+
+    def feedback(self):
+        """Feedback stored for a submission whose AI call was skipped"""
+        if self.reason == 'blank submission':
+            detail = (f"The submission contains almost no text ({self.words} words), "
+                      f"so it was not sent for AI grading.")
+        else:
+            detail = (f"The submission matches the answer key almost exactly "
+                      f"({self.score:.0%} similarity), so it was graded without AI review.")
+        return f"""Grade: {self.provisional_grade}/10
+
+**Feedback:**
+{detail}
+
+If you think this is wrong, please contact your professor.
+"""
+
+    def as_dict(self):
+        return {
+            'provisional_grade': self.provisional_grade,
+            'score': round(self.score, 4),
+            'cosine': round(self.cosine, 4),
+            'overlap': round(self.overlap, 4),
+            'decision': self.decision,
+            'reason': self.reason,
+            'milliseconds': round(self.seconds * 1000, 2),
+        }
+
+class AnswerKeyModel:
+    """
+    TF-IDF weights and trigrams of one answer key.
+
+    Document frequencies come from the answer key's own questions (or
+    lines when it has no numbered questions), so words used throughout the
+    key ("the", "is") weigh less than question-specific terms. Words that
+    only occur in the submission get the highest IDF.
+    """
+
+    def __init__(self, answer_key_text):
+        tokens = tokenize(answer_key_text)
+        self.vocab = {}
+        for token in tokens:
+            self.vocab.setdefault(token, len(self.vocab))
+        size = len(self.vocab)
+        # The submission-only sentinel id `size` breaks n-grams that leave the key's vocabulary
+        self.base = size + 1
+
+        parts = [text for _, text in split_questions(answer_key_text)] or \
+            [line for line in (answer_key_text or "").splitlines() if line.strip()]
+        document_ids = [np.unique(self.ids(tokenize(part))) for part in parts] or [np.arange(size)]
+        df = np.bincount(np.concatenate(document_ids), minlength=self.base)[:size]
+        self.idf = np.log((1 + len(document_ids)) / (1 + df)) + 1.0
+        self.unknown_idf = math.log(1 + len(document_ids)) + 1.0
+
+        self.weights = self._tf(np.bincount(self.ids(tokens), minlength=size)) * self.idf
+        self.norm = float(np.linalg.norm(self.weights))
+        self.ngrams = np.unique(self.ngram_ids(self.ids(tokens)))
+
+    def ids(self, tokens):
+        """Vocabulary ids of tokens; words outside the answer key map to the sentinel id"""
+        sentinel = self.base - 1
+        return np.fromiter((self.vocab.get(token, sentinel) for token in tokens), dtype=np.int64,
+                           count=len(tokens))
+
+    def ngram_ids(self, ids, n=3):
+        """Integer ids of the word n-grams (unigrams for very short texts)"""
+        if len(ids) < n:
+            return ids
+        base = self.base
+        grams = np.zeros(len(ids) - n + 1, dtype=np.int64)
+        for offset in range(n):
+            grams = grams * base + ids[offset:len(ids) - n + 1 + offset]
+        return grams
+
+    @staticmethod
+    def _tf(counts):
+        """Sublinear term frequency: 1 + log(count)"""
+        tf = np.zeros(len(counts), dtype=np.float64)
+        present = counts > 0
+        tf[present] = 1.0 + np.log(counts[present])
+        return tf
+
+    def score(self, submission_text):
+        tokens = tokenize(submission_text)
+        ids = self.ids(tokens)
+        size = len(self.vocab)
+        known = ids[ids < size]
+        weights = self._tf(np.bincount(known, minlength=size)) * self.idf
+        unknown_counts = np.array(list(Counter(token for token in tokens if token not in self.vocab).values()),
+                                  dtype=np.float64)
+        unknown_norm_sq = float(np.sum(((1.0 + np.log(unknown_counts)) * self.unknown_idf) ** 2)) \
+            if len(unknown_counts) else 0.0
+        norm = math.sqrt(float(weights @ weights) + unknown_norm_sq)
+        cosine = float(weights @ self.weights) / (norm * self.norm) if norm and self.norm else 0.0
+
+        grams = np.unique(self.ngram_ids(ids))
+        overlap = float(np.isin(self.ngrams, grams).mean()) if len(self.ngrams) else 0.0
+        copy_overlap = float(np.isin(grams, self.ngrams).mean()) if len(grams) else 0.0
+        return PreGrade(len(tokens), cosine, overlap, copy_overlap)
+
+@lru_cache(maxsize=64)
+def get_answer_key_model(answer_key_text):
+    """Build (once per distinct answer key) the answer-key model"""
+    return AnswerKeyModel(answer_key_text)
+
+def pregrade(answer_key_text, submission_text):
+    """Pre-grade a submission; None when there is no answer key to compare against"""
+    if not (answer_key_text or "").strip():
+        return None
+    start = time.perf_counter()
+    result = get_answer_key_model(answer_key_text).score(submission_text)
+    result.seconds = time.perf_counter() - start
+    return result
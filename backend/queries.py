@@ -0,0 +1,56 @@
+"""
+SQL of the hot route lookups.
+
+app.py runs these statements and migrations.check_query_plans checks
+their plans (EXPLAIN QUERY PLAN), so the checked SQL is always the SQL
+the routes run. Change a query here and the plan check covers it.
+"""
+
+ENROLLMENT_CHECK = 'SELECT * FROM enrollments WHERE student_id = ? AND course_id = ?'
+
+SUBMISSION_LOOKUP = 'SELECT * FROM submissions WHERE event_id = ? AND student_id = ?'
+
+COURSE_EVENTS = 'SELECT * FROM events WHERE course_id = ? ORDER BY deadline ASC'
+
+COURSE_ENROLLMENT_COUNT = 'SELECT COUNT(*) as count FROM enrollments WHERE course_id = ?'
+
+# (professor_id)
+PROFESSOR_COURSES = '''SELECT c.*, COUNT(e.id) as enrollment_count
+                       FROM courses c
+                       LEFT JOIN enrollments e ON c.id = e.course_id
+                       WHERE c.professor_id = ?
+                       GROUP BY c.id'''
+
+# (student_id)
+STUDENT_COURSES = '''SELECT c.*, e.enrolled_at
+                     FROM courses c
+                     JOIN enrollments e ON c.id = e.course_id
+                     WHERE e.student_id = ?'''
+
+# (event_id)
+ASSIGNMENT_SUBMISSIONS = '''SELECT s.*, u.username
+                            FROM submissions s
+                            JOIN users u ON s.student_id = u.id
+                            WHERE s.event_id = ?
+                            ORDER BY s.submitted_at DESC'''
+
+# (course_id, course_id)
+COURSE_STUDENTS = '''SELECT u.id, u.username, u.email, u.created_at as user_created_at,
+                            e.enrolled_at, e.id as enrollment_id,
+                            COUNT(s.id) as total_submissions,
+                            AVG(CASE WHEN s.grade IS NOT NULL THEN s.grade END) as avg_grade
+                     FROM users u
+                     JOIN enrollments e ON u.id = e.student_id
+                     LEFT JOIN submissions s ON u.id = s.student_id
+                     LEFT JOIN events ev ON s.event_id = ev.id AND ev.course_id = ?
+                     WHERE e.course_id = ? AND u.user_type = 'student'
+                     GROUP BY u.id, u.username, u.email, u.created_at, e.enrolled_at, e.id
+                     ORDER BY e.enrolled_at DESC'''
+
+# (student_id, course_id)
+STUDENT_PERFORMANCE = '''SELECT e.id, e.event_name, e.event_type, e.deadline, e.created_at,
+                                s.id as submission_id, s.grade, s.feedback, s.submitted_at, s.grading_status
+                         FROM events e
+                         LEFT JOIN submissions s ON e.id = s.event_id AND s.student_id = ?
+                         WHERE e.course_id = ?
+                         ORDER BY e.deadline ASC'''
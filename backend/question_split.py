@@ -0,0 +1,58 @@
+"""
+Splitting answer keys and submissions into numbered questions.
+
+Used by per-question (chunked) grading: the answer key and the student's
+submission are cut at question markers such as "1.", "2)", "Q3:" or
+"Question 4", and the parts are paired up by question number.
+"""
+import re
+
+# A question marker at the start of a line: optional markdown bold and
+# "Question"/"Q"/"Problem"/"Exercise" label, then the number and ".", ")" or ":"
+QUESTION_MARKER = re.compile(
+    r"^([ \t]*)(?:\*\*)?[ \t]*(?:(?:question|problem|exercise|q)[ \t]*#?[ \t]*)?(\d{1,3})[ \t]*[.):]",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+def split_questions(text, max_number=None):
+    """
+    Split text into [(number, text)] at question markers.
+    Markers must count up from 1 one at a time or, with `max_number`, may
+    skip numbers up to `max_number` (unanswered questions). Markers that
+    break the sequence or are indented deeper than the first one (a
+    numbered list inside an answer, a year, ...) stay part of the current
+    question. Text before the first marker is dropped.
+    """
+    starts = []  # (number, offset)
+    indent = None
+    for match in QUESTION_MARKER.finditer(text or ""):
+        number = int(match.group(2))
+        last = starts[-1][0] if starts else 0
+        if max_number is None:
+            in_sequence = number == last + 1
+        else:
+            in_sequence = last < number <= max_number
+        if not in_sequence or (indent is not None and len(match.group(1)) > indent):
+            continue
+        if indent is None:
+            indent = len(match.group(1))
+        starts.append((number, match.start()))
+    ends = [offset for _, offset in starts[1:]] + [len(text or "")]
+    return [(number, text[start:end].strip()) for (number, start), end in zip(starts, ends)]
+
+def align_questions(answer_key_text, student_answer_text, min_questions=2):
+    """
+    Pair answer-key questions with the student's answers by number.
+    Returns [(number, answer_key_part, student_part)], with an empty
+    student part for unanswered questions, or None if the answer key has
+    fewer than `min_questions` questions or the submission has no question
+    markers (grade it as a whole instead).
+    """
+    key_questions = split_questions(answer_key_text)
+    if len(key_questions) < min_questions:
+        return None
+    student_questions = dict(split_questions(student_answer_text, max_number=len(key_questions)))
+    if not student_questions:
+        return None
+    return [(number, key_part, student_questions.get(number, ""))
+            for number, key_part in key_questions]
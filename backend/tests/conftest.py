@@ -0,0 +1,29 @@
+"""
+Test setup: the backend modules are imported flat (as app.py imports
+them), databases and caches live in temporary directories and grading
+uses the local stand-in backend instead of Gemini.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="ags-tests-")
+os.environ.setdefault("AGS_DATABASE", os.path.join(_tmp, "ags.db"))
+os.environ.setdefault("AGS_CACHE_DIR", os.path.join(_tmp, "cache"))
+os.environ.setdefault("AGS_GRADER_BACKEND", "local")
+os.environ.setdefault("AGS_START_GRADING_WORKERS", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+@pytest.fixture
+def app_db(tmp_path, monkeypatch):
+    """A freshly migrated database that app.get_db() connects to"""
+    import app
+    database.close_pool()
+    monkeypatch.setattr(database, 'DATABASE_PATH', str(tmp_path / "ags.db"))
+    app.init_db()
+    yield app
+    database.close_pool()
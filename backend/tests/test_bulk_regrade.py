@@ -0,0 +1,93 @@
+import automated_grading
+from bulk_regrade import BulkRegrader
+from grader_backends import LocalGraderBackend
+
+def add_graded_submission(app, grade=8, feedback="Grade: 8/10\n\nGood work."):
+    conn = app.get_db()
+    try:
+        event_id = conn.execute('''INSERT INTO events (course_id, event_name, event_type, answer_text)
+                                   VALUES (1, 'Assignment', 'assignment', 'the answer key')''').lastrowid
+        conn.execute('''INSERT INTO submissions (event_id, student_id, submission_text, grade, feedback,
+                                                 grading_status)
+                        VALUES (?, 1, 'the answer', ?, ?, 'completed')''', (event_id, grade, feedback))
+        conn.commit()
+        return event_id
+    finally:
+        conn.close()
+
+def regrade(app, event_id):
+    conn = app.get_db()
+    rows = [dict(row) for row in conn.execute('''SELECT s.id, s.student_id, s.submission_text,
+                                                        e.answer_text, e.instructions_text
+                                                 FROM submissions s JOIN events e ON s.event_id = e.id
+                                                 WHERE s.event_id = ?''', (event_id,))]
+    conn.close()
+    return app.bulk_regrader.run(event_id, rows).progress()
+
+def stored(app, event_id):
+    conn = app.get_db()
+    try:
+        return tuple(conn.execute('SELECT grade, feedback, grading_status FROM submissions WHERE event_id = ?',
+                                  (event_id,)).fetchone())
+    finally:
+        conn.close()
+
+def test_failed_regrade_keeps_the_previous_result(app_db, monkeypatch):
+    monkeypatch.setattr(automated_grading, 'grader_backend', LocalGraderBackend(latency="fixed:0", error_rate=1.0))
+    event_id = add_graded_submission(app_db)
+    before = stored(app_db, event_id)
+
+    progress = regrade(app_db, event_id)
+
+    assert stored(app_db, event_id) == before
+    assert (progress['graded'], progress['failed'], progress['written']) == (0, 1, 0)
+    assert 'GradingFailed' in progress['failures'][0]['error']
+
+def test_regrade_does_not_replay_the_cached_response(app_db, monkeypatch):
+    backend = LocalGraderBackend(latency="fixed:0")
+    monkeypatch.setattr(automated_grading, 'grader_backend', backend)
+    event_id = add_graded_submission(app_db)
+
+    regrade(app_db, event_id)
+    progress = regrade(app_db, event_id)
+
+    assert backend.calls == 2
+    assert (progress['graded'], progress['written']) == (1, 1)
+    assert stored(app_db, event_id)[2] == 'completed'
+
+def queue_job(app, event_id):
+    conn = app.get_db()
+    try:
+        submission_id = conn.execute('SELECT id FROM submissions WHERE event_id = ?', (event_id,)).fetchone()[0]
+        app.grading_job_queue.enqueue(submission_id, conn)
+        conn.commit()
+        return submission_id
+    finally:
+        conn.close()
+
+def test_submission_with_an_active_job_is_left_to_the_queue(app_db, monkeypatch):
+    backend = LocalGraderBackend(latency="fixed:0")
+    monkeypatch.setattr(automated_grading, 'grader_backend', backend)
+    event_id = add_graded_submission(app_db)
+    submission_id = queue_job(app_db, event_id)
+    before = stored(app_db, event_id)
+
+    progress = regrade(app_db, event_id)
+
+    assert backend.calls == 0
+    assert stored(app_db, event_id) == before
+    assert (progress['skipped'], progress['skipped_submissions'], progress['written']) == (1, [submission_id], 0)
+
+def test_job_queued_during_the_regrade_wins(app_db):
+    event_id = add_graded_submission(app_db)
+    before = stored(app_db, event_id)
+
+    def grade_while_a_job_is_queued(submission):
+        queue_job(app_db, event_id)  # e.g. the submission is graded again by the queue meanwhile
+        return 3, "Grade: 3/10\n\nRegraded.", True, None
+
+    regrader = BulkRegrader(app_db.get_db, grade_while_a_job_is_queued)
+    progress = regrader.run(event_id, [{'id': 1}]).progress()
+
+    assert stored(app_db, event_id) == before
+    assert (progress['graded'], progress['skipped'], progress['written']) == (0, 1, 0)
@@ -0,0 +1,68 @@
+import io
+
+import fitz
+import pytest
+
+import automated_grading
+import text_extraction
+from grader_backends import LocalGraderBackend
+
+ANSWER_KEY = """1. Two plus two is four, since addition combines both quantities.
+2. The area of a circle with radius 5 is 25 pi, about 78.54 square units.
+3) The Pythagorean theorem states that a squared plus b squared equals c squared.
+Question 4: Photosynthesis converts light energy into chemical energy in plants.
+"""
+
+SUBMISSION = """1. Two plus two equals four.
+2. The area is 25 pi, roughly 78.5.
+3) In a right triangle a squared plus b squared equals c squared.
+Q4: Plants turn light into sugar.
+"""
+
+def pdf_upload(text):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=11)
+    data = doc.tobytes()
+    doc.close()
+    return io.BytesIO(data)
+
+@pytest.fixture(params=["fast", "nltk"])
+def preprocessor(request, monkeypatch):
+    monkeypatch.setattr(text_extraction, 'PREPROCESSOR', request.param)
+    return request.param
+
+def test_stored_text_is_graded_question_by_question(app_db, preprocessor, monkeypatch):
+    answer_text, answer_source = app_db.extract_text_from_pdf(pdf_upload(ANSWER_KEY), with_source=True)
+    submission_text, submission_source = app_db.extract_text_from_pdf(pdf_upload(SUBMISSION), with_source=True)
+    conn = app_db.get_db()
+    event_id = conn.execute('''INSERT INTO events (course_id, event_name, event_type, answer_text, answer_source_text)
+                               VALUES (1, 'Quiz', 'quiz', ?, ?)''', (answer_text, answer_source)).lastrowid
+    submission_id = conn.execute('''INSERT INTO submissions (event_id, student_id, submission_text,
+                                                             submission_source_text)
+                                    VALUES (?, 1, ?, ?)''',
+                                 (event_id, submission_text, submission_source)).lastrowid
+    conn.commit()
+    conn.close()
+
+    backend = LocalGraderBackend(latency="fixed:0")
+    monkeypatch.setattr(automated_grading, 'grader_backend', backend)
+    monkeypatch.setattr(automated_grading, 'CHUNKED_GRADING', True)
+    app_db.grade_submission(submission_id)
+
+    assert backend.calls == 4
+    conn = app_db.get_db()
+    grade, feedback, status = conn.execute('SELECT grade, feedback, grading_status FROM submissions WHERE id = ?',
+                                           (submission_id,)).fetchone()
+    conn.close()
+    assert status == 'completed' and grade is not None
+    assert "4 questions" in feedback
+
+def test_questions_are_preprocessed_after_splitting(preprocessor, monkeypatch):
+    monkeypatch.setattr(automated_grading, 'CHUNKED_GRADING', True)
+    questions = automated_grading.chunked_questions("", "", ANSWER_KEY, SUBMISSION)
+
+    assert [number for number, _, _ in questions] == [1, 2, 3, 4]
+    for number, key_part, student_part in questions:
+        assert key_part == text_extraction.preprocess_chunk(ANSWER_KEY.splitlines()[number - 1])
+        assert student_part == text_extraction.preprocess_chunk(SUBMISSION.splitlines()[number - 1])
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+import automated_grading
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+@pytest.fixture
+def half_open_breakers(monkeypatch):
+    """Every model's breaker opened by failures and ready to let one probe through"""
+    breakers = {name: CircuitBreaker(name, min_calls=1, open_seconds=0)
+                for name in automated_grading.GeminiBackend.models}
+    for breaker in breakers.values():
+        breaker.record_failure("503")
+        assert breaker.state == OPEN
+    monkeypatch.setattr(automated_grading, 'get_breaker', breakers.__getitem__)
+    return breakers
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    def stream_with_prefix(model_name, prefix, submission_part):
+        yield "Grade: 8/10\n"
+        yield "**Detailed Feedback:**\n"
+        yield "Good work.\n"
+    monkeypatch.setattr(automated_grading, 'stream_with_prefix', stream_with_prefix)
+
+def test_closing_the_stream_mid_probe_releases_the_breaker(half_open_breakers, fake_stream):
+    primary = half_open_breakers[automated_grading.GRADING_MODEL]
+    chunks = automated_grading.GeminiBackend().stream(None, "answer")
+
+    assert next(chunks) == "Grade: 8/10\n"
+    assert primary.state == HALF_OPEN and not primary.allow()
+    chunks.close()  # what an SSE client disconnect does to the generator
+
+    assert primary.allow()
+
+def test_disconnect_through_stream_enhanced_response_releases_the_breaker(half_open_breakers, fake_stream,
+                                                                          monkeypatch):
+    monkeypatch.setattr(automated_grading.GeminiBackend, 'available', lambda self: True)
+    monkeypatch.setattr(automated_grading, 'grader_backend', automated_grading.GeminiBackend())
+    monkeypatch.setattr(automated_grading, 'get_prompt_prefix', lambda *args, **kwargs: None)
+    primary = half_open_breakers[automated_grading.GRADING_MODEL]
+    chunks = automated_grading.stream_enhanced_response("", "disconnect test key", "disconnect test answer")
+
+    next(chunks)
+    chunks.close()
+
+    assert primary.allow()
+
+def test_completed_stream_closes_the_breaker(half_open_breakers, fake_stream):
+    primary = half_open_breakers[automated_grading.GRADING_MODEL]
+
+    assert "".join(automated_grading.GeminiBackend().stream(None, "answer")).startswith("Grade: 8/10")
+    assert primary.state == CLOSED
+
+def test_breaker_opens_on_error_rate_and_probes_after_cool_down():
+    breaker = CircuitBreaker("model", min_calls=4, error_rate=0.5, open_seconds=0.05)
+    breaker.record_success()
+    breaker.record_failure("503")
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.record_failure("503")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure("503")
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()['rejected'] == 2
+
+def test_open_primary_is_skipped_without_a_call(monkeypatch):
+    breakers = {name: CircuitBreaker(name, min_calls=1) for name in automated_grading.GeminiBackend.models}
+    breakers[automated_grading.GRADING_MODEL].record_failure("503")
+    called = []
+
+    def generate_with_prefix(model_name, prefix, submission_part):
+        called.append(model_name)
+        return "Grade: 7/10\n"
+
+    monkeypatch.setattr(automated_grading, 'get_breaker', breakers.__getitem__)
+    monkeypatch.setattr(automated_grading, 'generate_with_prefix', generate_with_prefix)
+
+    result = automated_grading.GeminiBackend().generate_with_model(None, "answer")
+
+    assert result == ("Grade: 7/10\n", automated_grading.FALLBACK_GRADING_MODEL)
+    assert called == [automated_grading.FALLBACK_GRADING_MODEL]
@@ -0,0 +1,53 @@
+import sqlite3
+import threading
+
+import pytest
+
+import database
+
+@pytest.fixture
+def db_path(tmp_path):
+    database.close_pool()
+    yield str(tmp_path / "pool.db")
+    database.close_pool()
+
+def test_closed_connection_is_reused_on_another_thread(db_path):
+    conn = database.connect(db_path)
+    conn.close()
+    reused = []
+    thread = threading.Thread(target=lambda: reused.append(database.connect(db_path)))
+    thread.start()
+    thread.join()
+
+    assert reused[0] is conn
+    assert database.pool_stats() == {db_path: 0}
+    conn.close()
+
+def test_connections_use_wal_and_tuned_pragmas(db_path):
+    conn = database.connect(db_path)
+
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == database.DB_BUSY_TIMEOUT_MS
+    conn.close()
+
+def test_open_transaction_is_rolled_back_when_returned(db_path):
+    conn = database.connect(db_path)
+    conn.execute('CREATE TABLE notes (text TEXT)')
+    conn.commit()
+    conn.execute("INSERT INTO notes VALUES ('uncommitted')")
+    conn.close()
+    conn.close()  # closing an idle connection again is a no-op
+
+    assert database.connect(db_path).execute('SELECT COUNT(*) FROM notes').fetchone()[0] == 0
+    assert database.pool_stats() == {db_path: 0}
+
+def test_pool_keeps_at_most_the_pool_size_idle(db_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_POOL_SIZE', 2)
+    connections = [database.connect(db_path) for _ in range(3)]
+    for conn in connections:
+        conn.close()
+
+    assert database.pool_stats() == {db_path: 2}
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[2].execute('SELECT 1')
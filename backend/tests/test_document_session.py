@@ -0,0 +1,36 @@
+import fitz
+
+import text_extraction
+
+def pdf_with_image(pages=2):
+    doc = fitz.open()
+    image = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+    image.clear_with(120)
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(72, 200, 520, 700), f"Answer {number + 1}: the integral of 2x is x "
+                                                          "squared plus a constant. " * 8)
+        page.insert_image(fitz.Rect(72, 72, 136, 136), pixmap=image)
+    return doc.tobytes()
+
+def test_every_stage_shares_one_open_document(monkeypatch):
+    opened = []
+    fitz_open = fitz.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args)
+        return fitz_open(*args, **kwargs)
+
+    monkeypatch.setattr(text_extraction.fitz, 'open', counting_open)
+
+    assert "integral" in text_extraction.convert_pdf_to_txt(pdf_with_image())
+    assert len(opened) == 1
+
+def test_existing_session_is_reused_and_left_open():
+    with text_extraction.DocumentSession(pdf_with_image()) as session:
+        with text_extraction.document_session(session) as shared:
+            assert shared is session
+            assert shared.page(0) is session.page(0)
+        assert session.doc is not None
+        assert len(session) == 2
+    assert session.doc is None
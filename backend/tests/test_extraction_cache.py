@@ -0,0 +1,74 @@
+import io
+
+import pytest
+
+import text_extraction
+from disk_cache import DiskCache
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), 20)
+    cache.set("a", "x" * 8)
+    cache.set("b", "y" * 8)
+    assert cache.get("a") == "x" * 8
+
+    cache.set("c", "z" * 8)
+
+    assert cache.get("a") == "x" * 8
+    assert cache.get("b") is None
+    assert cache.get("c") == "z" * 8
+    assert cache.stats()['evictions'] == 1
+
+def test_entries_survive_a_new_cache_instance(tmp_path):
+    DiskCache(str(tmp_path), 20).set("a", "x" * 12)
+    cache = DiskCache(str(tmp_path), 20)
+
+    cache.set("b", "y" * 12)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 12
+
+def test_oversized_values_and_disabled_caches_store_nothing(tmp_path):
+    cache = DiskCache(str(tmp_path / "small"), 4)
+    disabled = DiskCache(str(tmp_path / "disabled"), 0)
+
+    cache.set("a", "too long")
+    disabled.set("a", "x")
+
+    assert cache.get("a") is None
+    assert disabled.get("a") is None
+
+@pytest.fixture
+def extractions(monkeypatch, tmp_path):
+    """convert_pdf_to_txt calls made by extract_text_for_flask, on an empty cache"""
+    calls = []
+    results = {}
+
+    def convert_pdf_to_txt(pdf_bytes, with_source=False):
+        calls.append(pdf_bytes)
+        text = results.get(pdf_bytes, f"text of {pdf_bytes.decode()}")
+        return text, text
+
+    monkeypatch.setattr(text_extraction, 'convert_pdf_to_txt', convert_pdf_to_txt)
+    monkeypatch.setattr(text_extraction, 'extraction_cache', DiskCache(str(tmp_path), 1 << 20))
+    return calls, results
+
+def test_identical_pdfs_are_extracted_once(extractions):
+    calls, _ = extractions
+
+    first = text_extraction.extract_text_for_flask(io.BytesIO(b"pdf one"))
+    again = text_extraction.extract_text_for_flask(io.BytesIO(b"pdf one"), with_source=True)
+    other = text_extraction.extract_text_for_flask(io.BytesIO(b"pdf two"))
+
+    assert first == "text of pdf one"
+    assert again == ("text of pdf one", "text of pdf one")
+    assert other == "text of pdf two"
+    assert calls == [b"pdf one", b"pdf two"]
+
+def test_failed_extraction_is_not_cached(extractions):
+    calls, results = extractions
+    results[b"scan"] = text_extraction.EXTRACTION_FAILED_MESSAGE
+
+    text_extraction.extract_text_for_flask(io.BytesIO(b"scan"))
+    text_extraction.extract_text_for_flask(io.BytesIO(b"scan"))
+
+    assert calls == [b"scan", b"scan"]
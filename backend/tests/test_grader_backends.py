@@ -0,0 +1,63 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from grader_backends import GraderBackend, GraderBackendError, LocalGraderBackend, RateLimited, parse_latency
+
+def prefix(answer_key, output_format="text"):
+    return SimpleNamespace(answer_key_text=answer_key, instructions_text="", output_format=output_format)
+
+def test_backend_without_generate_cannot_be_created():
+    class Incomplete(GraderBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_backend_gets_model_reporting_and_streaming_from_generate():
+    class Echo(GraderBackend):
+        name = "echo"
+        model_name = "echo-1"
+
+        def generate(self, prefix, student_answer_text):
+            return f"Grade: 8/10\n{student_answer_text}"
+
+    backend = Echo()
+    stream = backend.stream(None, "answer")
+
+    assert backend.generate_with_model(None, "answer") == ("Grade: 8/10\nanswer", "echo-1")
+    assert next(stream) == "Grade: 8/10\nanswer"
+    with pytest.raises(StopIteration) as stop:
+        next(stream)
+    assert stop.value.value == "echo-1"
+
+def test_local_backend_grades_by_answer_key_coverage():
+    backend = LocalGraderBackend(latency="fixed:0")
+    key = prefix("force equals mass times acceleration")
+
+    first = backend.generate(key, "Force is mass times acceleration")
+    again = backend.generate(key, "Force is mass times acceleration")
+    streamed = "".join(backend.stream(key, "Force is mass times acceleration"))
+
+    assert first.startswith("Grade: 8/10")
+    assert again == first == streamed
+    assert json.loads(backend.generate(prefix("force", "json"), "no idea"))['grade'] == 0
+
+def test_local_backend_simulates_errors_and_rate_limits():
+    failing = LocalGraderBackend(latency="fixed:0", error_rate=1.0)
+    limited = LocalGraderBackend(latency="fixed:0", rate_limit_per_minute=2)
+
+    with pytest.raises(GraderBackendError):
+        failing.generate(prefix("x"), "x")
+    limited.generate(prefix("x"), "x")
+    limited.generate(prefix("x"), "x")
+    with pytest.raises(RateLimited):
+        limited.generate(prefix("x"), "x")
+    assert failing.stats()['errors'] == 1
+    assert limited.stats() == {'calls': 3, 'errors': 0, 'rate_limited': 1}
+
+def test_latency_specs():
+    assert parse_latency("fixed:0.5")(None) == 0.5
+    with pytest.raises(ValueError):
+        parse_latency("normal:1")
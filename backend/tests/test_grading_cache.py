@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+import pytest
+
+import automated_grading
+from circuit_breaker import CircuitBreaker
+from disk_cache import DiskCache
+
+@pytest.fixture
+def gemini(monkeypatch, tmp_path):
+    """GeminiBackend whose models answer with their own name, on an empty cache"""
+    breakers = {name: CircuitBreaker(name) for name in automated_grading.GeminiBackend.models}
+    failing = set()
+    calls = []
+
+    def generate_with_prefix(model_name, prefix, submission_part):
+        calls.append(model_name)
+        if model_name in failing:
+            raise RuntimeError("503")
+        return f"Grade: 8/10\nGraded by {model_name}\n"
+
+    def stream_with_prefix(model_name, prefix, submission_part):
+        yield generate_with_prefix(model_name, prefix, submission_part)
+
+    monkeypatch.setattr(automated_grading, 'get_breaker', breakers.__getitem__)
+    monkeypatch.setattr(automated_grading, 'generate_with_prefix', generate_with_prefix)
+    monkeypatch.setattr(automated_grading, 'stream_with_prefix', stream_with_prefix)
+    monkeypatch.setattr(automated_grading, 'get_prompt_prefix', lambda *args, **kwargs: None)
+    monkeypatch.setattr(automated_grading, 'grading_cache', DiskCache(str(tmp_path), 1 << 20))
+    monkeypatch.setattr(automated_grading.GeminiBackend, 'available', lambda self: True)
+    backend = automated_grading.GeminiBackend()
+    monkeypatch.setattr(automated_grading, 'grader_backend', backend)
+    backend.calls = calls
+    return backend, failing
+
+def test_fallback_response_is_not_cached_under_the_primary_model(gemini):
+    backend, failing = gemini
+    failing.add(automated_grading.GRADING_MODEL)
+
+    fallback = automated_grading.cached_grading_response("", "key", "answer", backend)
+    failing.clear()
+    primary = automated_grading.cached_grading_response("", "key", "answer", backend)
+
+    assert automated_grading.FALLBACK_GRADING_MODEL in fallback
+    assert automated_grading.GRADING_MODEL in primary
+    assert automated_grading.cached_grading_response("", "key", "answer", backend) == primary
+
+def test_streamed_fallback_response_is_not_cached(gemini):
+    backend, failing = gemini
+    failing.add(automated_grading.GRADING_MODEL)
+
+    fallback = "".join(automated_grading.stream_enhanced_response("", "key", "answer"))
+    failing.clear()
+    primary = "".join(automated_grading.stream_enhanced_response("", "key", "answer"))
+
+    assert automated_grading.FALLBACK_GRADING_MODEL in fallback
+    assert automated_grading.GRADING_MODEL in primary
+
+def test_identical_inputs_are_graded_once(gemini):
+    backend, _ = gemini
+
+    first = automated_grading.cached_grading_response("", "key", "answer", backend)
+    again = automated_grading.cached_grading_response("", "key", "answer", backend)
+    automated_grading.cached_grading_response("", "key", "other answer", backend)
+    automated_grading.cached_grading_response("", "key", "answer", backend, refresh=True)
+
+    assert again == first
+    assert len(backend.calls) == 3
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 20, ttl_seconds=60)
+    cache.set("key", "Grade: 8/10")
+    assert cache.get("key") == "Grade: 8/10"
+
+    an_hour_ago = time.time() - 3600
+    os.utime(tmp_path / "key.txt", (an_hour_ago, an_hour_ago))
+
+    assert cache.get("key") is None
+    assert cache.stats()['expired'] == 1
+
+def test_concurrent_misses_share_one_computation(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 20)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "Grade: 8/10"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute)))
+               for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.stats()['misses'] < 4:
+        time.sleep(0.01)
+    time.sleep(0.05)  # let the followers reach the in-flight entry
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["Grade: 8/10"] * 4
+    assert len(calls) == 1
+    assert cache.stats()['coalesced'] == 3
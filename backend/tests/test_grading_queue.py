@@ -0,0 +1,104 @@
+import threading
+import time
+
+import automated_grading
+import grading_queue
+from grader_backends import LocalGraderBackend
+from grading_queue import GradingQueue
+
+def add_submission(app, answer_key="the answer key", text="an answer"):
+    conn = app.get_db()
+    try:
+        event_id = conn.execute('''INSERT INTO events (course_id, event_name, event_type, answer_text)
+                                   VALUES (1, 'Assignment', 'assignment', ?)''', (answer_key,)).lastrowid
+        submission_id = conn.execute('''INSERT INTO submissions (event_id, student_id, submission_text)
+                                        VALUES (?, 1, ?)''', (event_id, text)).lastrowid
+        app.grading_job_queue.enqueue(submission_id, conn)
+        conn.commit()
+        return submission_id
+    finally:
+        conn.close()
+
+def drain(queue):
+    while True:
+        job = queue.claim()
+        if not job:
+            return
+        queue.run_job(job)
+
+def fetch(app, sql, params=()):
+    conn = app.get_db()
+    try:
+        return tuple(conn.execute(sql, params).fetchone())
+    finally:
+        conn.close()
+
+def test_backend_errors_are_retried_then_marked_failed(app_db, monkeypatch):
+    monkeypatch.setattr(grading_queue, 'RETRY_BACKOFF_SECONDS', 0)
+    backend = LocalGraderBackend(latency="fixed:0", error_rate=1.0)
+    monkeypatch.setattr(automated_grading, 'grader_backend', backend)
+    submission_id = add_submission(app_db)
+
+    drain(app_db.grading_job_queue)
+
+    assert backend.calls == grading_queue.MAX_ATTEMPTS
+    grade, status = fetch(app_db, 'SELECT grade, grading_status FROM submissions WHERE id = ?', (submission_id,))
+    assert (grade, status) == (None, 'failed')
+    job_status, attempts, last_error = fetch(app_db, 'SELECT status, attempts, last_error FROM grading_jobs')
+    assert (job_status, attempts) == ('failed', grading_queue.MAX_ATTEMPTS)
+    assert 'GradingFailed' in last_error
+
+def test_unconfigured_backend_is_never_saved_as_a_grade(app_db, monkeypatch):
+    monkeypatch.setattr(grading_queue, 'RETRY_BACKOFF_SECONDS', 0)
+    monkeypatch.setattr(automated_grading.GeminiBackend, 'available', lambda self: False)
+    monkeypatch.setattr(automated_grading, 'grader_backend', automated_grading.GeminiBackend())
+    submission_id = add_submission(app_db)
+
+    drain(app_db.grading_job_queue)
+
+    grade, status = fetch(app_db, 'SELECT grade, grading_status FROM submissions WHERE id = ?', (submission_id,))
+    assert (grade, status) == (None, 'failed')
+
+def test_successful_grading_completes_the_job(app_db, monkeypatch):
+    monkeypatch.setattr(automated_grading, 'grader_backend', LocalGraderBackend(latency="fixed:0"))
+    submission_id = add_submission(app_db, text="the answer key")
+
+    drain(app_db.grading_job_queue)
+
+    grade, status = fetch(app_db, 'SELECT grade, grading_status FROM submissions WHERE id = ?', (submission_id,))
+    assert (grade, status) == (10, 'completed')
+    assert fetch(app_db, 'SELECT status, attempts FROM grading_jobs') == ('completed', 1)
+
+def test_long_job_keeps_its_lease(app_db):
+    add_submission(app_db)
+    started, finish = threading.Event(), threading.Event()
+
+    def slow_handler(submission_id):
+        started.set()
+        finish.wait(5)
+
+    queue = GradingQueue(app_db.get_db, slow_handler, lease_seconds=0.3)
+    runner = threading.Thread(target=queue.run_job, args=(queue.claim(),))
+    runner.start()
+    started.wait(5)
+    time.sleep(1)  # more than three lease lengths
+
+    assert queue.claim() is None
+    finish.set()
+    runner.join()
+    assert fetch(app_db, 'SELECT status, attempts FROM grading_jobs') == ('completed', 1)
+
+def test_workers_resume_queued_jobs_when_the_app_loads(app_db, monkeypatch):
+    submission_id = add_submission(app_db)
+    graded = threading.Event()
+    queue = GradingQueue(app_db.get_db, lambda submission_id: graded.set(), workers=1)
+    monkeypatch.setattr(app_db, 'grading_job_queue', queue)
+    monkeypatch.setattr(app_db, 'START_GRADING_WORKERS', True)
+
+    app_db.start_grading_workers()
+    try:
+        assert graded.wait(5)
+    finally:
+        queue.stop(5)
+    assert fetch(app_db, 'SELECT status FROM grading_jobs WHERE submission_id = ?', (submission_id,)) == \
+        ('completed',)
@@ -0,0 +1,23 @@
+from werkzeug.security import generate_password_hash
+
+def log_in(client, conn, username, user_type):
+    conn.execute('INSERT INTO users (username, email, password_hash, user_type) VALUES (?, ?, ?, ?)',
+                 (username, f"{username}@example.com", generate_password_hash("secret"), user_type))
+    conn.commit()
+    assert client.post('/api/auth/login', json={'username': username, 'password': "secret"}).status_code == 200
+
+def test_grading_status_is_for_professors_only(app_db):
+    conn = app_db.get_db()
+    anonymous, student, professor = (app_db.app.test_client() for _ in range(3))
+    log_in(student, conn, "student1", 'student')
+    log_in(professor, conn, "prof1", 'professor')
+    conn.close()
+
+    assert anonymous.get('/api/grading/status').status_code == 403
+    assert student.get('/api/grading/status').status_code == 403
+    response = professor.get('/api/grading/status')
+    assert response.status_code == 200
+    assert 'breakers' in response.get_json()
+
+def test_metrics_stay_open_for_the_scraper(app_db):
+    assert app_db.app.test_client().get('/api/metrics').status_code == 200
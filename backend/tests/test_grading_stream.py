@@ -0,0 +1,74 @@
+import json
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import automated_grading
+from grader_backends import LocalGraderBackend
+
+def log_in(client, conn, username, user_type):
+    password_hash = generate_password_hash("secret", "pbkdf2:sha256:1000")  # fast to check
+    user_id = conn.execute('INSERT INTO users (username, email, password_hash, user_type) VALUES (?, ?, ?, ?)',
+                           (username, f"{username}@example.com", password_hash, user_type)).lastrowid
+    conn.commit()
+    assert client.post('/api/auth/login', json={'username': username, 'password': "secret"}).status_code == 200
+    return user_id
+
+def events(response):
+    """(event, data) pairs of a server-sent event stream"""
+    parsed = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        event, data = block.split("\n")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+@pytest.fixture
+def submission(app_db, monkeypatch):
+    """A queued submission, with clients logged in as its professor and its student"""
+    monkeypatch.setattr(automated_grading, 'grader_backend', LocalGraderBackend(latency="fixed:0"))
+    professor, student = app_db.app.test_client(), app_db.app.test_client()
+    conn = app_db.get_db()
+    professor_id = log_in(professor, conn, "prof1", 'professor')
+    student_id = log_in(student, conn, "student1", 'student')
+    course_id = conn.execute('INSERT INTO courses (course_name, course_code, professor_id) VALUES (?, ?, ?)',
+                             ("Physics", "PHY101", professor_id)).lastrowid
+    event_id = conn.execute('''INSERT INTO events (course_id, event_name, event_type, deadline, answer_text)
+                               VALUES (?, 'Homework 1', 'assignment', '2999-01-01 00:00:00',
+                                       'force equals mass times acceleration')''', (course_id,)).lastrowid
+    submission_id = conn.execute('INSERT INTO submissions (event_id, student_id, submission_text) VALUES (?, ?, ?)',
+                                 (event_id, student_id, "force is mass times acceleration")).lastrowid
+    app_db.grading_job_queue.enqueue(submission_id, conn)
+    conn.commit()
+    conn.close()
+    return submission_id, professor, student
+
+def test_stream_sends_feedback_then_the_grade(app_db, submission):
+    submission_id, professor, _ = submission
+
+    response = professor.get(f'/api/submissions/{submission_id}/grading-stream')
+
+    assert response.mimetype == 'text/event-stream'
+    sent = events(response)
+    assert sent[0] == ('status', {'grading_status': 'running'})
+    assert "".join(data['text'] for event, data in sent if event == 'feedback').startswith("Grade: 8/10")
+    assert sent[-1] == ('done', {'grade': 8, 'grading_status': 'completed'})
+    conn = app_db.get_db()
+    assert tuple(conn.execute('SELECT grade, grading_status FROM submissions').fetchone()) == (8, 'completed')
+    assert conn.execute('SELECT status FROM grading_jobs').fetchone()[0] == 'completed'
+    conn.close()
+
+def test_students_see_no_feedback_before_the_deadline(submission):
+    submission_id, _, student = submission
+
+    sent = events(student.get(f'/api/submissions/{submission_id}/grading-stream'))
+
+    assert [event for event, _ in sent] == ['status', 'done']
+    assert sent[-1] == ('done', {'grade': None, 'grading_status': 'completed'})
+
+def test_graded_submission_only_reports_the_result(submission):
+    submission_id, professor, _ = submission
+    professor.get(f'/api/submissions/{submission_id}/grading-stream').get_data()
+
+    sent = events(professor.get(f'/api/submissions/{submission_id}/grading-stream'))
+
+    assert sent == [('done', {'grade': 8, 'grading_status': 'completed'})]
@@ -0,0 +1,63 @@
+import fitz
+
+import metrics
+import text_extraction
+
+def pdf_with_repeated_icon(pages=3):
+    """Every page shows the same small image (one xref) above some text"""
+    doc = fitz.open()
+    icon = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False)
+    icon.clear_with(200)
+    xref = 0
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 120), f"Answer on page {number + 1}: the derivative of x squared is 2x.")
+        if xref:
+            page.insert_image(fitz.Rect(72, 72, 88, 88), xref=xref)
+        else:
+            xref = page.insert_image(fitz.Rect(72, 72, 88, 88), pixmap=icon)
+    return doc.tobytes()
+
+def test_convert_pdf_to_txt_returns_the_image_stats(capsys):
+    before = metrics.IMAGE_OCR.value(outcome='skipped_duplicate_xref')
+
+    text, source, stats = text_extraction.convert_pdf_to_txt(pdf_with_repeated_icon(), with_source=True,
+                                                             with_stats=True)
+
+    assert "derivative" in source
+    assert stats['images_seen'] == 3
+    assert stats['skipped_small'] == 1
+    assert stats['skipped_duplicate_xref'] == 2
+    assert stats['ocr_calls'] == 0
+    assert "skipped 2 repeated, 0 identical, 1 small" in capsys.readouterr().out
+    assert metrics.IMAGE_OCR.value(outcome='skipped_duplicate_xref') == before + 2
+
+def test_stats_are_logged_when_streaming(capsys):
+    assert list(text_extraction.iter_pdf_text(pdf_with_repeated_icon(pages=2), workers=1))
+    assert "0 OCR calls for 2 images, skipped 1 repeated, 0 identical, 1 small" in capsys.readouterr().out
+
+def pdf_with_images(fills):
+    """
+    One page per fill value, each with its own 64x64 image of that colour.
+    Pages are built separately and merged so equal images keep separate xrefs.
+    """
+    doc = fitz.open()
+    for fill in fills:
+        image = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+        image.clear_with(fill)
+        page_doc = fitz.open()
+        page_doc.new_page().insert_image(fitz.Rect(72, 72, 136, 136), pixmap=image)
+        doc.insert_pdf(page_doc)
+    return doc.tobytes()
+
+def test_identical_images_are_ocred_once(monkeypatch):
+    ocred = []
+    monkeypatch.setattr(text_extraction, 'ocr_image', lambda image: ocred.append(image.size) or "x = 4")
+
+    text, stats = text_extraction.extract_images_from_pdf(pdf_with_images([90, 90, 200]), with_stats=True)
+
+    assert len(ocred) == 2
+    assert stats['ocr_calls'] == 2
+    assert stats['skipped_duplicate_content'] == 1
+    assert stats['skipped_duplicate_xref'] == 0
+    assert text.count("x = 4") == 2
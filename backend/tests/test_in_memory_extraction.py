@@ -0,0 +1,37 @@
+import io
+import tempfile
+
+import fitz
+
+import text_extraction
+from disk_cache import DiskCache
+
+def text_pdf():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(72, 72, 520, 700), "Newton's second law states that force equals mass "
+                                                     "times acceleration. " * 10)
+    return doc.tobytes()
+
+def test_bytes_buffers_and_paths_extract_the_same_text(tmp_path):
+    pdf = text_pdf()
+    path = tmp_path / "answer.pdf"
+    path.write_bytes(pdf)
+
+    expected = text_extraction.convert_pdf_to_txt(str(path))
+
+    assert "acceleration" in expected
+    for source in (pdf, bytearray(pdf), memoryview(pdf)):
+        assert text_extraction.convert_pdf_to_txt(source) == expected
+
+def test_uploads_are_extracted_without_temp_files(monkeypatch):
+    def no_temp_files(*args, **kwargs):
+        raise AssertionError("extraction wrote a temp file")
+
+    monkeypatch.setattr(tempfile, 'mkstemp', no_temp_files)
+    monkeypatch.setattr(tempfile, 'NamedTemporaryFile', no_temp_files)
+    monkeypatch.setattr(text_extraction, 'extraction_cache', DiskCache("unused", 0))
+    upload = io.BytesIO(text_pdf())
+
+    assert "acceleration" in text_extraction.extract_text_for_flask(upload)
+    assert upload.tell() == 0
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+BACKEND_MODULES = ('fitz', 'pdfminer', 'tika', 'pytesseract', 'PIL', 'nltk')
+
+def loaded_after(code):
+    """Extraction backend modules imported by `code`, run in a fresh interpreter"""
+    script = f"import sys\n{code}\nprint('loaded:', *(m for m in {BACKEND_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    return output.splitlines()[-1].split()[1:]
+
+def test_importing_text_extraction_loads_no_backend():
+    assert loaded_after("import text_extraction") == []
+
+def test_warm_up_loads_every_backend():
+    assert sorted(loaded_after("import text_extraction; text_extraction.warm_up()")) == sorted(BACKEND_MODULES)
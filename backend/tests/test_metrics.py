@@ -0,0 +1,56 @@
+import pytest
+
+import metrics
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('ags_test_seconds', 'Test', ('stage',), buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 5.0):
+        histogram.observe(seconds, stage='ocr')
+
+    assert histogram.samples() == [
+        ('ags_test_seconds_bucket', '{stage="ocr",le="0.1"}', 1),
+        ('ags_test_seconds_bucket', '{stage="ocr",le="1.0"}', 2),
+        ('ags_test_seconds_bucket', '{stage="ocr",le="+Inf"}', 3),
+        ('ags_test_seconds_sum', '{stage="ocr"}', 5.55),
+        ('ags_test_seconds_count', '{stage="ocr"}', 3),
+    ]
+
+def test_failed_stage_is_timed_and_counted():
+    before = (metrics.STAGE_SECONDS.count(stage='test_stage'), metrics.FAILURES.value(stage='test_stage'))
+
+    with pytest.raises(RuntimeError):
+        with metrics.time_stage('test_stage'):
+            raise RuntimeError("boom")
+
+    assert metrics.STAGE_SECONDS.count(stage='test_stage') == before[0] + 1
+    assert metrics.FAILURES.value(stage='test_stage') == before[1] + 1
+
+def test_collectors_are_rendered_as_gauges(monkeypatch):
+    def broken():
+        raise RuntimeError("unavailable")
+
+    monkeypatch.setattr(metrics, '_collectors', [])
+    metrics.register_collector('ags_test_jobs', lambda: [({'status': 'queued'}, 3)])
+    metrics.register_collector('ags_test_broken', broken)
+    metrics.register_collector('ags_test_jobs', lambda: [({'status': 'queued'}, 4)])
+
+    output = metrics.render()
+
+    assert '# TYPE ags_test_jobs gauge\nags_test_jobs{status="queued"} 4\n' in output
+    assert 'ags_test_broken' not in output
+    assert output.count('# TYPE ags_test_jobs gauge') == 1
+
+def test_endpoint_reports_request_latency_and_queue_depth(app_db):
+    conn = app_db.get_db()
+    submission_id = conn.execute('INSERT INTO submissions (event_id, student_id, submission_text) '
+                                 "VALUES (1, 1, 'an answer')").lastrowid
+    app_db.grading_job_queue.enqueue(submission_id, conn)
+    conn.commit()
+    conn.close()
+    client = app_db.app.test_client()
+    client.get('/api/metrics')
+
+    output = client.get('/api/metrics').get_data(as_text=True)
+
+    assert 'ags_request_seconds_count{endpoint="api_metrics"' in output
+    assert 'ags_grading_jobs{status="queued"} 1' in output
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+import migrations
+
+def database_at(version):
+    conn = sqlite3.connect(":memory:")
+    migrations.migrate(conn, target=version)
+    return conn
+
+def test_hot_path_migration_archives_duplicates_instead_of_deleting_them(capsys):
+    conn = database_at(6)
+    conn.executemany('INSERT INTO enrollments (student_id, course_id) VALUES (?, ?)', [(1, 1), (1, 1), (1, 1)])
+    conn.executemany('INSERT INTO submissions (event_id, student_id, submission_text, grade) VALUES (?, ?, ?, ?)',
+                     [(1, 1, 'first', 7), (1, 1, 'second', 9), (1, 2, 'other student', None)])
+    conn.execute("INSERT INTO grading_jobs (submission_id, status, available_at, updated_at) VALUES (2, 'queued', 0, 0)")
+    conn.execute("INSERT INTO submission_minhash (submission_id, event_id, signature) VALUES (2, 1, x'00')")
+    conn.commit()
+
+    assert migrations.migrate(conn, target=7) == 7
+
+    assert conn.execute('SELECT id, submission_text FROM submissions ORDER BY id').fetchall() == \
+        [(1, 'first'), (3, 'other student')]
+    assert conn.execute('SELECT id, submission_text, grade FROM submissions_duplicates').fetchall() == \
+        [(2, 'second', 9)]
+    assert [row[0] for row in conn.execute('SELECT id FROM enrollments_duplicates ORDER BY id')] == [2, 3]
+    assert conn.execute('SELECT submission_id, status FROM grading_jobs_duplicates').fetchall() == [(2, 'queued')]
+    assert conn.execute('SELECT COUNT(*) FROM grading_jobs').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM submission_minhash').fetchone()[0] == 0
+    output = capsys.readouterr().out
+    assert "Moved 1 duplicate submissions rows to submissions_duplicates" in output
+    assert "Moved 2 duplicate enrollments rows to enrollments_duplicates" in output
+
+def test_hot_path_migration_without_duplicates_creates_no_archive():
+    conn = database_at(7)
+
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert not {name for name in tables if name.endswith('_duplicates')}
+
+def test_migrations_run_once_up_to_the_latest_version(capsys):
+    conn = database_at(migrations.LATEST_VERSION)
+    capsys.readouterr()
+
+    assert migrations.migrate(conn) == migrations.LATEST_VERSION
+    assert migrations.schema_version(conn) == migrations.LATEST_VERSION
+    assert capsys.readouterr().out == ""
+
+def test_failed_migration_leaves_the_previous_version(monkeypatch):
+    conn = database_at(7)
+
+    def failing(conn):
+        conn.execute('ALTER TABLE submissions ADD COLUMN half_done TEXT')
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:7] + [(8, 'failing', failing)])
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn, target=8)
+
+    assert migrations.schema_version(conn) == 7
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(submissions)')}
+    assert 'half_done' not in columns
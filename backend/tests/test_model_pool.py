@@ -0,0 +1,32 @@
+import threading
+
+import pytest
+
+import automated_grading
+
+@pytest.fixture
+def mock_gemini():
+    """Gemini configured against an unused local endpoint, restored afterwards"""
+    automated_grading.configure_gemini("test-key", transport="rest", endpoint="http://127.0.0.1:9")
+    yield
+    automated_grading.configure_gemini(automated_grading.API_KEY)
+
+def test_threads_share_one_model_per_name(mock_gemini):
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(automated_grading.get_model(automated_grading.GRADING_MODEL)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(models) == 8
+    assert all(model is models[0] for model in models)
+    assert automated_grading.get_model(automated_grading.FALLBACK_GRADING_MODEL) is not models[0]
+
+def test_reconfiguring_drops_pooled_models(mock_gemini):
+    model = automated_grading.get_model(automated_grading.GRADING_MODEL)
+
+    automated_grading.configure_gemini("other-key", transport="rest", endpoint="http://127.0.0.1:9")
+
+    assert automated_grading.get_model(automated_grading.GRADING_MODEL) is not model
@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+import migrations
+import near_duplicates
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    migrations.migrate(conn)
+    return conn
+
+def add_submission(conn, student_id, text):
+    return conn.execute('INSERT INTO submissions (event_id, student_id, submission_text) VALUES (1, ?, ?)',
+                        (student_id, text)).lastrowid
+
+def test_failed_indexing_leaves_no_partial_rows(conn, monkeypatch):
+    submission_id = add_submission(conn, 1, "photosynthesis turns light into chemical energy")
+
+    def broken_buckets(signature):
+        raise MemoryError("out of memory")
+
+    monkeypatch.setattr(near_duplicates, 'band_buckets', broken_buckets)
+    with pytest.raises(MemoryError):
+        near_duplicates.index_submission(conn, submission_id, 1, "photosynthesis turns light into chemical energy")
+    conn.commit()
+
+    assert conn.execute('SELECT COUNT(*) FROM submissions').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM submission_minhash').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM submission_lsh_buckets').fetchone()[0] == 0
+
+def test_indexed_copies_are_found(conn):
+    text = "the mitochondria is the powerhouse of the cell and makes atp from glucose and oxygen"
+    first = add_submission(conn, 1, text)
+    second = add_submission(conn, 2, text + " indeed")
+    for submission_id in (first, second):
+        near_duplicates.index_submission(conn, submission_id, 1, text)
+    conn.commit()
+
+    assert [match[0] for match in near_duplicates.find_near_duplicates(conn, first)] == [second]
+
+def test_blank_submissions_are_not_copies_of_each_other(conn):
+    blanks = [add_submission(conn, student_id, text) for student_id, text in ((1, ""), (2, "   \n"), (3, "?!"))]
+    for submission_id, text in zip(blanks, ("", "   \n", "?!")):
+        assert near_duplicates.index_submission(conn, submission_id, 1, text) is None
+    conn.commit()
+
+    assert all(near_duplicates.find_near_duplicates(conn, submission_id) == [] for submission_id in blanks)
+    assert near_duplicates.find_event_near_duplicates(conn, 1) == []
+    assert near_duplicates.index_missing_submissions(conn, 1) == 0
@@ -0,0 +1,56 @@
+import sys
+import threading
+import types
+
+import pytest
+
+import text_extraction
+
+class FakeTessBaseAPI:
+    """Records the images it is given instead of running Tesseract"""
+    created = []
+
+    def __init__(self, psm=None):
+        self.images = []
+        FakeTessBaseAPI.created.append(self)
+
+    def SetImageBytes(self, samples, width, height, channels, stride):
+        self.images.append((width, height, channels, stride, samples))
+
+    def SetImage(self, image):
+        self.images.append(image.size)
+
+    def GetUTF8Text(self):
+        return "x = 4"
+
+@pytest.fixture
+def engines(monkeypatch):
+    """OCR engines created by tesserocr (faked), with a fresh per-thread engine cache"""
+    FakeTessBaseAPI.created = []
+    tesserocr = types.SimpleNamespace(PyTessBaseAPI=FakeTessBaseAPI, PSM=types.SimpleNamespace(SINGLE_BLOCK=6))
+    monkeypatch.setitem(sys.modules, 'tesserocr', tesserocr)
+    monkeypatch.setattr(text_extraction, '_ocr_engine', threading.local())
+    monkeypatch.setattr(text_extraction, '_tesseract_ready', True)
+    return FakeTessBaseAPI.created
+
+def test_engine_is_loaded_once_per_thread_and_reads_the_buffer(engines):
+    pixels = (4, 2, 1, bytes(8))
+
+    assert text_extraction.ocr_pixels(pixels) == "x = 4"
+    assert text_extraction.ocr_pixels(pixels) == "x = 4"
+    other_thread = threading.Thread(target=text_extraction.ocr_pixels, args=(pixels,))
+    other_thread.start()
+    other_thread.join()
+
+    assert len(engines) == 2
+    assert engines[0].images == [(4, 2, 1, 4, bytes(8))] * 2
+
+def test_pytesseract_is_used_without_tesserocr(monkeypatch, engines):
+    monkeypatch.setitem(sys.modules, 'tesserocr', None)
+    calls = []
+    monkeypatch.setattr(text_extraction, 'pytesseract',
+                        types.SimpleNamespace(image_to_string=lambda image, config: calls.append(image.size) or "y"))
+
+    assert text_extraction.ocr_pixels((4, 2, 1, bytes(8))) == "y"
+    assert calls == [(4, 2)]
+    assert engines == []
@@ -0,0 +1,90 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+import pytest
+
+import text_extraction
+
+class CrashingPool:
+    """Stands in for a ProcessPoolExecutor whose worker dies on the first page"""
+    created = []
+
+    def __init__(self, max_workers, **kwargs):
+        self.broken = False
+        self.shut_down = False
+        CrashingPool.created.append(self)
+
+    def submit(self, func, *args):
+        if self.broken:
+            raise BrokenProcessPool("A child process terminated abruptly")
+        self.broken = True
+        future = Future()
+        future.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+@pytest.fixture
+def crashing_pool(monkeypatch):
+    text_extraction.shutdown_ocr_pool()
+    CrashingPool.created = []
+    monkeypatch.setattr(text_extraction, 'ProcessPoolExecutor', CrashingPool)
+    monkeypatch.setattr(text_extraction, 'ocr_pixels', lambda pixels: "in-process text")
+    yield CrashingPool.created
+    text_extraction.shutdown_ocr_pool()
+
+def session_with_pages(count):
+    doc = fitz.open()
+    for _ in range(count):
+        doc.new_page()
+    return text_extraction.DocumentSession(doc.tobytes())
+
+def test_broken_pool_finishes_in_process_and_is_replaced(crashing_pool):
+    with session_with_pages(5) as session:
+        texts = text_extraction.ocr_pages_parallel(session, list(range(5)), workers=2)
+
+    assert texts == ["in-process text"] * 5
+    assert crashing_pool[0].shut_down
+    assert text_extraction.get_ocr_pool(2) is not crashing_pool[0]
+    assert len(crashing_pool) == 2
+
+def test_concurrent_callers_share_one_pool(crashing_pool):
+    pools = []
+    threads = [threading.Thread(target=lambda: pools.append(text_extraction.get_ocr_pool(3))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(crashing_pool) == 1
+    assert all(pool is crashing_pool[0] for pool in pools)
+
+class ThreadPool(ThreadPoolExecutor):
+    """Stands in for the OCR process pool without starting processes"""
+
+    def __init__(self, max_workers, mp_context=None, initializer=None):
+        super().__init__(max_workers)
+
+def test_parallel_results_keep_page_order(monkeypatch):
+    def ocr_pixels(pixels):
+        width = pixels[0]
+        time.sleep(0.2 / width)  # narrower pages finish last
+        return f"{width} pixels wide"
+
+    text_extraction.shutdown_ocr_pool()
+    monkeypatch.setattr(text_extraction, 'ProcessPoolExecutor', ThreadPool)
+    monkeypatch.setattr(text_extraction, 'ocr_pixels', ocr_pixels)
+    doc = fitz.open()
+    for width in (50, 100, 150, 200, 250, 300):
+        doc.new_page(width=width, height=100)
+    try:
+        text = text_extraction.handle_scanned_pdf(doc.tobytes(), workers=3)
+    finally:
+        text_extraction.shutdown_ocr_pool()
+
+    assert text == "".join(f"\n--- Page {number + 1} ---\n{2 * width} pixels wide\n"
+                           for number, width in enumerate((50, 100, 150, 200, 250, 300)))
@@ -0,0 +1,30 @@
+import fitz
+
+import text_extraction
+
+def classify(draw):
+    doc = fitz.open()
+    page = doc.new_page()
+    draw(page)
+    session = text_extraction.DocumentSession(doc.tobytes())
+    try:
+        return text_extraction.classify_page(session, 0)[0]
+    finally:
+        session.close()
+
+def test_short_text_page_keeps_its_text_layer():
+    assert not classify(lambda page: page.insert_text((72, 72), "See next page."))
+
+def test_blank_page_is_not_ocred():
+    assert not classify(lambda page: None)
+
+def test_short_text_page_with_drawings_is_ocred():
+    def handwritten(page):
+        page.insert_text((72, 72), "Question 3")
+        page.draw_rect(fitz.Rect(72, 100, 520, 400), color=(0, 0, 0))
+
+    assert classify(handwritten)
+
+def test_full_text_page_keeps_its_text_layer():
+    assert not classify(lambda page: page.insert_textbox(fitz.Rect(72, 72, 520, 700),
+                                                         "The mitochondria is the powerhouse of the cell. " * 20))
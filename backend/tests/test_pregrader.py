@@ -0,0 +1,46 @@
+import pytest
+
+import pregrader
+
+ANSWER_KEY = """1. Newton's second law states that force equals mass times acceleration, F = m a.
+2. The area of a circle is pi times the radius squared, so a radius of 5 gives 78.54 square units.
+3. Kinetic energy is one half of mass times velocity squared."""
+
+@pytest.mark.parametrize("submission, decision, reason, grade", [
+    ("", pregrader.SKIP, 'blank submission', 0),
+    ("I do not know", pregrader.SKIP, 'blank submission', 0),
+    (ANSWER_KEY, pregrader.SKIP, 'copy of the answer key', 10),
+    ("My favourite football team won the league this season after a long wait for the fans.",
+     pregrader.DEPRIORITIZE, 'confident provisional grade', 0),
+    (ANSWER_KEY + " I checked my work twice and I am confident.",
+     pregrader.DEPRIORITIZE, 'confident provisional grade', 10),
+    ("1. Newton's second law says force equals mass times acceleration. 2. The area of a circle is "
+     "pi r squared which is 78.5. 3. I forgot this one.", pregrader.GRADE, 'needs AI grading', 5),
+])
+def test_decisions(submission, decision, reason, grade):
+    result = pregrader.pregrade(ANSWER_KEY, submission)
+
+    assert (result.decision, result.reason, result.provisional_grade) == (decision, reason, grade)
+
+def test_near_perfect_match_skips_the_ai_call(monkeypatch):
+    monkeypatch.setattr(pregrader, 'PREGRADE_SKIP_SCORE', 0.9)
+
+    result = pregrader.pregrade(ANSWER_KEY, ANSWER_KEY + " I checked my work twice and I am confident.")
+
+    assert (result.decision, result.reason) == (pregrader.SKIP, 'near-perfect match')
+    assert result.feedback().startswith("Grade: 10/10")
+
+def test_no_answer_key_means_no_pregrade():
+    assert pregrader.pregrade("  ", "an answer") is None
+
+def test_deprioritized_jobs_are_claimed_last(app_db):
+    conn = app_db.get_db()
+    low, normal = (conn.execute('INSERT INTO submissions (event_id, student_id, submission_text) VALUES (1, ?, ?)',
+                                (student_id, "an answer")).lastrowid for student_id in (1, 2))
+    app_db.grading_job_queue.enqueue(low, conn, priority=-1)
+    app_db.grading_job_queue.enqueue(normal, conn)
+    conn.commit()
+    conn.close()
+
+    assert app_db.grading_job_queue.claim()[1] == normal
+    assert app_db.grading_job_queue.claim()[1] == low
@@ -0,0 +1,51 @@
+import nltk
+import pytest
+from nltk.tokenize import NLTKWordTokenizer
+
+import text_extraction
+from benchmark import PREPROCESS_CORPUS_SENTENCES
+
+# Sentences both preprocessors keep whole, including the punkt traps:
+# numbered-list markers, numbers before a closing quote, ellipses
+SINGLE_SENTENCES = PREPROCESS_CORPUS_SENTENCES[:3] + PREPROCESS_CORPUS_SENTENCES[4:] + [
+    "The value was 3.5 m/s on average.",
+    "See section 2.1. The proof follows.",
+    "Q: what's 2+2?",
+    "They gotta say 'tis cannot be, gimme a (short) answer -- or not.",
+]
+
+# Multi-sentence texts whose splits the fast path is expected to match
+PASSAGES = [
+    " ".join(PREPROCESS_CORPUS_SENTENCES),
+    "The car accelerates uniformly. Its speed doubles in four seconds. "
+    "What is its acceleration? Show your work!",
+    'He asked "why?" and left. Isn\'t the answer obvious?',
+]
+
+def punkt_available():
+    try:
+        nltk.data.find('tokenizers/punkt')
+        return True
+    except LookupError:
+        return False
+
+@pytest.mark.parametrize("sentence", SINGLE_SENTENCES)
+def test_fast_tokens_match_nltk_word_tokenizer(sentence):
+    expected = " ".join(NLTKWordTokenizer().tokenize(text_extraction.clean_text(sentence)))
+
+    assert text_extraction.preprocess_chunk(sentence, "fast") == expected
+
+def test_fast_sentence_splits():
+    split = lambda text: text_extraction.preprocess_chunk(text, "fast").split("\n")
+
+    assert split("2. Calculate the area [see Fig. 2].") == ["2. Calculate the area [ see Fig. 2 ] ."]
+    assert split('He said "the answer is 4." She agreed.') == ["He said `` the answer is 4. '' She agreed ."]
+    assert split("Show your work... Partial credit applies.") == ["Show your work ... Partial credit applies ."]
+    assert split('He asked "why?" and left.') == ["He asked `` why ? ''", "and left ."]
+    assert split("Mr. Smith is here. He waits.") == ["Mr. Smith is here .", "He waits ."]
+
+@pytest.mark.skipif(not punkt_available(), reason="NLTK punkt data is not installed")
+@pytest.mark.parametrize("text", SINGLE_SENTENCES + PASSAGES)
+def test_fast_preprocessor_matches_nltk(text):
+    assert (text_extraction.preprocess_chunk(text, "fast")
+            == text_extraction.preprocess_chunk(text, "nltk"))
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+import automated_grading
+
+def response(text):
+    usage = SimpleNamespace(prompt_token_count=1200, cached_content_token_count=0)
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+class FakeModel:
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        if stream:
+            return iter([response("Grade: "), response("8/10")])
+        return response("Grade: 8/10")
+
+@pytest.fixture
+def counted(monkeypatch):
+    """Token counting calls made while grading, with fake models"""
+    calls = []
+
+    def count_prompt_tokens(model_name, text):
+        calls.append(model_name)
+        return 1000
+
+    monkeypatch.setattr(automated_grading, 'count_prompt_tokens', count_prompt_tokens)
+    monkeypatch.setattr(automated_grading, 'get_model', lambda model_name: FakeModel())
+    return calls
+
+@pytest.mark.parametrize("model_name", [automated_grading.GRADING_MODEL,
+                                        automated_grading.FALLBACK_GRADING_MODEL])
+def test_requests_without_provider_cache_do_not_count_tokens(monkeypatch, counted, capsys, model_name):
+    monkeypatch.setattr(automated_grading.genai, 'caching', None, raising=False)
+    prefix = automated_grading.PromptPrefix("Rubric\n")
+
+    assert automated_grading.generate_with_prefix(model_name, prefix, "answer") == "Grade: 8/10"
+    assert "".join(automated_grading.stream_with_prefix(model_name, prefix, "answer")) == "Grade: 8/10"
+    assert counted == []
+    assert capsys.readouterr().out.count("1200 prompt tokens (0 cached)") == 2
+
+def test_fallback_model_never_counts_tokens(counted):
+    prefix = automated_grading.PromptPrefix("Rubric\n")
+
+    automated_grading.generate_with_prefix(automated_grading.FALLBACK_GRADING_MODEL, prefix, "answer")
+
+    assert counted == []
+
+def test_prefix_is_built_once_per_event():
+    prefix = automated_grading.get_prompt_prefix("Show your working.", "x = 4")
+
+    assert automated_grading.get_prompt_prefix("Show your working.", "x = 4") is prefix
+    assert automated_grading.get_prompt_prefix("Show your working.", "x = 5") is not prefix
+    assert (automated_grading.build_grading_prompt("Show your working.", "x = 4", "x is 4")
+            == prefix.text + automated_grading.build_submission_part("x is 4"))
+
+def test_large_prefix_is_cached_with_the_provider_once(monkeypatch, counted):
+    created = []
+
+    def create(model, contents, ttl):
+        created.append(model)
+        return f"cache-{len(created)}"
+
+    caching = SimpleNamespace(CachedContent=SimpleNamespace(create=create))
+    monkeypatch.setattr(automated_grading.genai, 'caching', caching, raising=False)
+    monkeypatch.setattr(automated_grading, 'CONTEXT_CACHE_MIN_TOKENS', 500)
+    prefix = automated_grading.PromptPrefix("Rubric\n")
+
+    assert prefix.provider_cache(automated_grading.GRADING_MODEL) == "cache-1"
+    assert prefix.provider_cache(automated_grading.GRADING_MODEL) == "cache-1"
+    prefix.cached_until = 0.0
+    assert prefix.provider_cache(automated_grading.GRADING_MODEL) == "cache-2"
+    assert counted == [automated_grading.GRADING_MODEL]
+
+def test_small_prefix_is_sent_in_full(monkeypatch, counted):
+    monkeypatch.setattr(automated_grading.genai, 'caching', SimpleNamespace(), raising=False)
+    prefix = automated_grading.PromptPrefix("Rubric\n")
+
+    assert prefix.provider_cache(automated_grading.GRADING_MODEL) is None
+    assert counted == [automated_grading.GRADING_MODEL]
@@ -0,0 +1,15 @@
+import sqlite3
+
+import migrations
+import queries
+
+def test_hot_path_queries_use_indexes():
+    conn = sqlite3.connect(":memory:")
+    migrations.migrate(conn)
+
+    assert migrations.check_query_plans(conn) == []
+
+def test_route_queries_are_the_shared_ones():
+    checked = {sql for _, sql, _ in migrations.ROUTE_QUERIES}
+
+    assert {value for name, value in vars(queries).items() if name.isupper()} <= checked
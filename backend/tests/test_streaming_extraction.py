@@ -0,0 +1,33 @@
+import fitz
+
+import text_extraction
+
+def pdf_with_pages(count):
+    doc = fitz.open()
+    for number in range(count):
+        doc.new_page().insert_textbox(fitz.Rect(72, 72, 520, 700), f"Page {number + 1} answer: the "
+                                      "derivative of sine is cosine. " * 10)
+    return doc.tobytes()
+
+def test_pages_are_yielded_in_order_and_released(monkeypatch):
+    released = []
+    release_page = text_extraction.DocumentSession.release_page
+    monkeypatch.setattr(text_extraction.DocumentSession, 'release_page',
+                        lambda session, page_num: released.append(page_num) or release_page(session, page_num))
+
+    for number, chunk in enumerate(text_extraction.iter_pdf_text(pdf_with_pages(3), workers=1)):
+        assert chunk.startswith(f"Page {number + 1} answer")
+        assert released == list(range(number + 1))
+    assert released == [0, 1, 2]
+
+def test_abandoned_stream_closes_the_document(monkeypatch):
+    closed = []
+    close = text_extraction.DocumentSession.close
+    monkeypatch.setattr(text_extraction.DocumentSession, 'close',
+                        lambda session: closed.append(session) or close(session))
+    pages = text_extraction.iter_pdf_text(pdf_with_pages(3), workers=1)
+
+    next(pages)
+    pages.close()
+
+    assert len(closed) == 1
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import automated_grading
+
+RESPONSE = {
+    'grade': 7.6,
+    'strengths': ["Correct formula"],
+    'improvements': ["Show the units"],
+    'suggestions': [],
+    'question_comments': [{'question': "Q1", 'comment': "Right answer", 'extra': "dropped"}],
+}
+
+def test_fenced_json_response_is_parsed_and_validated():
+    grade, feedback, details = automated_grading.parse_grading_response(
+        f"```json\n{json.dumps(RESPONSE)}\n```")
+
+    assert grade == 8
+    assert feedback.startswith("Grade: 8/10")
+    assert "- Show the units" in feedback and "Q1: Right answer" in feedback
+    assert details['question_comments'] == [{'question': "Q1", 'comment': "Right answer"}]
+    assert details['suggestions'] == []
+
+@pytest.mark.parametrize("change", [{'grade': 11}, {'grade': True}, {'grade': "8"},
+                                    {'strengths': "Correct formula"},
+                                    {'question_comments': [{'question': "Q1"}]}])
+def test_invalid_fields_are_rejected(change):
+    with pytest.raises(ValueError):
+        automated_grading.parse_structured_response(json.dumps({**RESPONSE, **change}))
+
+def test_invalid_json_falls_back_to_text_extraction():
+    grade, feedback, details = automated_grading.parse_grading_response('{"grade": 11}\nGrade: 6/10')
+
+    assert grade == 6
+    assert details is None
+
+def test_text_response_has_no_structured_fields():
+    grade, _, details = automated_grading.parse_grading_response("Grade: 9/10\n\n**Strengths:**\n- Clear")
+
+    assert (grade, details) == (9, None)
@@ -1,32 +1,71 @@
-import fitz  # PyMuPDF
-import pdfminer
-from pdfminer.high_level import extract_text
-from tika import parser
-import pytesseract
-from PIL import Image
+import importlib
 import io
 import re
-import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
 import os
 import sys
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from disk_cache import DEFAULT_CACHE_DIR, DiskCache, content_hash
+from metrics import count_failure, count_fallback, count_image_ocr, observe_stage, time_stage
 
-# Download required NLTK data (only download if not already present)
-try:
-    nltk.data.find('tokenizers/punkt')
-    print("✓ NLTK punkt tokenizer found")
-except LookupError:
-    print("⬇ Downloading NLTK punkt tokenizer...")
-    nltk.download('punkt', quiet=True)
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+    Keeps `import text_extraction` cheap; call warm_up() to pay the
+    import cost up front instead.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
 
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
 
+# Extraction backends, loaded on demand
+fitz = LazyModule("fitz")  # PyMuPDF
+pdfminer_high_level = LazyModule("pdfminer.high_level")
+tika_parser = LazyModule("tika.parser")
+pytesseract = LazyModule("pytesseract")
+Image = LazyModule("PIL.Image")
+nltk = LazyModule("nltk")
+nltk_tokenize = LazyModule("nltk.tokenize")
+
+_setup_lock = threading.Lock()
+_nltk_ready = False
+_tesseract_ready = False
+
+def ensure_nltk_data():
+    """Download required NLTK data on first use (only if not already present)"""
+    global _nltk_ready
+    if _nltk_ready:
+        return
+    with _setup_lock:
+        if _nltk_ready:
+            return
+        try:
+            nltk.data.find('tokenizers/punkt')
+            print("✓ NLTK punkt tokenizer found")
+        except LookupError:
+            print("⬇ Downloading NLTK punkt tokenizer...")
+            nltk.download('punkt', quiet=True)
+        _nltk_ready = True
 
 # Additional fallback for sentence tokenization
 def safe_sent_tokenize(text):
     """Safe sentence tokenization with fallbacks"""
+    ensure_nltk_data()
     try:
-        return sent_tokenize(text)
+        return nltk_tokenize.sent_tokenize(text)
     except:
+        count_fallback("sentence_tokenizer")
         # Fallback 1: Try with punkt only
         try:
             import nltk.tokenize
@@ -38,9 +77,11 @@ def safe_sent_tokenize(text):
 
 def safe_word_tokenize(sentence):
     """Safe word tokenization with fallbacks"""
+    ensure_nltk_data()
     try:
-        return word_tokenize(sentence)
+        return nltk_tokenize.word_tokenize(sentence)
     except:
+        count_fallback("word_tokenizer")
         # Fallback: Simple split by spaces and punctuation
         import re
         return re.findall(r'\b\w+\b', sentence)
@@ -48,59 +89,211 @@ def safe_word_tokenize(sentence):
 # Whitelist of additional characters to keep (mathematical symbols, etc.)
 WHITELIST = "Σ±÷×°√∞∫∂≤≥≠≈"
 
-# Configure Tesseract path (adjust for your system)
-try:
-    # Try to find tesseract automatically first
-    import shutil
-    tesseract_path = shutil.which('tesseract')
-    if tesseract_path:
-        pytesseract.pytesseract.tesseract_cmd = tesseract_path
-        print(f"✓ Tesseract found at: {tesseract_path}")
-    else:
-        # Fallback to common Windows locations
-        possible_paths = [
-            r'C:\Program Files\Tesseract-OCR\tesseract.exe',
-            r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
-            r'C:\Users\PC\PycharmProjects\tesseract.exe'
-        ]
-        
-        for path in possible_paths:
-            if os.path.exists(path):
-                pytesseract.pytesseract.tesseract_cmd = path
-                print(f"✓ Tesseract found at: {path}")
-                break
-        else:
-            print("⚠ Tesseract not found - OCR functionality will be limited")
-except Exception as e:
-    print(f"⚠ Tesseract configuration warning: {e}")
-    print("  → OCR functionality may be limited")
+# Bump whenever a change to the pipeline alters the extracted text,
+# so cached results from the old pipeline are no longer used
+PIPELINE_VERSION = "5"
 
-def extract_text_from_pdf(pdf_path):
+# On-disk cache of extraction results, keyed by PDF content (0 MB disables it)
+EXTRACTION_CACHE_MB = int(os.getenv("AGS_EXTRACTION_CACHE_MB", "256"))
+extraction_cache = DiskCache(os.path.join(DEFAULT_CACHE_DIR, "extraction"),
+                             EXTRACTION_CACHE_MB * 1024 * 1024)
+
+def extraction_cache_key(pdf_bytes):
+    """Cache key for a PDF: pipeline version, preprocessor and SHA-256 of its bytes"""
+    return f"v{PIPELINE_VERSION}-{PREPROCESSOR}-{content_hash(pdf_bytes)}"
+
+def configure_tesseract():
+    """Configure Tesseract path (adjust for your system) on first OCR call"""
+    global _tesseract_ready
+    if _tesseract_ready:
+        return
+    with _setup_lock:
+        if _tesseract_ready:
+            return
+        try:
+            # Try to find tesseract automatically first
+            import shutil
+            tesseract_path = shutil.which('tesseract')
+            if tesseract_path:
+                pytesseract.pytesseract.tesseract_cmd = tesseract_path
+                print(f"✓ Tesseract found at: {tesseract_path}")
+            else:
+                # Fallback to common Windows locations
+                possible_paths = [
+                    r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+                    r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
+                    r'C:\Users\PC\PycharmProjects\tesseract.exe'
+                ]
+
+                for path in possible_paths:
+                    if os.path.exists(path):
+                        pytesseract.pytesseract.tesseract_cmd = path
+                        print(f"✓ Tesseract found at: {path}")
+                        break
+                else:
+                    print("⚠ Tesseract not found - OCR functionality will be limited")
+        except Exception as e:
+            print(f"⚠ Tesseract configuration warning: {e}")
+            print("  → OCR functionality may be limited")
+        _tesseract_ready = True
+
+def is_pdf_bytes(pdf_source):
+    """True if the source is an in-memory PDF rather than a file path"""
+    return isinstance(pdf_source, (bytes, bytearray, memoryview))
+
+def as_pdf_bytes(pdf_source):
+    """
+    Normalize an in-memory PDF to bytes/bytearray.
+    PyMuPDF cannot open a memoryview directly, so only that case is copied.
+    """
+    if isinstance(pdf_source, memoryview):
+        return pdf_source.tobytes()
+    return pdf_source
+
+def open_pdf(pdf_source):
+    """Open a PDF with PyMuPDF from a file path or in-memory bytes"""
+    if is_pdf_bytes(pdf_source):
+        return fitz.open(stream=as_pdf_bytes(pdf_source), filetype="pdf")
+    return fitz.open(pdf_source)
+
+class DocumentSession:
+    """
+    A PDF opened once and shared by every extraction stage.
+    Caches loaded pages and the per-page image xref table, and records
+    the time spent in each stage (see `stage` and `timings`).
+    """
+
+    def __init__(self, pdf_source):
+        self.source = as_pdf_bytes(pdf_source) if is_pdf_bytes(pdf_source) else pdf_source
+        self.doc = open_pdf(self.source)
+        self.timings = {}
+        self._pages = {}
+        self._images = {}
+        # Image OCR results by content hash, so identical images are OCRed once
+        self.image_ocr_memo = {}
+        self.image_stats = {
+            'images_seen': 0,
+            'ocr_calls': 0,
+            'skipped_duplicate_xref': 0,
+            'skipped_duplicate_content': 0,
+            'skipped_small': 0,
+        }
+        self.seen_image_xrefs = set()
+        self.image_count = 0
+
+    def __len__(self):
+        return len(self.doc)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def page(self, page_num):
+        """Return the loaded page, loading it on first use"""
+        page = self._pages.get(page_num)
+        if page is None:
+            page = self.doc.load_page(page_num)
+            self._pages[page_num] = page
+        return page
+
+    def release_page(self, page_num):
+        """Drop a cached page once no stage needs it (keeps streaming memory flat)"""
+        self._pages.pop(page_num, None)
+        self._images.pop(page_num, None)
+
+    def page_images(self, page_num):
+        """Return the page's get_images(full=True) entries, read once"""
+        images = self._images.get(page_num)
+        if images is None:
+            images = self.page(page_num).get_images(full=True)
+            self._images[page_num] = images
+        return images
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work and add it to timings[name]"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def report_timings(self):
+        """Print the per-stage timings collected so far and record them as metrics"""
+        for name, seconds in self.timings.items():
+            observe_stage(name, seconds)
+        if self.timings:
+            summary = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+            print(f"⏱ Stage timings: {summary}")
+
+    def report_image_stats(self):
+        """Print the embedded-image OCR counts (OCR calls and dedupe skips) and record them as metrics"""
+        stats = self.image_stats
+        if not stats['images_seen']:
+            return
+        for outcome in ('ocr_calls', 'skipped_duplicate_xref', 'skipped_duplicate_content', 'skipped_small'):
+            count_image_ocr(outcome, stats[outcome])
+        print(f"🖼 Image OCR: {stats['ocr_calls']} OCR calls for {stats['images_seen']} images, skipped "
+              f"{stats['skipped_duplicate_xref']} repeated, {stats['skipped_duplicate_content']} identical, "
+              f"{stats['skipped_small']} small")
+
+    def close(self):
+        self._pages.clear()
+        self._images.clear()
+        if self.doc:
+            self.doc.close()
+            self.doc = None
+
+@contextmanager
+def document_session(pdf_source):
+    """
+    Yield a DocumentSession for `pdf_source`. An existing session is
+    reused as-is (and left open); anything else is opened and closed here.
+    """
+    if isinstance(pdf_source, DocumentSession):
+        yield pdf_source
+        return
+    session = DocumentSession(pdf_source)
+    try:
+        yield session
+    finally:
+        session.close()
+
+def raw_pdf_source(pdf_source):
+    """The path or bytes behind a source that may be a DocumentSession"""
+    if isinstance(pdf_source, DocumentSession):
+        return pdf_source.source
+    return pdf_source
+
+def extract_text_from_pdf(pdf_source):
     """
     Extract text from PDF using multiple methods.
     Tries PyMuPDF first, then PDFMiner, then Tika as fallbacks.
+    `pdf_source` is a file path, the PDF bytes or a DocumentSession.
     """
-    doc = None
     try:
         # Method 1: Try PyMuPDF (fastest and most reliable for most PDFs)
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
+        with time_stage("extract_pymupdf"), document_session(pdf_source) as session:
+            text = "".join(session.page(page_num).get_text() for page_num in range(len(session)))
         
         if text.strip():
             print(f"✓ Text extracted using PyMuPDF: {len(text)} characters")
             return text
     except Exception as e:
         print(f"⚠ PyMuPDF extraction failed: {e}")
-    finally:
-        # Always close the document to release file handles
-        if doc:
-            doc.close()
+
+    pdf_source = raw_pdf_source(pdf_source)
 
     try:
         # Method 2: Try PDFMiner (good for complex layouts)
-        text = extract_text(pdf_path)
+        count_fallback("extractor_pdfminer")
+        with time_stage("extract_pdfminer"):
+            if is_pdf_bytes(pdf_source):
+                text = pdfminer_high_level.extract_text(io.BytesIO(as_pdf_bytes(pdf_source)))
+            else:
+                text = pdfminer_high_level.extract_text(pdf_source)
         if text.strip():
             print(f"✓ Text extracted using PDFMiner: {len(text)} characters")
             return text
@@ -109,7 +302,12 @@ def extract_text_from_pdf(pdf_path):
 
     try:
         # Method 3: Try Tika (good for various document types)
-        raw = parser.from_file(pdf_path)
+        count_fallback("extractor_tika")
+        with time_stage("extract_tika"):
+            if is_pdf_bytes(pdf_source):
+                raw = tika_parser.from_buffer(bytes(as_pdf_bytes(pdf_source)))
+            else:
+                raw = tika_parser.from_file(pdf_source)
         text = raw['content']
         if text and text.strip():
             print(f"✓ Text extracted using Tika: {len(text)} characters")
@@ -118,86 +316,393 @@ def extract_text_from_pdf(pdf_path):
         print(f"⚠ Tika extraction failed: {e}")
 
     # If all text extraction methods fail, return None
+    count_failure("extract_text")
     print("✗ All text extraction methods failed")
     return None
 
+# Persistent OCR engine: with the optional tesserocr package installed,
+# each process (and thread) keeps one libtesseract instance with its
+# language data loaded. Without it every call goes through pytesseract,
+# which starts a tesseract process and writes temp image files.
+_ocr_engine = threading.local()
+
+def get_ocr_engine():
+    """Return this thread's tesserocr API, or None to use pytesseract"""
+    api = getattr(_ocr_engine, "api", False)
+    if api is False:
+        try:
+            import tesserocr
+            # PSM.SINGLE_BLOCK matches the '--psm 6' used with pytesseract
+            api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_BLOCK)
+            print("✓ Persistent Tesseract engine loaded (tesserocr)")
+        except ImportError:
+            api = None
+        except Exception as e:
+            print(f"⚠ Could not start tesserocr engine, using pytesseract: {e}")
+            api = None
+        _ocr_engine.api = api
+    return api
+
 def ocr_image(image):
     """Perform OCR on a PIL Image object"""
+    configure_tesseract()
     try:
+        engine = get_ocr_engine()
+        if engine is not None:
+            engine.SetImage(image)
+            return engine.GetUTF8Text()
         return pytesseract.image_to_string(image, config='--psm 6')
     except Exception as e:
+        count_failure("ocr_page")
         print(f"⚠ OCR failed: {e}")
         return ""
 
-def handle_scanned_pdf(pdf_path):
+def ocr_pixels(pixels):
+    """
+    Perform OCR on a raw pixel buffer (width, height, channels, samples)
+    as produced by render_page_pixels. The persistent engine reads the
+    buffer directly; pytesseract needs it wrapped in a PIL image.
+    """
+    width, height, channels, samples = pixels
+    configure_tesseract()
+    try:
+        engine = get_ocr_engine()
+        if engine is not None:
+            engine.SetImageBytes(samples, width, height, channels, width * channels)
+            return engine.GetUTF8Text()
+    except Exception as e:
+        count_failure("ocr_page")
+        print(f"⚠ OCR failed: {e}")
+        return ""
+    mode = "L" if channels == 1 else "RGB"
+    return ocr_image(Image.frombytes(mode, (width, height), samples))
+
+# Number of worker processes used for page-parallel OCR (1 disables the pool)
+OCR_WORKERS = max(1, int(os.getenv("AGS_OCR_WORKERS", os.cpu_count() or 1)))
+
+_ocr_pool = None
+_ocr_pool_workers = 0
+# Request threads share the pool; only one of them may (re)create it
+_ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool(workers):
+    """Return the shared OCR process pool, (re)creating it for the given size"""
+    global _ocr_pool, _ocr_pool_workers
+    with _ocr_pool_lock:
+        if _ocr_pool is None or _ocr_pool_workers != workers:
+            _shutdown_ocr_pool()
+            # spawn avoids forking the threads of a running Flask server
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_ocr_worker
+            )
+            _ocr_pool_workers = workers
+            print(f"✓ OCR process pool started with {workers} workers")
+        return _ocr_pool
+
+def shutdown_ocr_pool(pool=None):
+    """
+    Stop the shared OCR process pool if it is running. With `pool`, only
+    if that is still the shared pool (another thread may have replaced it).
+    """
+    with _ocr_pool_lock:
+        if pool is None or pool is _ocr_pool:
+            _shutdown_ocr_pool()
+
+def _shutdown_ocr_pool():
+    """shutdown_ocr_pool with _ocr_pool_lock held"""
+    global _ocr_pool, _ocr_pool_workers
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(wait=True, cancel_futures=True)
+        _ocr_pool = None
+        _ocr_pool_workers = 0
+
+atexit.register(shutdown_ocr_pool)
+
+def init_ocr_worker():
+    """Load the OCR engine when a pool worker starts, not on its first page"""
+    configure_tesseract()
+    get_ocr_engine()
+
+def timed_ocr_pixels(pixels):
+    """ocr_pixels for pool workers: (text, seconds), since metrics recorded in a worker process are lost"""
+    start = time.perf_counter()
+    text = ocr_pixels(pixels)
+    return text, time.perf_counter() - start
+
+def render_page_pixels(page):
+    """
+    Render a page for OCR as a raw grayscale buffer.
+    Skipping PNG encoding/decoding keeps the hand-off to pool workers
+    to a single copy of the pixels over the pipe.
+    """
+    # 2x zoom for better OCR; Tesseract binarizes gray input anyway
+    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), colorspace=fitz.csGRAY, alpha=False)
+    return pix.width, pix.height, pix.n, pix.samples
+
+def ocr_pages_sequential(session, page_numbers):
+    """OCR the given pages of a DocumentSession in the current process"""
+    page_texts = []
+    for page_num in page_numbers:
+        with time_stage("ocr_page"):
+            page_text = ocr_pixels(render_page_pixels(session.page(page_num)))
+        page_texts.append(page_text)
+        print(f"✓ OCR completed for page {page_num + 1}: {len(page_text)} characters")
+    return page_texts
+
+def ocr_pages_parallel(session, page_numbers, workers):
+    """
+    OCR the given pages of a DocumentSession on the shared process pool.
+    Pages are rendered here and at most 2 * workers images are in flight,
+    so memory stays bounded on long documents. Results keep page order.
+    If a worker dies (a Tesseract crash or an OOM kill breaks the whole
+    pool) the rest of the document is OCRed in-process and the pool is
+    shut down, so the next document gets a fresh one.
+    """
+    pool = get_ocr_pool(workers)
+    page_texts = [""] * len(page_numbers)
+    pending = {}
+    max_in_flight = workers * 2
+    broken = False
+
+    def collect(futures):
+        nonlocal broken
+        for future in futures:
+            index, pixels = pending.pop(future)
+            page_num = page_numbers[index]
+            try:
+                page_texts[index], seconds = future.result()
+                observe_stage("ocr_page", seconds)
+            except Exception as e:
+                broken = broken or isinstance(e, BrokenProcessPool)
+                count_fallback("ocr_worker_retry")
+                print(f"⚠ OCR worker failed on page {page_num + 1}: {e}, retrying in-process")
+                with time_stage("ocr_page"):
+                    page_texts[index] = ocr_pixels(pixels)
+            print(f"✓ OCR completed for page {page_num + 1}: {len(page_texts[index])} characters")
+
+    for index, page_num in enumerate(page_numbers):
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+        pixels = render_page_pixels(session.page(page_num))
+        if not broken:
+            try:
+                pending[pool.submit(timed_ocr_pixels, pixels)] = (index, pixels)
+                continue
+            except BrokenProcessPool:
+                broken = True
+        with time_stage("ocr_page"):
+            page_texts[index] = ocr_pixels(pixels)
+        print(f"✓ OCR completed for page {page_num + 1}: {len(page_texts[index])} characters")
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        collect(done)
+
+    if broken:
+        count_fallback("ocr_pool_broken")
+        print("⚠ OCR process pool broke; finished in-process, a new pool starts with the next document")
+        shutdown_ocr_pool(pool)
+
+    return page_texts
+
+def ocr_pages(session, page_numbers, workers=None):
+    """
+    OCR the given pages of a DocumentSession, in parallel when worthwhile.
+    Returns the page texts in the order of `page_numbers`.
+    """
+    if workers is None:
+        workers = OCR_WORKERS
+    with session.stage("ocr"):
+        if workers > 1 and len(page_numbers) > 1:
+            return ocr_pages_parallel(session, page_numbers, workers)
+        return ocr_pages_sequential(session, page_numbers)
+
+def format_ocr_page(page_num, page_text):
+    """Format OCR output for one page the way handle_scanned_pdf always has"""
+    return f"\n--- Page {page_num + 1} ---\n{page_text}\n"
+
+def handle_scanned_pdf(pdf_source, workers=None):
     """
     Handle scanned PDFs by extracting images and performing OCR.
     Use this when regular text extraction fails.
+    Pages are OCRed on a process pool of `workers` processes
+    (default AGS_OCR_WORKERS); 1 keeps everything in-process.
     """
-    text = ""
-    doc = None
     try:
-        doc = fitz.open(pdf_path)
-        print(f"Processing {len(doc)} pages for OCR...")
+        with document_session(pdf_source) as session:
+            print(f"Processing {len(session)} pages for OCR...")
+            page_texts = ocr_pages(session, list(range(len(session))), workers)
         
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            
-            # Convert page to image
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom for better OCR
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
-            
-            # Perform OCR on the page image
-            page_text = ocr_image(img)
-            text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-            
-            print(f"✓ OCR completed for page {page_num + 1}: {len(page_text)} characters")
-        
-        return text
+        return "".join(format_ocr_page(page_num, page_text)
+                       for page_num, page_text in enumerate(page_texts))
     except Exception as e:
         print(f"✗ OCR processing failed: {e}")
         return ""
-    finally:
-        if doc:
-            doc.close()
 
-def extract_images_from_pdf(pdf_path):
-    """Extract images from PDF and perform OCR on them"""
-    images_text = ""
-    doc = None
+# Per-page OCR triage: a page is OCRed when images cover at least
+# OCR_IMAGE_COVERAGE of it (a photographed page with a typed header), or
+# when its text layer has fewer than MIN_PAGE_GLYPHS visible characters and
+# images or vector drawings (pen strokes) cover at least
+# OCR_MIN_GRAPHICS_COVERAGE of it. Short pages with nothing drawn on them
+# ("see next page") keep their text layer; OCR would only re-read it.
+MIN_PAGE_GLYPHS = int(os.getenv("AGS_MIN_PAGE_GLYPHS", "50"))
+OCR_IMAGE_COVERAGE = float(os.getenv("AGS_OCR_IMAGE_COVERAGE", "0.6"))
+OCR_MIN_GRAPHICS_COVERAGE = float(os.getenv("AGS_OCR_MIN_GRAPHICS_COVERAGE", "0.05"))
+
+def page_image_coverage(page):
+    """Fraction of the page area covered by images (overlaps are not merged)"""
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page.rect
+        if not bbox.is_empty:
+            covered += abs(bbox)
+    return min(1.0, covered / page_area)
+
+def page_drawing_coverage(page):
+    """Fraction of the page area covered by vector drawings (overlaps are not merged)"""
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    covered = 0.0
+    for drawing in page.get_drawings():
+        bbox = fitz.Rect(drawing["rect"]) & page.rect
+        if not bbox.is_empty:
+            covered += abs(bbox)
+    return min(1.0, covered / page_area)
+
+def classify_page(session, page_num):
+    """
+    Decide whether a page needs OCR.
+    Returns (needs_ocr, text_layer) so the text layer is read only once.
+    """
+    page = session.page(page_num)
+    text_layer = page.get_text()
+    glyphs = len(text_layer) - sum(1 for ch in text_layer if ch.isspace())
+    image_coverage = page_image_coverage(page)
+    if image_coverage >= OCR_IMAGE_COVERAGE:
+        return True, text_layer
+    if glyphs >= MIN_PAGE_GLYPHS:
+        return False, text_layer
+    # Little text: OCR only if something is drawn or pictured on the page.
+    # Drawings are only read when the images alone fall short.
+    if image_coverage >= OCR_MIN_GRAPHICS_COVERAGE:
+        return True, text_layer
+    return image_coverage + page_drawing_coverage(page) >= OCR_MIN_GRAPHICS_COVERAGE, text_layer
+
+def extract_text_with_triage(pdf_source, workers=None):
+    """
+    Extract text page by page with PyMuPDF, OCRing only the pages
+    whose text layer is missing or mostly image. OCR output replaces
+    the text layer for those pages, keeping the --- Page N --- format.
+    Returns None if PyMuPDF cannot read the document.
+    """
     try:
-        doc = fitz.open(pdf_path)
-        image_count = 0
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            image_list = page.get_images(full=True)
+        with document_session(pdf_source) as session:
+            page_texts = []
+            ocr_page_numbers = []
+            with session.stage("triage"):
+                for page_num in range(len(session)):
+                    needs_ocr, text_layer = classify_page(session, page_num)
+                    page_texts.append(text_layer)
+                    if needs_ocr:
+                        ocr_page_numbers.append(page_num)
+            
+            print(f"✓ Page triage: {len(session) - len(ocr_page_numbers)} text pages, "
+                  f"{len(ocr_page_numbers)} pages need OCR")
             
-            for img_index, img in enumerate(image_list):
-                try:
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    img_pil = Image.open(io.BytesIO(image_bytes))
-                    
-                    # Perform OCR on the image
-                    image_text = ocr_image(img_pil)
-                    if image_text.strip():
-                        images_text += f"\n--- Image {image_count + 1} (Page {page_num + 1}) ---\n{image_text}\n"
-                        image_count += 1
-                        print(f"✓ OCR completed for image {image_count}: {len(image_text)} characters")
-                
-                except Exception as e:
-                    print(f"⚠ Failed to process image {img_index} on page {page_num + 1}: {e}")
+            if ocr_page_numbers:
+                ocr_texts = ocr_pages(session, ocr_page_numbers, workers)
+                for page_num, ocr_text in zip(ocr_page_numbers, ocr_texts):
+                    # Keep whatever text layer there was if OCR produced nothing
+                    if ocr_text.strip():
+                        page_texts[page_num] = format_ocr_page(page_num, ocr_text)
         
-        return images_text
+        return "".join(page_texts)
+    except Exception as e:
+        print(f"⚠ PyMuPDF page triage failed: {e}")
+        return None
+
+# Embedded images narrower or shorter than this many pixels (bullets,
+# rules, decorative icons) are not worth an OCR call
+MIN_IMAGE_SIZE = int(os.getenv("AGS_MIN_IMAGE_SIZE", "32"))
+
+def extract_images_from_pdf(pdf_source, with_stats=False):
+    """
+    Extract images from PDF and perform OCR on them.
+    With with_stats=True returns (text, stats) where stats counts the
+    OCR calls made and skipped (see ocr_embedded_images).
+    """
+    images_text = ""
+    stats = {}
+    try:
+        with document_session(pdf_source) as session, session.stage("image_ocr"):
+            images_text, stats = ocr_embedded_images(session)
     except Exception as e:
         print(f"✗ Image extraction failed: {e}")
-        return ""
-    finally:
-        if doc:
-            doc.close()
+        images_text = ""
+    return (images_text, stats) if with_stats else images_text
+
+def ocr_embedded_images(session):
+    """
+    OCR the embedded images of a DocumentSession.
+    Each image is OCRed at most once: repeated xrefs (a logo on every
+    page) and repeated content (the same picture embedded twice) are
+    skipped, as are images smaller than MIN_IMAGE_SIZE.
+    Returns (images_text, stats).
+    """
+    image_texts = []
+    for page_num in range(len(session)):
+        image_texts.extend(ocr_page_images(session, page_num))
+    return "".join(image_texts), dict(session.image_stats)
+
+def ocr_page_images(session, page_num):
+    """
+    OCR the images on one page that the session has not seen yet.
+    Returns the formatted image texts; counters go to session.image_stats.
+    """
+    image_texts = []
+    stats = session.image_stats
+    
+    for img_index, img in enumerate(session.page_images(page_num)):
+        stats['images_seen'] += 1
+        try:
+            xref, width, height = img[0], img[2], img[3]
+            if xref in session.seen_image_xrefs:
+                stats['skipped_duplicate_xref'] += 1
+                continue
+            session.seen_image_xrefs.add(xref)
+            
+            if width < MIN_IMAGE_SIZE or height < MIN_IMAGE_SIZE:
+                stats['skipped_small'] += 1
+                continue
+            
+            base_image = session.doc.extract_image(xref)
+            image_bytes = base_image["image"]
+            image_hash = content_hash(image_bytes)
+            if image_hash in session.image_ocr_memo:
+                stats['skipped_duplicate_content'] += 1
+                continue
+            
+            # Perform OCR on the image
+            img_pil = Image.open(io.BytesIO(image_bytes))
+            image_text = ocr_image(img_pil)
+            stats['ocr_calls'] += 1
+            session.image_ocr_memo[image_hash] = image_text
+            if image_text.strip():
+                session.image_count += 1
+                image_texts.append(f"\n--- Image {session.image_count} (Page {page_num + 1}) ---\n{image_text}\n")
+                print(f"✓ OCR completed for image {session.image_count}: {len(image_text)} characters")
+        
+        except Exception as e:
+            print(f"⚠ Failed to process image {img_index} on page {page_num + 1}: {e}")
+    
+    return image_texts
 
 def clean_text(text):
     """Clean and normalize extracted text"""
@@ -239,7 +744,11 @@ def tokenize_sentence(sentence):
         tokens = re.findall(r'\b\w+\b', sentence)
         return tokens
 
-def preprocess_text(text):
+# Preprocessor used by preprocess_text: "nltk" (punkt sentences, then the
+# Treebank word tokenizer per sentence) or "fast" (fast_preprocess_chunk)
+PREPROCESSOR = os.getenv("AGS_PREPROCESSOR", "nltk")
+
+def preprocess_text(text, preprocessor=None):
     """
     Complete text preprocessing pipeline:
     1. Clean text
@@ -251,6 +760,21 @@ def preprocess_text(text):
         return ""
     
     print("🔄 Preprocessing text...")
+    final_text = preprocess_chunk(text, preprocessor)
+    print(f"✓ Text preprocessing complete: {len(final_text)} characters")
+    return final_text
+
+def preprocess_chunk(text, preprocessor=None):
+    """
+    preprocess_text without progress output, for page-sized chunks.
+    Sentences are tokenized and joined one at a time so token lists for
+    the whole text are never held at once.
+    """
+    if not text:
+        return ""
+    
+    if (preprocessor or PREPROCESSOR) == "fast":
+        return fast_preprocess_chunk(text)
     
     # Clean the text
     cleaned_text = clean_text(text)
@@ -258,107 +782,274 @@ def preprocess_text(text):
     # Segment into sentences
     sentences = segment_sentences(cleaned_text)
     
-    # Tokenize each sentence
-    tokenized_sentences = []
-    for sentence in sentences:
-        if sentence.strip():  # Skip empty sentences
-            tokens = tokenize_sentence(sentence)
-            tokenized_sentences.append(tokens)
+    # Tokenize each sentence and convert back to text format
+    # (preserving sentence structure)
+    return "\n".join(" ".join(tokenize_sentence(sentence))
+                     for sentence in sentences if sentence.strip())
+
+# Fast preprocessor: the NLTK Treebank word-tokenizer rules as precompiled
+# patterns, run once over the whole text (one sentence per line) instead of
+# per sentence, with a regex sentence splitter standing in for punkt.
+# The tokens match NLTK's; the sentence splits only approximate punkt's
+# trained heuristics. Like punkt, "?" and "!" always end a sentence, while
+# a period after a number ("2. Calculate", "the answer is 4."), an
+# abbreviation or initial, or an ellipsis does not. Unlike punkt, a period
+# followed by a lowercase word never ends one.
+_ABBREVIATIONS = ["Mr", "Mrs", "Ms", "Dr", "Prof", "Sr", "Jr", "St", "vs", "etc",
+                  "Fig", "fig", "Eq", "eq", "No", "e.g", "i.e", "approx", "[A-Z]"]
+_FAST_SENTENCE_BOUNDARY = re.compile(
+    "".join(rf"(?<!\b{abbreviation})" for abbreviation in _ABBREVIATIONS)
+    + r"""((?:(?<![.\d])\.(?=["')\]]* +["'(\[]?[A-Z0-9])|[?!]+)["')\]]*) +"""
+)
+
+# Applied before lines are padded with spaces (start/end anchors matter)
+_FAST_WORD_RULES = [(re.compile(pattern, re.MULTILINE), replacement) for pattern, replacement in [
+    # Starting quotes
+    (r"([`]+)", r" \1 "),
+    (r'^"', r"``"),
+    (r"(``)", r" \1 "),
+    (r"""([ (\[{<])("|'{2})""", r"\1 `` "),
+    (r"(?i)(')(?!re|ve|ll|m|t|s|d|n)(\w)\b", r"\1 \2"),
+    # Punctuation
+    (r"([:,])([^\d])", r" \1 \2"),
+    (r"([:,])$", r" \1 "),
+    (r"\.{2,}", r" \g<0> "),
+    (r"[;@#$%&]", r" \g<0> "),
+    (r"""([^.])(\.)([\])}>"']*)[ ]*$""", r"\1 \2\3 "),  # final period of a sentence
+    (r"[?!]", r" \g<0> "),
+    (r"([^'])' ", r"\1 ' "),
+    (r"[*]", r" \g<0> "),
+    # Parentheses and double dashes
+    (r"[\]\[(){}<>]", r" \g<0> "),
+    (r"--", r" -- "),
+]]
+
+# Applied after every line is padded with a space on both sides
+_FAST_PADDED_RULES = [(re.compile(pattern), replacement) for pattern, replacement in [
+    # Ending quotes
+    (r"''", " '' "),
+    (r'"', " '' "),
+    (r"([^' ])('[sS]|'[mM]|'[dD]|') ", r"\1 \2 "),
+    (r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) ", r"\1 \2 "),
+    # Contractions (Robert MacIntyre's list, as used by NLTK)
+    (r"(?i)\b(can)(not)\b", r" \1 \2 "),
+    (r"(?i)\b(d)('ye)\b", r" \1 \2 "),
+    (r"(?i)\b(gim)(me)\b", r" \1 \2 "),
+    (r"(?i)\b(gon)(na)\b", r" \1 \2 "),
+    (r"(?i)\b(got)(ta)\b", r" \1 \2 "),
+    (r"(?i)\b(lem)(me)\b", r" \1 \2 "),
+    (r"(?i)\b(more)('n)\b", r" \1 \2 "),
+    (r"(?i)\b(wan)(na)(?=\s)", r" \1 \2 "),
+    (r"(?i) ('t)(is)\b", r" \1 \2 "),
+    (r"(?i) ('t)(was)\b", r" \1 \2 "),
+]]
+
+def fast_preprocess_chunk(text):
+    """
+    Regex-only approximation of the NLTK preprocessing path: one sentence
+    per line, tokens separated by single spaces. Sentence splits can
+    differ from punkt's (see _FAST_SENTENCE_BOUNDARY).
+    """
+    cleaned_text = clean_text(text)
+    if not cleaned_text:
+        return ""
     
-    # Convert back to text format (preserving sentence structure)
-    final_text = "\n".join([" ".join(tokens) for tokens in tokenized_sentences])
+    text = _FAST_SENTENCE_BOUNDARY.sub("\\1\n", cleaned_text)
+    for pattern, replacement in _FAST_WORD_RULES:
+        text = pattern.sub(replacement, text)
     
-    print(f"✓ Text preprocessing complete: {len(final_text)} characters")
-    return final_text
+    text = " " + text.replace("\n", " \n ") + " "
+    for pattern, replacement in _FAST_PADDED_RULES:
+        text = pattern.sub(replacement, text)
+    
+    return "\n".join(" ".join(line.split()) for line in text.split("\n") if not line.isspace())
 
-def convert_pdf_to_txt(pdf_path):
+EXTRACTION_FAILED_MESSAGE = ("Failed to extract any readable text from the PDF. "
+                             "Please ensure the PDF contains text or clear images.")
+
+def convert_pdf_to_txt(pdf_source, with_source=False, with_stats=False):
     """
     Main function: Convert PDF to cleaned, processed text.
     This is the function called by Flask app.
+    `pdf_source` is a file path or the PDF bytes; bytes are processed
+    entirely in memory. With `with_source`, returns (processed_text,
+    source_text): source_text is the extracted text before preprocessing,
+    with the line breaks and question numbers per-question grading splits
+    on (None if nothing could be extracted). With `with_stats`, the image
+    OCR stats (see ocr_embedded_images; empty if PyMuPDF could not open
+    the PDF) are appended: (processed_text, [source_text,] stats).
     """
-    print(f"🔄 Processing PDF: {pdf_path}")
-    
-    # Step 1: Extract text using standard methods
-    text = extract_text_from_pdf(pdf_path)
-    
-    # Step 2: If no text found, try OCR on the entire document
-    if not text or len(text.strip()) < 100:  # If very little text extracted
-        print("📄 Low text content detected, trying OCR...")
-        ocr_text = handle_scanned_pdf(pdf_path)
-        if ocr_text:
-            text = ocr_text
+    if is_pdf_bytes(pdf_source):
+        pdf_source = as_pdf_bytes(pdf_source)
+        print(f"🔄 Processing in-memory PDF: {len(pdf_source)} bytes")
+    else:
+        print(f"🔄 Processing PDF: {pdf_source}")
     
-    # Step 3: Extract text from images within the PDF
-    images_text = extract_images_from_pdf(pdf_path)
-    if images_text:
-        text += f"\n\n--- EXTRACTED FROM IMAGES ---\n{images_text}"
+    # Open the document once; every stage below shares this session
+    try:
+        session = DocumentSession(pdf_source)
+    except Exception as e:
+        print(f"⚠ PyMuPDF could not open the PDF: {e}")
+        session = None
     
-    # Step 4: If still no text, return error message
-    if not text or not text.strip():
-        error_msg = "Failed to extract any readable text from the PDF. Please ensure the PDF contains text or clear images."
-        print(f"✗ {error_msg}")
-        return error_msg
+    def result(processed_text, source_text):
+        stats = dict(session.image_stats) if session else {}
+        values = (processed_text,) + ((source_text,) if with_source else ()) + ((stats,) if with_stats else ())
+        return values if len(values) > 1 else processed_text
     
-    # Step 5: Preprocess the extracted text
-    processed_text = preprocess_text(text)
+    try:
+        text = None
+        if session:
+            # Step 1: Read each page's text layer, OCRing only the pages that need it
+            text = extract_text_with_triage(session)
+        
+        # Step 2: If PyMuPDF found nothing, fall back to PDFMiner and Tika
+        if not text or not text.strip():
+            print("📄 No text from page triage, trying other extractors...")
+            if session:
+                with session.stage("fallback_extractors"):
+                    text = extract_text_from_pdf(session) or ""
+            else:
+                text = extract_text_from_pdf(pdf_source) or ""
+        
+        # Step 3: Extract text from images within the PDF
+        if session:
+            images_text = extract_images_from_pdf(session)
+            if images_text:
+                text += f"\n\n--- EXTRACTED FROM IMAGES ---\n{images_text}"
+        
+        # Step 4: If still no text, return error message
+        if not text or not text.strip():
+            print(f"✗ {EXTRACTION_FAILED_MESSAGE}")
+            return result(EXTRACTION_FAILED_MESSAGE, None)
+        
+        # Step 5: Preprocess the extracted text
+        if session:
+            with session.stage("preprocess"):
+                processed_text = preprocess_text(text)
+        else:
+            processed_text = preprocess_text(text)
+        
+        print(f"✅ PDF processing complete: {len(processed_text)} characters extracted")
+        return result(processed_text, text)
+    finally:
+        if session:
+            session.report_timings()
+            session.report_image_stats()
+            session.close()
+
+def iter_pdf_text(pdf_source, workers=None):
+    """
+    Streaming variant of convert_pdf_to_txt.
+    Yields cleaned, preprocessed text one page at a time (the page's
+    text layer or OCR, followed by OCR of its not-yet-seen images),
+    releasing each page before moving on, so memory stays flat however
+    long the document is. Falls back to PDFMiner/Tika as one chunk when
+    PyMuPDF cannot read the document.
+    """
+    try:
+        session = DocumentSession(pdf_source)
+    except Exception as e:
+        print(f"⚠ PyMuPDF could not open the PDF: {e}")
+        text = extract_text_from_pdf(pdf_source)
+        if text and text.strip():
+            yield preprocess_chunk(text)
+        return
     
-    print(f"✅ PDF processing complete: {len(processed_text)} characters extracted")
-    return processed_text
+    try:
+        for page_num in range(len(session)):
+            with session.stage("triage"):
+                needs_ocr, page_text = classify_page(session, page_num)
+            if needs_ocr:
+                ocr_text = ocr_pages(session, [page_num], workers)[0]
+                if ocr_text.strip():
+                    page_text = format_ocr_page(page_num, ocr_text)
+            
+            with session.stage("image_ocr"):
+                image_texts = ocr_page_images(session, page_num)
+            if image_texts:
+                page_text += "\n" + "".join(image_texts)
+            
+            session.release_page(page_num)
+            with session.stage("preprocess"):
+                processed = preprocess_chunk(page_text)
+            if processed:
+                yield processed
+    finally:
+        session.report_timings()
+        session.report_image_stats()
+        session.close()
 
-def extract_text_for_flask(pdf_file_object):
+def extract_text_for_flask(pdf_file_object, with_source=False):
     """
     Special function for Flask file uploads.
-    Handles file objects instead of file paths.
+    Handles file objects instead of file paths. The upload is read once
+    and extracted from memory; nothing is written to disk. With
+    `with_source`, returns (processed_text, source_text) as
+    convert_pdf_to_txt does. Image OCR counts are logged and recorded in
+    the ags_image_ocr_total metric by the extraction (cache hits OCR nothing).
     """
-    import tempfile
-    import time
-    
-    temp_file_path = None
     try:
-        # Create a temporary file with a unique name
-        temp_fd, temp_file_path = tempfile.mkstemp(suffix='.pdf', prefix='ags_upload_')
-        
-        # Close the file descriptor immediately to avoid locking issues
-        os.close(temp_fd)
-        
         # Reset file pointer to beginning
-        pdf_file_object.seek(0)
-        
-        # Write the uploaded file data to temporary location
-        with open(temp_file_path, 'wb') as temp_file:
-            temp_file.write(pdf_file_object.read())
+        with time_stage("upload_read"):
+            pdf_file_object.seek(0)
+            pdf_bytes = pdf_file_object.read()
         
         # Reset file pointer again for potential future use
         pdf_file_object.seek(0)
         
+        # Identical PDFs (re-uploaded answer keys, resubmissions) skip extraction
+        cache_key = extraction_cache_key(pdf_bytes)
+        with time_stage("extraction_cache_lookup"):
+            cached = extraction_cache.get(cache_key)
+            cached_source = extraction_cache.get(f"{cache_key}-source") if with_source else None
+        if cached is not None and (cached_source is not None or not with_source):
+            print(f"✓ Extraction cache hit: {cache_key[:20]}... ({len(cached)} characters)")
+            return (cached, cached_source) if with_source else cached
+        
         # Process the PDF
-        result = convert_pdf_to_txt(temp_file_path)
+        with time_stage("extract_total"):
+            result, source = convert_pdf_to_txt(pdf_bytes, with_source=True)
         
-        return result
+        # Only cache real extractions, not the "nothing readable" message
+        if result and result != EXTRACTION_FAILED_MESSAGE:
+            extraction_cache.set(cache_key, result)
+            extraction_cache.set(f"{cache_key}-source", source)
+        
+        return (result, source) if with_source else result
         
     except Exception as e:
         print(f"Error in extract_text_for_flask: {e}")
-        return None
-        
-    finally:
-        # Clean up temporary file with retry mechanism
-        if temp_file_path and os.path.exists(temp_file_path):
-            max_retries = 5
-            for attempt in range(max_retries):
-                try:
-                    os.unlink(temp_file_path)
-                    print(f"✓ Temporary file cleaned up: {temp_file_path}")
-                    break
-                except PermissionError:
-                    if attempt < max_retries - 1:
-                        print(f"⚠ File still locked, retrying in {0.5 * (attempt + 1)} seconds...")
-                        time.sleep(0.5 * (attempt + 1))
-                    else:
-                        print(f"⚠ Could not delete temporary file: {temp_file_path}")
-                        print("  → File will be cleaned up automatically by the system")
-                except Exception as e:
-                    print(f"⚠ Error cleaning up temporary file: {e}")
-                    break
+        return (None, None) if with_source else None
+
+def warm_up(ocr_pool=False):
+    """
+    Load every extraction backend now instead of on the first upload.
+    Call this once at server boot. With ocr_pool=True the OCR process
+    pool is started too. Returns the seconds spent per step.
+    """
+    timings = {}
+    
+    def step(name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            print(f"⚠ Warm-up step '{name}' failed: {e}")
+        timings[name] = time.perf_counter() - start
+    
+    print("🔥 Warming up text extraction backends...")
+    for name, module in [("fitz", fitz), ("pdfminer", pdfminer_high_level),
+                         ("tika", tika_parser), ("pytesseract", pytesseract),
+                         ("pillow", Image), ("nltk", nltk_tokenize)]:
+        step(name, lambda module=module: module.__name__)
+    step("tesseract", configure_tesseract)
+    step("nltk_data", lambda: preprocess_chunk("Warm up the tokenizers. They load lazily."))
+    if ocr_pool and OCR_WORKERS > 1:
+        step("ocr_pool", lambda: get_ocr_pool(OCR_WORKERS))
+    
+    print(f"✓ Text extraction ready in {sum(timings.values()):.2f}s")
+    return timings
 
 # Command line interface (for testing)
 if __name__ == "__main__":